@@ -0,0 +1,116 @@
+"""Бенчмарк рассылки notification_for против локального Bot API с ограничениями частоты.
+
+Для каждого размера создаётся временная база с пользователями (bench_db.seed), после чего рассылка всем
+пользователям идёт через настоящий notification_for в RateLimitedTelegramServer: общий лимит сообщений в секунду,
+одно сообщение в секунду в чат, ответы 429 с retry_after, случайная задержка и доля заблокировавших бота.
+Отчёт: время рассылки, фактическая скорость, повторы после 429 и записи в БД из-за заблокировавших бота.
+
+С лимитом Telegram по умолчанию (30 сообщений в секунду) рассылка на 100 тыс. получателей занимает около часа.
+Чтобы измерить накладные расходы бота на больших объёмах, лимит и задержку можно поднять/снизить.
+
+Запуск из корня репозитория (сеть не нужна):
+    python benchmarks/bench_broadcast.py [--sizes 1000 10000] [--rate 30] [--latency-ms 20] [--jitter-ms 60]
+                                         [--blocked 0.02] [--output bench_broadcast.json]
+    python benchmarks/bench_broadcast.py --sizes 100000 --rate 5000 --latency-ms 1 --jitter-ms 2
+"""
+import argparse
+import datetime
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_db import seed  # noqa: E402
+from fake_services import RateLimitedTelegramServer  # noqa: E402
+from src.utils.settings import Config  # noqa: E402
+
+
+def count_users(db_path, use_bot):
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute('SELECT COUNT(*) FROM setting_users WHERE use_bot = ?', (use_bot,)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def run(functions, metrics, telegram, db_path):
+    """Одна рассылка всем пользователям. Счётчики метрик накопительные, поэтому считается разница."""
+
+    telegram.calls.clear()
+    retries = metrics.telegram_retries.value('sendMessage')
+    writes = metrics.db_latency.count('WorkWithDb.change_user_settings')
+    recipients = count_users(db_path, 'True')
+
+    started = time.perf_counter()
+    functions.notification_for(focus_group='all', text_message='Бенчмарк рассылки')
+    elapsed = time.perf_counter() - started
+
+    delivered = telegram.calls['sendMessage']
+    return {
+        'recipients': recipients,
+        'delivered': delivered,
+        'blocked': telegram.calls['sendMessage:403'],
+        'rate_limited': telegram.calls['sendMessage:429'],
+        'retries': metrics.telegram_retries.value('sendMessage') - retries,
+        'db_writes': metrics.db_latency.count('WorkWithDb.change_user_settings') - writes,
+        'disabled_after': count_users(db_path, 'False'),
+        'seconds': elapsed,
+        'messages_per_sec': delivered / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='пользователей в базе')
+    parser.add_argument('--rate', type=float, default=30.0, help='лимит сообщений в секунду на бота')
+    parser.add_argument('--chat-interval', type=float, default=1.0, help='минимальный интервал сообщений в чат')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='минимальная задержка ответа API')
+    parser.add_argument('--jitter-ms', type=float, default=60.0, help='случайная добавка к задержке')
+    parser.add_argument('--blocked', type=float, default=0.02, help='доля заблокировавших бота')
+    parser.add_argument('--log-level', default='ERROR')
+    parser.add_argument('--output', default='bench_broadcast.json')
+    args = parser.parse_args()
+
+    telegram = RateLimitedTelegramServer(rate=args.rate, chat_interval=args.chat_interval,
+                                         latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                                         blocked=args.blocked).start()
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'rate': args.rate,
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'blocked_share': args.blocked,
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update({'BOT_TOKEN': '123456:BROADCAST', 'DEV_ID': '1'})
+        functions = importlib.import_module('src.utils.functions')
+        metrics = importlib.import_module('src.utils.metrics')
+        logging.getLogger().setLevel(args.log_level)
+        functions.telebot.apihelper.API_URL = telegram.api_url
+
+        print(f"{'пользователей':>14}{'получателей':>13}{'доставлено':>12}{'сек.':>9}{'сообщ./с':>10}"
+              f"{'429':>7}{'повторов':>10}{'блок.':>7}{'записей БД':>12}")
+        for users in args.sizes:
+            # Модули бота берут базу из Config.DATABASE_URL при каждом обращении
+            db_path = Config.DATABASE_URL = os.path.join(directory, f'broadcast_{users}.db')
+            seed(db_path, users)
+            result = report['results'][str(users)] = run(functions, metrics, telegram, db_path)
+            print(f"{users:>14}{result['recipients']:>13}{result['delivered']:>12}{result['seconds']:>9.1f}"
+                  f"{result['messages_per_sec']:>10.1f}{result['rate_limited']:>7}{result['retries']:>10}"
+                  f"{result['blocked']:>7}{result['db_writes']:>12}")
+
+    telegram.stop()
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f'\nРезультаты сохранены в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
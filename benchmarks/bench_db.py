@@ -0,0 +1,173 @@
+"""Бенчмарк слоя данных WorkWithDb/StatisticsManager на реалистичных объёмах.
+
+Для каждого размера создаётся временная база: пользователи (через триггер появляются строки setting_users) и
+график дежурств на 10 лет, а рядом база статистики пользователей и функций. Затем измеряются методы, которые бот
+вызывает при обработке обновлений и рассылках. Каждый вызов выполняется как в боте: через новый экземпляр WorkWithDb.
+Результаты пишутся в JSON, чтобы сравнивать прогоны между коммитами.
+
+Запуск из корня репозитория (сеть не нужна):
+    python benchmarks/bench_db.py [--sizes 10000 100000 1000000] [--output bench_db.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.sql import WorkWithDb, StatisticsManager  # noqa: E402
+from src.utils.storage import SqliteStorage, connect, stats_location  # noqa: E402
+
+FUNCTIONS = [f'button_func_{number}' for number in range(40)]
+
+
+def seed(db_path, users):
+    """Заполняет базу: users (+ setting_users триггером), duty_schedule, а в базе статистики рядом с ней
+    user_statistics и function_statistics. db_path - путь к файлу или URI базы в памяти (storage.database_location)"""
+
+    SqliteStorage(db_path)  # Создаёт таблицы и триггер в основной базе и базе статистики
+
+    conn = connect(db_path)
+    with conn:
+        today = datetime.date.today().strftime('%d.%m.%Y')
+        conn.executemany('INSERT INTO users (user_id, user_first_name, user_last_name, username, date_registration) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         ((100000000 + number, f'Имя{number}', f'Фамилия{number}', f'user{number}', today)
+                          for number in range(users)))
+        # Доли подписчиков, отписавшихся и администраторов
+        conn.execute('UPDATE setting_users SET news = "True" WHERE user_id % 5 = 0')
+        conn.execute('UPDATE setting_users SET baraholka = "True" WHERE user_id % 10 = 0')
+        conn.execute('UPDATE setting_users SET use_bot = "False" WHERE user_id % 20 = 1')
+        conn.execute('UPDATE setting_users SET rights = "admin" WHERE user_id % 100 = 2')
+
+        # Еженедельные дежурства: 5 лет назад и 5 лет вперёд
+        start = datetime.date.today() - datetime.timedelta(weeks=52 * 5)
+        conn.executemany('INSERT INTO duty_schedule (first_date, last_date, user_first_name) VALUES (?, ?, ?)',
+                         ((str(start + datetime.timedelta(weeks=week)),
+                           str(start + datetime.timedelta(weeks=week, days=6)),
+                           f'Дежурный{week % 12}')
+                          for week in range(52 * 10)))
+    conn.close()
+
+    conn = connect(stats_location(db_path))
+    with conn:
+        conn.executemany('INSERT INTO user_statistics (user_id, today, month, all_time) VALUES (?, ?, ?, ?)',
+                         ((user_id, user_id % 7, user_id % 97, user_id % 997)
+                          for user_id in range(100000000, 100000000 + users)))
+        conn.executemany('INSERT INTO function_statistics (name, today, month, all_time) VALUES (?, ?, ?, ?)',
+                         ((name, number, number * 30, number * 365) for number, name in enumerate(FUNCTIONS)))
+    conn.close()
+
+
+def measure(func, iterations, budget):
+    """Вызывает func до iterations раз, но не дольше budget секунд"""
+
+    timings = []
+    deadline = time.perf_counter() + budget
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+        if started > deadline:
+            break
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'p95_ms': timings[int(len(timings) * 0.95)] * 1000,
+        'ops_per_sec': len(timings) / sum(timings),
+    }
+
+
+def operations(db_path, users):
+    def random_user():
+        return 100000000 + random.randrange(users)
+
+    return {
+        'check_for_existence': lambda: WorkWithDb(db_path).check_for_existence(random_user()),
+        'check_access_level_user': lambda: WorkWithDb(db_path).check_access_level_user(random_user()),
+        'get_list_users_id[all]': lambda: WorkWithDb(db_path).get_list_users_id('all'),
+        'get_list_users_id[news]': lambda: WorkWithDb(db_path).get_list_users_id('news'),
+        'get_list_users_id[baraholka]': lambda: WorkWithDb(db_path).get_list_users_id('baraholka'),
+        'get_users_page[first]': lambda: WorkWithDb(db_path).get_users_page(),
+        'get_users_page[after]': lambda: WorkWithDb(db_path).get_users_page(after=random_user()),
+        'get_users_page[before]': lambda: WorkWithDb(db_path).get_users_page(before=random_user()),
+        'search_users[name]': lambda: WorkWithDb(db_path).search_users(f'Имя{random.randrange(users)}'),
+        'search_users[prefix]': lambda: WorkWithDb(db_path).search_users(f'фам {random.randrange(10)}'),
+        'search_users[username]': lambda: WorkWithDb(db_path).search_users(f'@user{random.randrange(users)}'),
+        'get_user_counts': lambda: WorkWithDb(db_path).get_user_counts(),
+        'get_data_next_dej': lambda: WorkWithDb(db_path).get_data_next_dej(),
+        'get_data_list_dej': lambda: WorkWithDb(db_path).get_data_list_dej(),
+        'collect_statistical_user': lambda: StatisticsManager(SqliteStorage(db_path)).collect_statistical_user(
+            random_user()),
+        'collect_statistical_func': lambda: StatisticsManager(SqliteStorage(db_path)).collect_statistical_func(
+            random.choice(FUNCTIONS)),
+        'get_top_func_stat_day': lambda: StatisticsManager(SqliteStorage(db_path)).get_top_func_stat_day(),
+        'change_user_status_news': lambda: WorkWithDb(db_path).change_user_status_news(random_user()),
+        'change_user_status_bar': lambda: WorkWithDb(db_path).change_user_status_bar(random_user()),
+        'change_user_right': lambda: WorkWithDb(db_path).change_user_right(random_user()),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--iterations', type=int, default=500, help='максимум вызовов на операцию')
+    parser.add_argument('--budget', type=float, default=5.0, help='максимум секунд на операцию')
+    parser.add_argument('--output', default='bench_db.json')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = {
+        'commit': git_commit(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'iterations': args.iterations,
+        'results': {},
+    }
+
+    for users in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'bench.db')
+            started = time.perf_counter()
+            seed(db_path, users)
+            result = {
+                'seed_seconds': time.perf_counter() - started,
+                'db_size_bytes': os.path.getsize(db_path) + os.path.getsize(stats_location(db_path)),
+                'operations': {},
+            }
+            print(f'\n{users} пользователей: база {result["db_size_bytes"] / 2 ** 20:.1f} МБ, '
+                  f'заполнение {result["seed_seconds"]:.1f} сек.')
+            print(f"{'операция':<32}{'вызовов':>8}{'среднее мс':>12}{'p50 мс':>10}{'p95 мс':>10}{'оп/с':>10}")
+            for name, func in operations(db_path, users).items():
+                stats = result['operations'][name] = measure(func, args.iterations, args.budget)
+                print(f"{name:<32}{stats['calls']:>8}{stats['mean_ms']:>12.3f}{stats['p50_ms']:>10.3f}"
+                      f"{stats['p95_ms']:>10.3f}{stats['ops_per_sec']:>10.0f}")
+            report['results'][str(users)] = result
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f'\nРезультаты сохранены в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Бенчмарк выгрузки пользователей и статистики (DataExport) на разных объёмах.
+
+Для каждого размера создаётся временная база (bench_db.seed) и выполняется выгрузка в ZIP с CSV, а если установлен
+openpyxl - и в XLSX. Отчёт: время, размер файла и пик выделенной Python памяти (tracemalloc, отдельным прогоном).
+Пик памяти не должен расти вместе с числом пользователей: строки пишутся в файл по мере чтения.
+
+Запуск из корня репозитория (сеть не нужна):
+    python benchmarks/bench_export.py [--sizes 10000 100000 1000000] [--output bench_export.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_db import seed  # noqa: E402
+from src.utils import export  # noqa: E402
+from src.utils.storage import SqliteStorage  # noqa: E402
+
+
+def measure(data_export, file_format):
+    """Время и размер файла измеряются отдельно от пика памяти: tracemalloc в разы замедляет выделение памяти"""
+
+    started = time.perf_counter()
+    with data_export.export(file_format) as (path, counts):
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(path)
+
+    tracemalloc.start()
+    with data_export.export(file_format):
+        peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'rows': sum(counts.values()),
+        'seconds': elapsed,
+        'file_bytes': size,
+        'peak_memory_bytes': peak,
+        'rows_per_sec': sum(counts.values()) / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--batch-size', type=int, default=1000, help='строк в одной порции чтения')
+    parser.add_argument('--output', default='bench_export.json')
+    args = parser.parse_args()
+
+    formats = ['csv'] + (['xlsx'] if export.openpyxl is not None else [])
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'batch_size': args.batch_size,
+        'results': {},
+    }
+
+    print(f"{'пользователей':>14}{'формат':>8}{'строк':>10}{'сек.':>8}{'строк/с':>10}{'файл МБ':>9}"
+          f"{'пик памяти МБ':>15}")
+    for users in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'export.db')
+            seed(db_path, users)
+            data_export = export.DataExport(SqliteStorage(db_path), batch_size=args.batch_size)
+            results = report['results'][str(users)] = {}
+            for file_format in formats:
+                result = results[file_format] = measure(data_export, file_format)
+                print(f"{users:>14}{file_format:>8}{result['rows']:>10}{result['seconds']:>8.1f}"
+                      f"{result['rows_per_sec']:>10.0f}{result['file_bytes'] / 2 ** 20:>9.1f}"
+                      f"{result['peak_memory_bytes'] / 2 ** 20:>15.2f}")
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f'\nРезультаты сохранены в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
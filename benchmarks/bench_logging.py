@@ -0,0 +1,113 @@
+"""Накладные расходы логирования на одно обновление.
+
+Сравнивает прежнюю схему (синхронные хендлеры консоли и файла, f-строки) с очередью из setup_logger (QueueHandler +
+QueueListener, ленивое форматирование, обрезка длинных записей). Измеряется время в потоке обработчика, то есть
+задержка, которую логирование добавляет к ответу пользователю.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_logging.py [--updates 20000]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.logger_setup import setup_logger, shutdown_logger  # noqa: E402
+
+USER_ID = 123456789
+PARAMS = {'request': 'get_info_door', 'user_id': USER_ID}
+ERP_ANSWER = {'event_%d' % i: {'name': 'Сотрудник %d' % i, 'time': '2024-01-01 08:00:00', 'door': 'in'}
+              for i in range(200)}
+
+
+def update_eager(logger):
+    """Записи одного обновления в прежнем виде: строки формируются всегда, даже для DEBUG"""
+
+    logger.debug(f"Incrementing statistics for user_id: {USER_ID}")
+    logger.info(f"Права доступа для пользователя {USER_ID} получены: admin.")
+    logger.info(f"Отправка GET-запроса: http://erp/hs/bot, параметры: {PARAMS}")
+    logger.info(f"Разбор ответа от ERP: {ERP_ANSWER}")
+    logger.debug(f"Function statistics updated for: button_dej_1")
+    logger.info(f'Текст отправлен пользователю: "Ближайшее дежурство"')
+
+
+def update_lazy(logger):
+    """Те же записи с ленивым форматированием, ответ 1С пишется на уровне DEBUG"""
+
+    logger.debug("Incrementing statistics for user_id: %s", USER_ID)
+    logger.info("Права доступа для пользователя %s получены: %s.", USER_ID, 'admin')
+    logger.info("Отправка GET-запроса: %s, параметры: %s", 'http://erp/hs/bot', PARAMS)
+    logger.debug("Разбор ответа от ERP: %s", ERP_ANSWER)
+    logger.debug("Function statistics updated for: %s", 'button_dej_1')
+    logger.info('Текст отправлен пользователю: "%s"', 'Ближайшее дежурство')
+
+
+def legacy_logger(directory):
+    logger = logging.getLogger('bench.legacy')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter("%(asctime)s - [%(levelname)s] - %(name)s - %(message)s")
+    for handler in (logging.StreamHandler(open(os.devnull, 'w', encoding='utf-8')),
+                    RotatingFileHandler(os.path.join(directory, 'legacy.log'), maxBytes=5 * 1024 * 1024,
+                                        backupCount=3, encoding='utf-8')):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
+
+
+def queued_logger(directory):
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w', encoding='utf-8')  # Консольный хендлер пишет в sys.stderr
+    try:
+        setup_logger(log_file=os.path.join(directory, 'queued.log'), level=logging.INFO)
+    finally:
+        sys.stderr = stderr
+    return logging.getLogger('bench.queued')
+
+
+def measure(update, logger, updates):
+    timings = []
+    for _ in range(updates):
+        started = time.perf_counter()
+        update(logger)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'p50_us': timings[len(timings) // 2] * 1e6,
+        'p99_us': timings[int(len(timings) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy = legacy_logger(directory)
+        queued = queued_logger(directory)
+        results = {
+            'синхронно, f-строки': measure(update_eager, legacy, args.updates),
+            'синхронно, ленивое': measure(update_lazy, legacy, args.updates),
+            'очередь, f-строки': measure(update_eager, queued, args.updates),
+            'очередь, ленивое': measure(update_lazy, queued, args.updates),
+        }
+        shutdown_logger()
+        for handler in legacy.handlers:
+            handler.close()
+
+    print(f'Обновлений: {args.updates}, время логирования в потоке обработчика (мкс на обновление)')
+    print(f"{'схема':<24}{'среднее':>10}{'p50':>10}{'p99':>10}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['mean_us']:>10.1f}{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
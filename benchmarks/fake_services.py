@@ -0,0 +1,211 @@
+"""Локальные заглушки внешних сервисов для нагрузочных тестов: Telegram Bot API и HTTP-сервисы 1С.
+
+Использование:
+    telegram = FakeTelegramServer(latency=0.02).start()
+    apihelper.API_URL = telegram.api_url
+    ...
+    telegram.stop()
+"""
+import collections
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive: telebot и requests переиспользуют соединения
+    disable_nagle_algorithm = True  # иначе заголовки и тело ответа ждут ACK и каждый запрос длится ~40 мс
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            params.update((key, values[-1]) for key, values in parse_qs(body.decode('utf-8')).items())
+
+        status, payload, headers = self.server.service.handle(url.path, params, body)
+        if isinstance(payload, (dict, list, bool)):
+            payload = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            headers = {'Content-Type': 'application/json', **headers}
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeService:
+    """Базовый HTTP-сервис в отдельном потоке. Наследники переопределяют handle()."""
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.service = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def handle(self, path, params, body):
+        """Возвращает (HTTP-статус, тело: dict/list/bool для JSON или bytes, заголовки)"""
+
+        raise NotImplementedError
+
+
+class FakeTelegramServer(FakeService):
+    """Минимальный Bot API: отвечает успехом на любой метод, для отправки сообщений возвращает объект Message"""
+
+    _MESSAGE_METHODS = {'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'sendDocument', 'sendPhoto'}
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        super().__init__(latency, host, port)
+        self._message_ids = itertools.count(1)
+
+    @property
+    def api_url(self):
+        """Шаблон для telebot.apihelper.API_URL"""
+
+        return self.url + '/bot{0}/{1}'
+
+    def handle(self, path, params, body):
+        method = path.rsplit('/', 1)[-1]
+        self.count(method)
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(method, params)
+
+    def respond(self, method, params):
+        if method in self._MESSAGE_METHODS:
+            return 200, {'ok': True, 'result': self.message(params)}, {}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'LoadTest',
+                                                'username': 'load_test_bot'}}, {}
+        return 200, {'ok': True, 'result': True}, {}
+
+    def message(self, params):
+        chat_id = int(params.get('chat_id') or 0)
+        return {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+
+class RateLimitedTelegramServer(FakeTelegramServer):
+    """Bot API с ограничениями, как у настоящего Telegram при рассылках:
+    - не больше rate сообщений в секунду на бота и одного сообщения в секунду в один чат, сверх лимита ответ
+      429 Too Many Requests с parameters.retry_after в целых секундах;
+    - задержка ответа случайна в пределах [latency, latency + jitter];
+    - доля blocked получателей заблокировала бота: ответ 403 "bot was blocked by the user".
+    Отклонённые запросы учитываются в calls как '<метод>:429' и '<метод>:403'."""
+
+    def __init__(self, rate=30.0, chat_interval=1.0, latency=0.0, jitter=0.0, blocked=0.0, host='127.0.0.1',
+                 port=0):
+        super().__init__(latency, host, port)
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.jitter = jitter
+        self.blocked = blocked
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._last_sent = {}
+        self._limit_lock = threading.Lock()
+
+    def is_blocked(self, chat_id):
+        """Заблокировал ли получатель бота. Не зависит от порядка запросов, поэтому одинаково между прогонами."""
+
+        return zlib.crc32(str(chat_id).encode()) % 10000 < self.blocked * 10000
+
+    def handle(self, path, params, body):
+        method = path.rsplit('/', 1)[-1]
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.random() * self.jitter)
+        if method not in self._MESSAGE_METHODS:
+            self.count(method)
+            return self.respond(method, params)
+
+        chat_id = int(params.get('chat_id') or 0)
+        retry_after = self._acquire(chat_id)
+        if retry_after:
+            self.count(f'{method}:429')
+            return 429, {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {retry_after}',
+                         'parameters': {'retry_after': retry_after}}, {}
+        if self.is_blocked(chat_id):
+            self.count(f'{method}:403')
+            return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}, {}
+        self.count(method)
+        return self.respond(method, params)
+
+    def _acquire(self, chat_id):
+        """Списывает токен общего лимита и отмечает отправку в чат. Возвращает 0 или retry_after в секундах."""
+
+        with self._limit_lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0
+            if self._tokens < 1:
+                wait = (1 - self._tokens) / self.rate
+            last_sent = self._last_sent.get(chat_id)
+            if last_sent is not None and now - last_sent < self.chat_interval:
+                wait = max(wait, self.chat_interval - (now - last_sent))
+            if wait:
+                return max(1, math.ceil(wait))
+            self._tokens -= 1
+            self._last_sent[chat_id] = now
+            return 0
+
+
+class FakeErpServer(FakeService):
+    """Заглушка HTTP-сервисов 1С: на любой запрос отвечает JSON с ключом успешной регистрации события"""
+
+    def __init__(self, event_key, latency=0.0, host='127.0.0.1', port=0):
+        super().__init__(latency, host, port)
+        self.event_key = event_key
+
+    def handle(self, path, params, body):
+        self.count(path)
+        if self.latency:
+            time.sleep(self.latency)
+        if path.endswith('.apk'):
+            return 200, b'\0' * 1024, {'Content-Type': 'application/octet-stream'}
+        return 200, {self.event_key: True}, {}
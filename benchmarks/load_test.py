@@ -0,0 +1,295 @@
+"""Нагрузочный тест обработки обновлений: синтетические CallbackQuery и Message проходят через настоящие
+обработчики бота (bot.process_new_updates -> callback_inline -> router), Telegram Bot API и 1С заменены
+локальными заглушками, база данных временная (файл или, с --database :memory:, в памяти).
+
+Сценарии:
+    menu          переходы по меню и функции меню, доступные уровню пользователя
+    command       команда /menu
+    calendar      внесение дежурства администратором: календарь, две даты, выбор дежурного
+    event         ответы на события простоя (кнопки 1С event_<id>_<тип>)
+    registration  регистрация нового пользователя
+
+Запуск из корня репозитория (сеть не нужна):
+    python benchmarks/load_test.py [--updates 5000] [--concurrency 8] [--api-latency-ms 30]
+                                   [--mix menu=50,command=15,calendar=10,event=20,registration=5]
+                                   [--database :memory:] [--output load_test.json]
+"""
+import argparse
+import collections
+import datetime
+import importlib
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_db import seed  # noqa: E402
+from fake_services import FakeTelegramServer, FakeErpServer  # noqa: E402
+from src.utils.settings import Config  # noqa: E402
+from src.utils.storage import connect, database_location  # noqa: E402
+
+DEFAULT_MIX = 'menu=50,command=15,calendar=10,event=20,registration=5'
+EVENT_KEY = 'event_registered'
+
+# Общие для прогрева и замера счётчики: идентификаторы и даты дежурств не должны повторяться
+_update_ids = itertools.count(1)
+_new_users = itertools.count(900000000)
+_events = itertools.count(1)
+_duty_weeks = itertools.count(1)
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+    return mix
+
+
+def percentile(values, share):
+    return values[min(int(len(values) * share), len(values) - 1)] * 1000 if values else 0.0
+
+
+class LoadTest:
+    def __init__(self, bot_module, functions_module, users, admins):
+        self.main = bot_module
+        self.functions = functions_module
+        self.users = users
+        self.admins = admins
+        self._busy = set()  # Пользователи, чей многошаговый сценарий выполняется в другом потоке
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.error_samples = {}
+        self._lock = threading.Lock()
+
+        graph = bot_module.menu_form.menu_graph
+        routable = [node for node in graph.nodes if node.url is None and not node.hidden]
+        self.menu_callbacks = {
+            'user': [node.callback for node in routable if node.allows('user')],
+            'admin': [node.callback for node in routable if node.allows('admin')],
+        }
+
+    # Построение обновлений в формате Bot API
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'Имя{user_id}', 'last_name': f'Фамилия{user_id}',
+                'username': f'user{user_id}', 'language_code': 'ru'}
+
+    def _message(self, user_id, text, reply_markup=None):
+        message = {'message_id': random.randrange(1, 10 ** 6), 'date': int(time.time()),
+                   'chat': {'id': user_id, 'type': 'private'}, 'from': self._user(user_id), 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        if reply_markup is not None:
+            message['reply_markup'] = reply_markup
+        return message
+
+    def callback(self, user_id, data, text='Меню', reply_markup=None):
+        update_id = next(_update_ids)
+        return self.main.telebot.types.Update.de_json({
+            'update_id': update_id,
+            'callback_query': {'id': str(update_id), 'from': self._user(user_id), 'chat_instance': str(user_id),
+                               'data': data, 'message': self._message(user_id, text, reply_markup)},
+        })
+
+    def command(self, user_id, text):
+        return self.main.telebot.types.Update.de_json({'update_id': next(_update_ids),
+                                                       'message': self._message(user_id, text)})
+
+    # Сценарии: каждый возвращает последовательность обновлений одного пользователя
+    def scenario_menu(self):
+        admin = random.random() < 0.1
+        user_id = random.choice(self.admins if admin else self.users)
+        callbacks = self.menu_callbacks['admin' if admin else 'user']
+        return [self.callback(user_id, random.choice(callbacks)) for _ in range(random.randint(1, 3))]
+
+    def scenario_command(self):
+        return [self.command(random.choice(self.users), '/menu')]
+
+    def scenario_calendar(self):
+        user_id = self._acquire(self.admins)
+        # Каждый сценарий берёт свою неделю, чтобы не упираться в уникальность дат дежурства
+        first = datetime.date.today() + datetime.timedelta(weeks=52 * 10 + next(_duty_weeks))
+        last = first + datetime.timedelta(days=6)
+        new = self.main.calendar_callback.new
+        return [
+            self.callback(user_id, 'button_ins_dej'),
+            self.callback(user_id, new('DAY', first.year, first.month, first.day), text='Календарь'),
+            self.callback(user_id, new('DAY', last.year, last.month, last.day), text='Календарь'),
+            self.callback(user_id, 'name_Павел', text='Кто будет дежурить в указанный период?'),
+        ]
+
+    def scenario_event(self):
+        user_id = random.choice(self.users)
+        event_id = next(_events)
+        event_types = {'repair': 'Ремонт', 'no_material': 'Нет материала', 'other': 'Другое'}
+        buttons = [[{'text': label, 'callback_data': f'event_{event_id}_{code}'}]
+                   for code, label in event_types.items()]
+        data = random.choice(buttons)[0]['callback_data']
+        return [self.callback(user_id, data, text='Простой станка', reply_markup={'inline_keyboard': buttons})]
+
+    def scenario_registration(self):
+        return [self.callback(next(_new_users), 'button_registration', text='Добро пожаловать')]
+
+    def _acquire(self, candidates):
+        """Выбирает пользователя, у которого сейчас нет незавершённого многошагового сценария"""
+
+        while True:
+            user_id = random.choice(candidates)
+            with self._lock:
+                if user_id not in self._busy:
+                    self._busy.add(user_id)
+                    return user_id
+
+    # Выполнение
+    def run_flow(self, name):
+        updates = getattr(self, f'scenario_{name}')()
+        try:
+            self._process(name, updates)
+        finally:
+            with self._lock:
+                self._busy.discard(updates[0].callback_query.from_user.id if updates[0].callback_query else None)
+
+    def _process(self, name, updates):
+        for update in updates:
+            started = time.perf_counter()
+            try:
+                self.main.bot.process_new_updates([update])
+            except Exception as error:
+                with self._lock:
+                    self.errors[name] += 1
+                    self.error_samples.setdefault(f'{type(error).__name__}: {error}', name)
+            duration = time.perf_counter() - started
+            with self._lock:
+                self.latencies[name].append(duration)
+
+    def run(self, mix, updates, concurrency):
+        names, weights = zip(*mix.items())
+        done = itertools.count()
+
+        def worker():
+            while next(done) < updates:
+                self.run_flow(random.choices(names, weights)[0])
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(concurrency)]:
+                future.result()
+
+
+SCENARIOS = ('menu', 'command', 'calendar', 'event', 'registration')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=5000, help='количество сценариев (каждый из 1-4 обновлений)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--database', help='DATABASE_URL, например :memory: (по умолчанию временный файл)')
+    parser.add_argument('--api-latency-ms', type=float, default=30.0, help='задержка ответа Telegram API')
+    parser.add_argument('--erp-latency-ms', type=float, default=50.0, help='задержка ответа 1С')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--log-level', default='ERROR')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args()
+
+    telegram = FakeTelegramServer(latency=args.api_latency_ms / 1000).start()
+    erp = FakeErpServer(EVENT_KEY, latency=args.erp_latency_ms / 1000).start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'load_test.db')
+        os.environ.update({
+            'BOT_TOKEN': '123456:LOAD-TEST',
+            'DEV_ID': '1',
+            'WAY_ERP_GET': erp.url + '/hs/bot/get',
+            'WAY_ERP_POST': erp.url + '/hs/bot/post',
+            'EVENT_HANDLING_KEY': EVENT_KEY,
+            'EVENT_HANDLING_VALUE': 'load-test',
+            'BIRD_AUTH_KEY': 'bird',
+            'URL_APP_REMIT_EMPLOYEE': erp.url + '/app.apk',
+            'LOG_FILE': os.path.join(directory, 'bot.log'),
+        })
+
+        db_path = Config.DATABASE_URL = database_location(args.database or db_path)
+        seed(db_path, args.users)
+
+        bot_module = importlib.import_module('src.__main__')
+        functions_module = importlib.import_module('src.utils.functions')
+        logging.getLogger().setLevel(args.log_level)
+        bot_module.telebot.apihelper.API_URL = telegram.api_url
+        for bot in (bot_module.bot, functions_module.bot):
+            bot.threaded = False  # Обработчики выполняются в потоке нагрузки, чтобы измерить задержку
+
+        with connect(db_path) as conn:
+            users = [row[0] for row in conn.execute('SELECT user_id FROM setting_users WHERE rights = "user"')]
+            admins = [row[0] for row in conn.execute('SELECT user_id FROM setting_users WHERE rights = "admin"')]
+        conn.close()
+
+        test = LoadTest(bot_module, functions_module, users, admins)
+        test.run(args.mix, args.warmup, args.concurrency)
+        test = LoadTest(bot_module, functions_module, users, admins)
+        telegram.calls.clear()
+        erp.calls.clear()
+
+        started = time.perf_counter()
+        test.run(args.mix, args.updates, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+    telegram.stop()
+    erp.stop()
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'concurrency': args.concurrency,
+        'users': args.users,
+        'api_latency_ms': args.api_latency_ms,
+        'erp_latency_ms': args.erp_latency_ms,
+        'elapsed_seconds': elapsed,
+        'scenarios': {},
+        'telegram_calls': dict(telegram.calls),
+        'erp_calls': sum(erp.calls.values()),
+        'error_samples': test.error_samples,
+    }
+    print(f'Параллельность {args.concurrency}, пользователей {args.users}, задержка API {args.api_latency_ms} мс, '
+          f'1С {args.erp_latency_ms} мс, время {elapsed:.1f} сек.')
+    print(f"{'сценарий':<14}{'обновлений':>11}{'обн/с':>9}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'ошибок':>9}")
+    everything = sorted(itertools.chain.from_iterable(test.latencies.values()))
+    for name, values in sorted(test.latencies.items()) + [('всего', everything)]:
+        values = sorted(values)
+        errors = sum(test.errors.values()) if name == 'всего' else test.errors[name]
+        stats = {
+            'updates': len(values),
+            'updates_per_sec': len(values) / elapsed,
+            'p50_ms': percentile(values, 0.50),
+            'p95_ms': percentile(values, 0.95),
+            'p99_ms': percentile(values, 0.99),
+            'errors': errors,
+            'error_rate': errors / len(values) if values else 0.0,
+        }
+        report['scenarios'][name] = stats
+        print(f"{name:<14}{stats['updates']:>11}{stats['updates_per_sec']:>9.1f}{stats['p50_ms']:>9.1f}"
+              f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['error_rate']:>9.1%}")
+    total_calls = sum(telegram.calls.values())
+    print(f'Запросов к Telegram API: {total_calls} ({total_calls / max(len(everything), 1):.2f} на обновление), '
+          f'к 1С: {report["erp_calls"]}')
+    for message, name in test.error_samples.items():
+        print(f'  [{name}] {message}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f'Результаты сохранены в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
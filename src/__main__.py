@@ -1,24 +1,33 @@
 import asyncio
 import datetime
-import inspect
 import json
 import logging
 import os
-import threading
 import time
 
 import dotenv
 import requests
-import schedule
 import telebot
 from telebot import types
 from telebot_calendar import Calendar, CallbackData
 
 import src.utils.menu_formation as menu_form
-from src.utils.functions import unknown_user, user_data, show_calendar, ask_for_name, finalize_event, \
-    post_answer_of_event, schedule_next_run, update_data_door, create_top_chart_func
-from src.utils.logger_setup import setup_logger
+import src.utils.metrics as metrics
+import src.utils.sql_trace as sql_trace
+from src.utils.callback_registry import callback_registry
+from src.utils.error_reporting import error_reporter
+from src.utils.export import DataExport, TELEGRAM_DOCUMENT_LIMIT
+from src.utils.functions import unknown_user, user_data, show_calendar, ask_for_name, \
+    finalize_event, post_answer_of_event, update_data_door, door_poll_trigger, create_top_chart_func, notif_of_hero, \
+    notification_of_dej_tomorrow, users_page, find_users
+from src.utils.leader import LeaderElection
+from src.utils.logger_setup import setup_logger, log_context
+from src.utils.maintenance import DatabaseMaintenance
+from src.utils.profiling import UpdateProfiler
+from src.utils.router import CallbackRouter, rate_limit
+from src.utils.scheduler import JobScheduler, DailyTrigger, RandomDailyTrigger, MonthlyTrigger
 from src.utils.sql import WorkWithDb, StatisticsManager
+from src.utils.storage import default_storage, sqlite_databases
 
 dotenv.load_dotenv()
 bot_token = os.getenv('BOT_TOKEN')
@@ -26,19 +35,19 @@ if not bot_token:
     raise ValueError("BOT_TOKEN is missing in environment variables")
 bot = telebot.TeleBot(bot_token)
 dev_id = os.getenv('DEV_ID')
+metrics.instrument_telegram_api()
 
 # Инициализация календаря
 calendar = Calendar()
 calendar_callback = CallbackData("calendar", "action", "year", "month", "day")
 
-logger = setup_logger(log_file="bot.log", level=logging.INFO)
+# Профилирование медленных callback-запросов (включается переменными PROFILE_*)
+profiler = UpdateProfiler.from_env()
 
-# Add a single console handler if no handlers are present
-if not logger.handlers:
-    console_handler = logging.StreamHandler()
-    console_formatter = logging.Formatter("%(asctime)s - [%(levelname)s] - %(message)s")
-    console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
+# Резервные копии и обслуживание баз (переменные BACKUP_*, DB_VACUUM_THRESHOLD)
+maintenance = DatabaseMaintenance.from_env(sqlite_databases())
+
+logger = setup_logger(level=logging.INFO)
 
 
 def answer_bot(message, text_answer, keyboard=None, format_text='no'):
@@ -46,7 +55,7 @@ def answer_bot(message, text_answer, keyboard=None, format_text='no'):
 
     user_id = message.forward_from.id if message.forward_from else message.from_user.id
     count_text_message = len(text_answer) * 0.01
-    logger.debug(f"Расчёт времени набора текста: {count_text_message} секунд")
+    logger.debug("Расчёт времени набора текста: %s секунд", count_text_message)
 
     bot.send_chat_action(chat_id=user_id, action='typing')
     time.sleep(count_text_message)
@@ -56,7 +65,7 @@ def answer_bot(message, text_answer, keyboard=None, format_text='no'):
     else:
         bot.send_message(chat_id=user_id, text=text_answer, reply_markup=keyboard)
 
-    logger.info(f'Текст отправлен пользователю: "{text_answer}"')
+    logger.info('Текст отправлен пользователю: "%s"', text_answer)
 
 
 @bot.message_handler(commands=['start'])
@@ -75,7 +84,7 @@ def start_command(message):
                      f'• Username: @{message.from_user.username}\n')
 
     bot.send_message(message.chat.id, hello_message, reply_markup=markup)
-    logger.info(f"Сообщение приветствия отправлено: {message.from_user.first_name} (ID: {message.from_user.id})")
+    logger.info("Сообщение приветствия отправлено: %s (ID: %s)", message.from_user.first_name, message.from_user.id)
 
 
 # Обработчик команды /menu
@@ -90,82 +99,159 @@ def send_welcome(message):
         user_access_level = WorkWithDb().check_access_level_user(user_id=user_id)
         markup = menu_form.create_markup("main_menu", user_access_level)
         if markup:
-            bot.send_message(user_id, menu_form.menu_storage["main_menu"]["text"], reply_markup=markup)
-            logger.info(f"Главное меню открыто для пользователя: {user_id}")
+            bot.send_message(user_id, menu_form.menu_graph.home.text, reply_markup=markup)
+            logger.info("Главное меню открыто для пользователя: %s", user_id)
     # else:
     #     bot.send_message(user_id, text=answer[0], reply_markup=answer[1])
     #     logger.warning(f"Доступ к меню ограничен для пользователя: {user_id}")
 
 
+@bot.message_handler(commands=['slow'])
+def show_slow_handlers(message):
+    """Самые медленные из недавно обработанных callback-запросов (только для администраторов)"""
+
+    if WorkWithDb().check_access_level_user(user_id=message.from_user.id) != 'admin':
+        return
+    if profiler is None:
+        bot.reply_to(message, 'Профилирование выключено. Задайте PROFILE_SAMPLE_RATE или PROFILE_SLOW_THRESHOLD.')
+        return
+
+    records = profiler.slowest(limit=10)
+    if not records:
+        bot.reply_to(message, 'Обработанных запросов пока нет.')
+        return
+    lines = ['Самые медленные обработчики:']
+    for number, (elapsed, route, user_id, finished, path) in enumerate(records, start=1):
+        report = f', профиль {os.path.basename(path)}' if path else ''
+        lines.append(f"{number}. {route} — {elapsed:.3f} сек. (user {user_id}, {finished.strftime('%d.%m %H:%M:%S')}"
+                     f"{report})")
+    bot.reply_to(message, '\n'.join(lines))
+
+
+@bot.message_handler(commands=['sqlstats'])
+def show_sql_stats(message):
+    """Сводка SQL-запросов по суммарному времени (только для администраторов). /sqlstats reset обнуляет её."""
+
+    if WorkWithDb().check_access_level_user(user_id=message.from_user.id) != 'admin':
+        return
+    if not sql_trace.enabled:
+        bot.reply_to(message, 'Трассировка SQL выключена. Задайте SQL_TRACE=True.')
+        return
+    if message.text.split()[1:] == ['reset']:
+        sql_trace.sql_tracer.reset()
+        bot.reply_to(message, 'Статистика SQL-запросов обнулена.')
+        return
+    bot.reply_to(message, sql_trace.sql_tracer.summary()[:4096])
+
+
+@bot.message_handler(commands=['dbstats'])
+def show_db_stats(message):
+    """Размер баз, свободные страницы, WAL и резервные копии (только для администраторов)"""
+
+    if WorkWithDb().check_access_level_user(user_id=message.from_user.id) != 'admin':
+        return
+    bot.reply_to(message, maintenance.summary()[:4096])
+
+
+@bot.message_handler(commands=['export'])
+def export_data(message):
+    """Выгрузка пользователей, настроек и статистики документом (только для администраторов).
+    /export - ZIP-архив с CSV, /export xlsx - книга Excel."""
+
+    if WorkWithDb().check_access_level_user(user_id=message.from_user.id) != 'admin':
+        return
+    file_format = 'xlsx' if message.text.split()[1:] == ['xlsx'] else 'csv'
+    bot.send_chat_action(chat_id=message.chat.id, action='upload_document')
+    try:
+        with DataExport().export(file_format) as (path, counts):
+            if os.path.getsize(path) > TELEGRAM_DOCUMENT_LIMIT:
+                bot.reply_to(message, 'Выгрузка больше 50 МБ, Telegram не позволит её отправить.')
+                return
+            caption = '\n'.join(f'{table}: {count}' for table, count in counts.items())
+            with open(path, 'rb') as document:
+                bot.send_document(chat_id=message.chat.id, document=document,
+                                  visible_file_name=DataExport.file_name(file_format), caption=caption)
+        logger.info("Выгрузка %s отправлена пользователю %s", file_format, message.from_user.id)
+    except RuntimeError as error:
+        bot.reply_to(message, str(error))
+
+
+@bot.message_handler(commands=['find'])
+def find_user(message):
+    """Поиск пользователей по имени, фамилии, username или ID с кнопками изменения прав (только для
+    администраторов). /find Иван"""
+
+    if WorkWithDb().check_access_level_user(user_id=message.from_user.id) != 'admin':
+        return
+    query = message.text.split(maxsplit=1)[1:]
+    if not query:
+        bot.reply_to(message, 'Укажите имя, фамилию, username или ID пользователя: /find Иван')
+        return
+    result = find_users(query[0])
+    bot.send_message(message.chat.id, result['text'], reply_markup=result['keyboard'])
+
+
 @bot.message_handler(content_types=['text'])
 def talk(message):
+    # Большинство текстовых сообщений приходит без начатого диалога: сначала дешёвая проверка в памяти
+    state = user_data.get(message.from_user.id) if user_data.active(message.from_user.id) else None
+    if state and 'rights_search' in state:
+        # Запрос поиска после кнопок "Дать/Лишить пользователя прав админа"
+        user_data.pop(message.from_user.id)
+        if WorkWithDb().check_access_level_user(user_id=message.from_user.id) == 'admin':
+            result = find_users(message.text, rights=state['rights_search'])
+            bot.send_message(message.chat.id, result['text'], reply_markup=result['keyboard'])
+        return
     text_answer = 'Я пока не умею реагировать на текст. Доступные функции в /menu'
     bot.reply_to(message, text_answer)
 
 
-# Обработчик callback-запросов
-@bot.callback_query_handler(func=lambda call: True)
-def callback_inline(call):
-    """Обработчик Inline-запросов"""
+# Маршрутизатор callback-запросов
+router = CallbackRouter()
 
-    menu_key = call.data
-    menu = menu_form.menu_storage.get(menu_key)
 
-    if call.from_user and hasattr(call.from_user, 'id'):
-        user_id = call.from_user.id
-    else:
-        logger.error(f"Unable to determine user ID from call: {call}")
+@router.use
+def require_user(call, route, handler):
+    """Прерывает обработку, если из callback-запроса нельзя определить пользователя"""
+
+    if not (call.from_user and hasattr(call.from_user, 'id')):
+        logger.error("Unable to determine user ID from call: %s", call)
         bot.answer_callback_query(call.id, "Ошибка: данные пользователя не обнаружены.")
-        return
+        return None
+    return handler(call)
+
+
+if profiler is not None:
+    router.use(profiler.middleware)
+
+router.use(rate_limit(max_calls=20, period=10,
+                      on_reject=lambda call: bot.answer_callback_query(call.id, "Слишком много запросов, подождите "
+                                                                                "несколько секунд.")))
+
+
+@router.use
+def collect_statistics(call, route, handler):
+    """Счётчик активности пользователя"""
+
+    StatisticsManager().collect_statistical_user(user_id=call.from_user.id)
+    return handler(call)
+
 
-    # Счётчик активности пользователя
-    StatisticsManager().collect_statistical_user(user_id=user_id)
-
-    # # КАЛЕНДАРЬ
-    # if call.data.startswith(calendar_callback.prefix):
-    #     name, action, year, month, day = call.data.split(calendar_callback.sep)
-    #     date = calendar.calendar_query_handler(bot, call, name, action, year, month, day)
-    #
-    #     if action == "DAY":
-    #         date = date.date()
-    #         user_id = call.from_user.id
-    #         if user_id not in user_data:
-    #             user_data[user_id] = {}
-    #
-    #         if "first_date" not in user_data[user_id]:
-    #             if date < datetime.datetime.now().date():
-    #                 bot.send_message(call.message.chat.id,
-    #                                  "Вы выбрали прошедшую дату. Пожалуйста, выберите дату снова.")
-    #                 return
-    #             user_data[user_id]["first_date"] = date
-    #             show_calendar(chat_id=call.message.chat.id, title="Дежурство до какой даты (включительно)?")
-    #         else:
-    #             if date < user_data[user_id]["first_date"]:
-    #                 bot.send_message(call.message.chat.id,
-    #                                  "Конечная дата должна быть позже начальной. Пожалуйста, выберите дату снова.")
-    #                 return
-    #             user_data[user_id]["last_date"] = date
-    #             ask_for_name(call.message.chat.id)
-    #
-    #     elif action == "CANCEL":
-    #         user_id = call.from_user.id
-    #         bot.send_message(call.message.chat.id, "Операция отменена.")
-    #         if user_id in user_data:
-    #             del user_data[user_id]
-
-    # КАЛЕНДАРЬ
-    if call.data.startswith(calendar_callback.prefix):
-        name, action, year, month, day = call.data.split(calendar_callback.sep)
-        date = calendar.calendar_query_handler(bot, call, name, action, year, month, day)
-
-        if action == "DAY":
-            date = date.date()
-            user_id = call.from_user.id
-            if user_id not in user_data:
-                user_data[user_id] = {'calendar_mode': 'range'}  # По умолчанию режим диапазона
+# КАЛЕНДАРЬ
+@router.prefix(calendar_callback.prefix)
+def handle_calendar(call):
+    name, action, year, month, day = call.data.split(calendar_callback.sep)
+    date = calendar.calendar_query_handler(bot, call, name, action, year, month, day)
+    user_id = call.from_user.id
+
+    if action == "DAY":
+        date = date.date()
+        with user_data.lock(user_id):
+            # По умолчанию режим диапазона
+            state = user_data.get(user_id) or {'calendar_mode': 'range'}
 
             # Получаем текущий режим работы календаря (если был установлен)
-            calendar_mode = user_data[user_id].get('calendar_mode', 'range')
+            calendar_mode = state.get('calendar_mode', 'range')
 
             if calendar_mode == 'range':
                 # Обработка выбора диапазона дат (старая логика)
@@ -174,104 +260,146 @@ def callback_inline(call):
                                      "Вы выбрали прошедшую дату. Пожалуйста, выберите дату снова.")
                     return
 
-                if "first_date" not in user_data[user_id]:
-                    user_data[user_id]["first_date"] = date
+                if "first_date" not in state:
+                    user_data.update(user_id, calendar_mode=calendar_mode, first_date=date)
                     show_calendar(chat_id=call.message.chat.id,
                                   title="Дежурство до какой даты (включительно)?",
                                   select_range=True)
                 else:
-                    if date < user_data[user_id]["first_date"]:
+                    if date < state["first_date"]:
                         bot.send_message(call.message.chat.id,
                                          "Конечная дата должна быть позже начальной. Пожалуйста, выберите дату снова.")
                         return
-                    user_data[user_id]["last_date"] = date
+                    user_data.update(user_id, last_date=date)
                     ask_for_name(call.message.chat.id)
             else:
                 # Обработка выбора одной даты (новая логика)
-                user_data[user_id]["selected_date"] = date
-                # Здесь можно вызвать функцию-обработчик для одиночной даты
-                if 'date_handler' in user_data[user_id]:
-                    user_data[user_id]['date_handler'](call.message.chat.id, date)
-                else:
-                    bot.send_message(call.message.chat.id, f"Выбрана дата: {date.strftime('%d.%m.%Y')}")
+                bot.send_message(call.message.chat.id, f"Выбрана дата: {date.strftime('%d.%m.%Y')}")
                 # Очищаем данные после использования
-                del user_data[user_id]
-
-        elif action == "CANCEL":
-            user_id = call.from_user.id
-            bot.send_message(call.message.chat.id, "Операция отменена.")
-            if user_id in user_data:
-                del user_data[user_id]
-
-    # Обработка выбора имени
-    elif call.data.startswith("name_"):
-        user_id = call.from_user.id
-        name = call.data.split("_")[1]
-        user_data[user_id]["name"] = name
-        bot.delete_message(call.message.chat.id, call.message.message_id)
-        finalize_event(call.message.chat.id, user_id)
-    elif call.data == "CANCEL":
-        user_id = call.from_user.id
-        bot.delete_message(call.message.chat.id, call.message.message_id)
+                user_data.pop(user_id)
+
+    elif action == "CANCEL":
         bot.send_message(call.message.chat.id, "Операция отменена.")
-        if user_id in user_data:
-            del user_data[user_id]
-    elif call.data == "DELETE":
-        user_id = call.from_user.id
-        bot.delete_message(call.message.chat.id, call.message.message_id)
-    elif call.data.startswith("event_"):  # События простоя
-        user_id = call.from_user.id
-        data = call.data.split('_')
-        event_id = data[1]  # Извлекаем идентификатор события
-        entered_type = data[2]  # Извлекаем выбранный тип простоя
-        logger.debug(f"Entered type received: {entered_type}")
-        text_message = call.message.text
-
-        name_entered_button = ''
-
-        dict_button = call.message.json.get('reply_markup', {}).get('inline_keyboard', [])
-        # print(dict_button)
-        for list_buttons in dict_button:
-            # print(list_buttons)
-            for buttons in list_buttons:
-                # print(buttons)
-                name_button = buttons.get('text')
-                callback = buttons.get('callback_data')
-                if entered_type in callback:
-                    logger.debug(f"Entered type ({entered_type}) matched in callback ({callback})")
-                    name_entered_button = name_button
-
-        # Создаем словарь с данными
-        response_data = {
-            "event_id": event_id,
-            "entered_type": name_entered_button
-        }
-
-        result = f'{text_message}\n{name_entered_button}'
-        answer_erp = post_answer_of_event(response_data)
-        logger.debug(f"ERP response received: {answer_erp}")
-        # Если отправка response_data в 1С успешна, то выполнить следующий шаг
-        if answer_erp is True:
-            bot.edit_message_text(chat_id=user_id, message_id=call.message.message_id, text=result)
-            return
-        # Иначе выполнить:
-        else:
-            bot.answer_callback_query(call.id, "Ошибка: не удалось отправить данные в 1С. Попробуйте позже.")
-            return
+        user_data.pop(user_id)
+
+
+# Обработка выбора имени
+@router.prefix("name_")
+def handle_name(call):
+    user_id = call.from_user.id
+    name = call.data.split("_")[1]
+    user_data.update(user_id, name=name)
+    bot.delete_message(call.message.chat.id, call.message.message_id)
+    finalize_event(call.message.chat.id, user_id)
+
+
+@router.route("CANCEL")
+def handle_cancel(call):
+    user_id = call.from_user.id
+    bot.delete_message(call.message.chat.id, call.message.message_id)
+    bot.send_message(call.message.chat.id, "Операция отменена.")
+    user_data.pop(user_id)
+
+
+@router.route("DELETE")
+def handle_delete(call):
+    bot.delete_message(call.message.chat.id, call.message.message_id)
+
+
+@router.prefix("event_")
+def handle_event(call):
+    """События простоя в формате event_<id>_<тип>, кнопки которых сформированы на стороне 1С.
+    Название кнопки в callback_data не передаётся, поэтому ищется в клавиатуре сообщения по точному совпадению."""
+
+    data = call.data.split('_')
+    event_id = data[1]  # Извлекаем идентификатор события
+    logger.debug("Entered type received: %s", data[2])
+
+    name_entered_button = ''
+    dict_button = call.message.json.get('reply_markup', {}).get('inline_keyboard', [])
+    for list_buttons in dict_button:
+        for buttons in list_buttons:
+            if buttons.get('callback_data') == call.data:
+                name_entered_button = buttons.get('text')
+                break
+
+    # Создаем словарь с данными
+    response_data = {
+        "event_id": event_id,
+        "entered_type": name_entered_button
+    }
+
+    result = f'{call.message.text}\n{name_entered_button}'
+    answer_erp = post_answer_of_event(response_data)
+    logger.debug("ERP response received: %s", answer_erp)
+    # Если отправка response_data в 1С успешна, то выполнить следующий шаг
+    if answer_erp is True:
+        bot.edit_message_text(chat_id=call.from_user.id, message_id=call.message.message_id, text=result)
+    # Иначе выполнить:
+    else:
+        bot.answer_callback_query(call.id, "Ошибка: не удалось отправить данные в 1С. Попробуйте позже.")
+
+
+@router.prefix("rt:")
+def handle_rights(call):
+    """Изменение прав пользователя кнопкой из результатов поиска (functions.find_users)"""
+
+    admin_id = call.from_user.id
+    if WorkWithDb().check_access_level_user(user_id=admin_id) != 'admin':
+        bot.answer_callback_query(call.id, "Недостаточно прав для этого действия.")
+        return
+    payload = callback_registry.decode(call.data, single_use=True)
+    if payload is None:
+        bot.answer_callback_query(call.id, "Кнопка устарела.")
+        return
+    if payload['user_id'] == admin_id and payload['rights'] != 'admin':
+        bot.answer_callback_query(call.id, "Нельзя лишить прав администратора самого себя.")
+        return
+
+    WorkWithDb().change_user_settings(column_name='rights', set_status=payload['rights'], user_id=payload['user_id'])
+    callback_registry.discard(call.data)
+    result = 'теперь администратор' if payload['rights'] == 'admin' else 'больше не администратор'
+    logger.warning("Пользователь %s изменил права %s на %s", admin_id, payload['user_id'], payload['rights'])
+    bot.answer_callback_query(call.id, f"{payload['name']} {result}.")
+    bot.send_message(call.message.chat.id, f"{payload['name']} (ID {payload['user_id']}) {result}.")
+
 
-    ###
+@router.prefix("users:")
+def handle_users_page(call):
+    """Листание списка пользователей: users:prev:<user_id> и users:next:<user_id>"""
 
-    # Если меню нет вернёт ошибку
-    if not menu:
-        bot.answer_callback_query(call.id, "Ошибка: меню не найдено.")
+    if WorkWithDb().check_access_level_user(user_id=call.from_user.id) != 'admin':
+        bot.answer_callback_query(call.id, "Недостаточно прав для этого действия.")
         return
+    _, direction, user_id = call.data.split(':')
+    cursor = {'after' if direction == 'next' else 'before': int(user_id)}
+    page = users_page(**cursor)
+    bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id, text=page['text'],
+                          reply_markup=page['keyboard'])
+
+
+def handle_menu(call):
+    """Переход по меню или выполнение функции узла menu_graph"""
+
+    user_id = call.from_user.id
+    node = menu_form.menu_graph.get(call.data)
+    user_access_level = None
+
+    # callback_data может прислать любой клиент, поэтому права проверяются заново, а не только при сборке
+    # клавиатуры. Точки входа (кнопка регистрации) доступны и незарегистрированным пользователям
+    if node.callback not in menu_form.menu_graph.entry_points:
+        user_access_level = WorkWithDb().check_access_level_user(user_id=user_id)
+        if not menu_form.menu_graph.permits(node, user_access_level):
+            bot.answer_callback_query(call.id, "Недостаточно прав для этого действия.")
+            return
 
     # Если это подменю с функцией
-    if "function" in menu:
+    if node.function is not None:
         try:
-            result = menu["function"](call)
+            with metrics.menu_function_latency.time(node.callback):
+                result = node.function(call)
         except Exception as error:
-            logger.exception(f"Error executing menu function {menu_key}: {error}")
+            logger.exception("Error executing menu function %s: %s", node.callback, error)
             bot.send_message(user_id, "Произошла ошибка при выполнении команды. Попробуйте снова.")
             return
         if isinstance(result, dict):
@@ -281,105 +409,130 @@ def callback_inline(call):
         else:
             bot.send_message(user_id, result)
         # Счётчик выполнения функций для сбора статистики
-        StatisticsManager().collect_statistical_func(name_func=menu_key)
-    # Если это переход на другое меню
-    elif "redirect" in menu:
-        user_access_level = WorkWithDb().check_access_level_user(user_id=user_id)
-        new_menu_key = menu["redirect"]
-        markup = menu_form.create_markup(new_menu_key, user_access_level)
-        if markup:
-            bot.edit_message_text(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                text=menu_form.menu_storage[new_menu_key]["text"],
-                reply_markup=markup
-            )
+        StatisticsManager().collect_statistical_func(name_func=node.callback)
     # Если это обычное меню
-    elif "buttons" in menu:
-        user_access_level = WorkWithDb().check_access_level_user(user_id=user_id)
-        markup = menu_form.create_markup(menu_key, user_access_level)
+    elif node.is_menu:
+        markup = menu_form.create_markup(node.callback, user_access_level)
         if markup:
             bot.edit_message_text(
                 chat_id=call.message.chat.id,
                 message_id=call.message.message_id,
-                text=menu["text"],
+                text=node.text,
                 reply_markup=markup
             )
 
 
-def job_every_month(func):
-    """Выполняет функцию если сегодня 1-е число месяца"""
+for menu_node in menu_form.menu_graph.nodes:
+    if menu_node.url is None:
+        router.add_route(menu_node.callback, handle_menu)
 
-    if datetime.datetime.today().day == 1:
-        func()
-        return
 
+@router.fallback
+def handle_unknown(call):
+    """Если меню нет вернёт ошибку"""
 
-#  Создаёт расписание с рандомным временем для выполнения регулярных задач
-schedule_next_run()
+    bot.answer_callback_query(call.id, "Ошибка: меню не найдено.")
 
-schedule.every().day.at('00:00').do(schedule_next_run)
-schedule.every().day.at('00:00').do(create_top_chart_func)
-schedule.every().day.at('00:00').do(StatisticsManager().reset_func_stat_day)
-schedule.every().day.at('00:00').do(job_every_month, StatisticsManager().reset_func_stat_month)
 
-# schedule.every().minute.do(update_data_door)
-schedule.every(10).seconds.do(update_data_door)
+# Обработчик callback-запросов
+@bot.callback_query_handler(func=lambda call: True)
+def callback_inline(call):
+    """Обработчик Inline-запросов"""
 
+    # id callback-запроса связывает все записи лога об обработке этого обновления
+    with log_context(update_id=call.id, user_id=call.from_user.id if call.from_user else None):
+        router.dispatch(call)
+
+
+# Регулярные задания. При запуске нескольких экземпляров бота их выполняет только ведущий процесс
+leader = LeaderElection(default_storage(), name='scheduler', ttl=float(os.getenv('LEADER_LEASE_TTL', 10)))
+scheduler = JobScheduler(storage=default_storage, leader=leader)
+# Уведомления пользователям после перезапуска не досылаются: с опозданием на несколько часов они уже не нужны
+scheduler.add_job('notif_of_hero', notif_of_hero, RandomDailyTrigger(6), catch_up=False)
+scheduler.add_job('notification_of_dej_tomorrow', notification_of_dej_tomorrow, RandomDailyTrigger(14, 17),
+                  catch_up=False)
+scheduler.add_job('create_top_chart_func', create_top_chart_func, DailyTrigger('00:00'), timeout=60)
+# Счётчики обнуляются через минуту, чтобы рейтинг за прошедшие сутки и месяц успел сформироваться
+scheduler.add_job('reset_func_stat_day', StatisticsManager().reset_func_stat_day, DailyTrigger('00:01'))
+scheduler.add_job('reset_func_stat_month', StatisticsManager().reset_func_stat_month, MonthlyTrigger(day=1, at='00:01'))
+scheduler.add_job('update_data_door', update_data_door, door_poll_trigger, catch_up=False, persist=False,
+                  timeout=30)
+# Обслуживание баз ночью, когда бот почти не используется
+scheduler.add_job('db_backup', maintenance.backup, DailyTrigger('03:00'), timeout=30 * 60)
+scheduler.add_job('db_checkpoint', maintenance.checkpoint, DailyTrigger('03:30'), catch_up=False, timeout=5 * 60)
+scheduler.add_job('db_optimize', maintenance.optimize, DailyTrigger('03:40'), catch_up=False, timeout=10 * 60)
+scheduler.add_job('db_vacuum', maintenance.vacuum, DailyTrigger('04:00'), catch_up=False, timeout=30 * 60)
+
+# Метрики очередей и состояния процесса
+metrics.registry.gauge('bot_update_queue_depth', 'Обновления Telegram в очереди на обработку',
+                       callback=lambda: bot.worker_pool.tasks.qsize() if getattr(bot, 'worker_pool', None) else 0)
+metrics.registry.gauge('bot_conversation_states', 'Активные многошаговые диалоги', callback=lambda: len(user_data))
+metrics.registry.gauge('bot_callback_registry_entries', 'Записи реестра данных inline-кнопок',
+                       callback=lambda: len(callback_registry))
+metrics.registry.gauge('bot_scheduler_queue_depth', 'Запуски заданий в очереди планировщика',
+                       callback=scheduler.queue_depth)
+metrics.registry.gauge('bot_scheduler_job', 'Статистика выполнения регулярных заданий', ['job', 'stat'],
+                       callback=lambda: {(name, stat): value
+                                         for name, job_stats in scheduler.stats().items()
+                                         for stat, value in job_stats.items() if isinstance(value, (int, float))})
+metrics.registry.gauge('bot_reported_errors', 'Исключения, учтённые в сводке ошибок', ['fingerprint'],
+                       callback=lambda: {(fingerprint,): count
+                                         for fingerprint, count in error_reporter.stats().items()})
+metrics.registry.gauge('bot_db_storage', 'Размер баз данных: страницы, свободные страницы и байты',
+                       ['database', 'stat'],
+                       callback=lambda: {(name, stat): value
+                                         for name, stats in maintenance.report().items()
+                                         for stat, value in stats.items() if isinstance(value, int)})
+metrics.registry.gauge('bot_is_leader', 'Процесс является ведущим для регулярных заданий',
+                       callback=lambda: int(leader.is_leader))
+
+
+def main():
+    """Запуск планировщика и основного цикла бота"""
+
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        metrics.start_metrics_server(int(metrics_port), host=os.getenv('METRICS_HOST', '127.0.0.1'))
+    error_reporter.start(lambda text: bot.send_message(chat_id=dev_id, text=text))
+    # Ведущий определяется до запуска планировщика: иначе пропущенные запуски разбираются, пока это ещё неизвестно,
+    # а получение аренды перечитывает расписание параллельно с потоком планировщика
+    leader.start()
+    scheduler.start()
 
-def run_scheduler():
     while True:
-        schedule.run_pending()
-        time.sleep(1)
-
-
-# Запуск планировщика в отдельном потоке
-scheduler_thread = threading.Thread(target=run_scheduler)
-scheduler_thread.daemon = True  # Поток завершится, если основной поток завершится
-scheduler_thread.start()
-
-while True:
-    try:
-        logger.debug("Запуск основного цикла бота...")
-        bot.polling(none_stop=True)
-    except KeyboardInterrupt:
-        shutdown_message = "Бот остановлен вручную (KeyboardInterrupt)."
-        logger.info(shutdown_message)
-        bot.send_message(chat_id=dev_id, text=shutdown_message)
-        break
-    except (requests.exceptions.ReadTimeout, requests.ConnectionError) as req_error:
-        logger.info(f"Сетевая ошибка обнаружена: {req_error}. Планируем повтор...")
-        time.sleep(5 if isinstance(req_error, requests.exceptions.ReadTimeout) else 60)
-    except asyncio.exceptions.TimeoutError as timeout_error:
-        logger.error(f"Ошибка: время ожидания истекло: {timeout_error}. Повтор через 10 секунд.")
-        time.sleep(10)
-    except telebot.apihelper.ApiTelegramException as error_telegram:
-        logger.error(f"Ошибка API Telegram {error_telegram}. Уведомление отправлено разработчику.")
-        bot.send_message(chat_id=dev_id, text=f"Критическая ошибка: {error_telegram}")
-        time.sleep(5)
-    except json.JSONDecodeError as json_error:
-        logger.error(f"Ошибка обработки JSON: {json_error}. Проверьте переданные данные.")
-        bot.send_message(chat_id=dev_id,
-                         text="Ошибка обработки данных JSON. Пожалуйста, проверьте корректность данных.",
-                         parse_mode="Markdown")
-        time.sleep(5)
-    except telebot.apihelper.ApiException as api_error:
-        logger.error(f"Исключение API Telegram: {api_error}. Повтор через 5 секунд.")
-        bot.send_message(chat_id=dev_id, text="Телеграм API не отвечает. Повторение через несколько секунд.",
-                         parse_mode="Markdown")
-        time.sleep(5)
-    except Exception as e:
-        frm = inspect.trace()[-1]
-        unique_error_id = f"Error_{int(time.time())}"  # Generate a unique ID for the error
-        logger.error(f"Непредвиденная ошибка [{unique_error_id}] - {e}", exc_info=e)
-        error_details = (
-            f"⛔️ *Критическая ошибка обнаружена!* ⛔️\n\n"
-            f"*Дата и время:* {datetime.datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
-            f"*Уникальный ID ошибки:* {unique_error_id}\n"
-            f"*Файл:* {frm.filename}\n"
-            f"*Строка:* {frm.lineno}\n"
-            f"*Ошибка:* `{e}`"
-        )
-        bot.send_message(chat_id=dev_id, text=error_details, parse_mode="Markdown")
-        logger.debug(f"Сообщение об ошибке отправлено разработчику (DEV_ID: {dev_id}).")
-        time.sleep(5)
+        try:
+            logger.debug("Запуск основного цикла бота...")
+            bot.polling(none_stop=True)
+        except KeyboardInterrupt:
+            shutdown_message = "Бот остановлен вручную (KeyboardInterrupt)."
+            logger.info(shutdown_message)
+            leader.stop()
+            error_reporter.stop()
+            bot.send_message(chat_id=dev_id, text=shutdown_message)
+            break
+        except (requests.exceptions.ReadTimeout, requests.ConnectionError) as req_error:
+            logger.info("Сетевая ошибка обнаружена: %s. Планируем повтор...", req_error)
+            time.sleep(5 if isinstance(req_error, requests.exceptions.ReadTimeout) else 60)
+        except asyncio.exceptions.TimeoutError as timeout_error:
+            logger.error("Ошибка: время ожидания истекло: %s. Повтор через 10 секунд.", timeout_error)
+            time.sleep(10)
+        except telebot.apihelper.ApiTelegramException as error_telegram:
+            logger.error("Ошибка API Telegram %s. Уведомление отправлено разработчику.", error_telegram)
+            error_reporter.report(error_telegram, where='polling')
+            time.sleep(5)
+        except json.JSONDecodeError as json_error:
+            logger.error("Ошибка обработки JSON: %s. Проверьте переданные данные.", json_error)
+            error_reporter.report(json_error, where='polling')
+            time.sleep(5)
+        except telebot.apihelper.ApiException as api_error:
+            logger.error("Исключение API Telegram: %s. Повтор через 5 секунд.", api_error)
+            error_reporter.report(api_error, where='polling')
+            time.sleep(5)
+        except Exception as e:
+            fingerprint = error_reporter.report(e, where='polling')
+            logger.error("Непредвиденная ошибка [%s] - %s", fingerprint, e, exc_info=e)
+            time.sleep(5)
+
+
+if __name__ == '__main__':
+    main()
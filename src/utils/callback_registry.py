@@ -0,0 +1,123 @@
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from src.utils.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+MAX_CALLBACK_BYTES = 64  # Ограничение Telegram на callback_data
+
+
+class CallbackRegistry:
+    """Серверный реестр данных inline-кнопок.
+
+    Вместо того чтобы упаковывать данные в callback_data (и упираться в лимит 64 байта), кнопка получает короткий
+    идентификатор вида "<kind>:<id>", а сами данные хранятся до истечения TTL. Если задано storage (функция,
+    возвращающая хранилище, например storage.default_storage), данные пишутся в таблицу callback_data: кнопки
+    работают после перезапуска бота и на любом из его экземпляров, а память процесса служит кэшем.
+
+    Одноразовые кнопки (например, изменение прав) читаются с single_use=True: тогда запись берётся из хранилища, а
+    не из кэша, и кнопку, уже использованную на другом экземпляре бота, нельзя нажать повторно.
+
+    Использование:
+    data = callback_registry.encode('rt', {'user_id': 42, 'rights': 'admin'}, ttl=3600)
+    markup.add(types.InlineKeyboardButton(text='Сделать админом', callback_data=data))
+    ...
+    payload = callback_registry.decode(call.data, single_use=True)  # None, если запись устарела
+    callback_registry.discard(call.data)
+    """
+
+    purge_interval = 60 * 60  # Как часто удалять устаревшие записи из хранилища, секунд
+    sweep_interval = 60  # Как часто удалять устаревшие записи из памяти, секунд
+
+    def __init__(self, ttl=7 * 24 * 60 * 60, max_size=100_000, storage=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.storage = storage
+        self._entries = OrderedDict()  # data -> (expires_at, payload), в порядке добавления
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self._swept_at = 0.0
+
+    def encode(self, kind, payload, ttl=None):
+        """Сохраняет payload и возвращает callback_data для кнопки"""
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._evict()
+            data = f'{kind}:{secrets.token_urlsafe(6)}'
+            while data in self._entries:
+                data = f'{kind}:{secrets.token_urlsafe(6)}'
+            if len(data.encode('utf-8')) > MAX_CALLBACK_BYTES:
+                raise ValueError(f'callback_data "{data}" длиннее {MAX_CALLBACK_BYTES} байт')
+            self._entries[data] = (expires_at, payload)
+        if self.storage is not None:
+            now = time.time()
+            storage = self.storage()
+            storage.put_callback(data, json.dumps(payload, ensure_ascii=False),
+                                 now + (self.ttl if ttl is None else ttl))
+            if now - self._purged_at > self.purge_interval:
+                self._purged_at = now
+                logger.debug("Удалено устаревших данных кнопок: %s", storage.purge_callbacks(now))
+        return data
+
+    def decode(self, data, single_use=False):
+        """Возвращает payload по callback_data или None, если запись не найдена или устарела.
+        single_use=True - прочитать запись из хранилища, чтобы учесть discard() на других экземплярах."""
+
+        entry = self._entries.get(data)
+        if entry is None or (single_use and self.storage is not None):
+            return self._load(data)
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            with self._lock:
+                self._entries.pop(data, None)
+            return None
+        return payload
+
+    def discard(self, data):
+        """Удаляет запись, например после того как кнопка была нажата"""
+
+        with self._lock:
+            self._entries.pop(data, None)
+        if self.storage is not None:
+            self.storage().delete_callback(data)
+
+    def _load(self, data):
+        """Читает запись, созданную другим экземпляром бота или до перезапуска, и кэширует её в памяти"""
+
+        if self.storage is None:
+            return None
+        row = self.storage().get_callback(data, time.time())
+        if row is None:
+            with self._lock:
+                self._entries.pop(data, None)
+            return None
+        payload, expires_at = row
+        payload = json.loads(payload)
+        with self._lock:
+            self._evict()
+            self._entries[data] = (time.monotonic() + expires_at - time.time(), payload)
+        return payload
+
+    def _evict(self):
+        """Удаляет устаревшие записи и самые старые записи сверх max_size. Вызывается под блокировкой.
+        У записей разный TTL, поэтому устаревшие ищутся по всему реестру, но не чаще раза в sweep_interval."""
+
+        now = time.monotonic()
+        if now - self._swept_at >= self.sweep_interval:
+            self._swept_at = now
+            for data in [data for data, (expires_at, _) in self._entries.items() if expires_at < now]:
+                del self._entries[data]
+        while len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+callback_registry = CallbackRegistry(storage=default_storage)
@@ -1,10 +1,8 @@
 import datetime
-import inspect
 import logging
 import os
-import dotenv
-import telebot
-from src.utils.logger_setup import setup_logger
+
+from src.utils.error_reporting import error_reporter
 
 
 def get_env_variable(key):
@@ -15,11 +13,7 @@ def get_env_variable(key):
     return value
 
 
-dotenv.load_dotenv()
-bot = telebot.TeleBot(get_env_variable('BOT_TOKEN'))
-dev_id = get_env_variable('DEV_ID')
-
-logger = setup_logger(log_file="bot.log", level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 
 def registration_of_keystrokes(func):
@@ -45,24 +39,14 @@ def registration_of_keystrokes(func):
 
 
 def error_handling(func):
-    """Send error details to developer and log them."""
+    """Log error details and report them to the developer through the error aggregator."""
 
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            frm = inspect.trace()[-1]
-            file_name, line_error = frm[1], frm[2]
-
-            error_message = (
-                f"Date and time: {datetime.datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
-                f"Function: {func.__name__}()\n"
-                f"File: {file_name}\n"
-                f"Line: {line_error}\n"
-                f"Error: {e}"
-            )
-            logger.error(error_message)
-            bot.send_message(chat_id=dev_id, text=error_message)
+            logger.error("Error in %s(): %s", func.__name__, e, exc_info=e)
+            error_reporter.report(e, where=f'{func.__name__}()')
 
     return wrapper
 
@@ -72,6 +56,6 @@ def error_handler(func):
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            logger.error(f"Error in {func.__name__}: {e}")
-            bot.send_message(dev_id, f"Ошибка в {func.__name__}: {e}")
+            logger.error("Error in %s: %s", func.__name__, e)
+            error_reporter.report(e, where=func.__name__)
     return wrapper
\ No newline at end of file
@@ -0,0 +1,174 @@
+import collections
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+_SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ErrorAggregator:
+    """Сводка ошибок для разработчика вместо сообщения на каждое исключение.
+
+    Исключения группируются по отпечатку: тип исключения и последняя строка кода бота в трассировке. О первом
+    появлении отпечатка разработчик узнаёт сразу, а повторы только подсчитываются и раз в digest_interval секунд
+    отправляются одной сводкой. Отправка выполняется отдельным потоком, поэтому report() не блокирует
+    обработчик, в котором произошла ошибка.
+
+    Использование:
+    error_reporter.start(lambda text: bot.send_message(dev_id, text))
+    ...
+    except Exception as error:
+        error_reporter.report(error, where='polling')
+    """
+
+    def __init__(self, digest_interval=300, max_fingerprints=1000, max_queue=100):
+        self.digest_interval = digest_interval
+        self.max_fingerprints = max_fingerprints
+        self._errors = collections.OrderedDict()  # отпечаток -> _ErrorStats, от давно не встречавшихся к свежим
+        self._lock = threading.Lock()
+        self._outbox = queue.Queue(maxsize=max_queue)
+        self._send = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, send):
+        """Запускает поток отправки. send(text) доставляет текст разработчику."""
+
+        self._send = send
+        self._thread = threading.Thread(target=self._run, name='ErrorReporter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Отправляет накопленную сводку и останавливает поток отправки"""
+
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def report(self, error, where=None):
+        """Учитывает исключение. Возвращает отпечаток, под которым оно сгруппировано."""
+
+        fingerprint, location = self._fingerprint(error)
+        now = datetime.datetime.now()
+        with self._lock:
+            stats = self._errors.get(fingerprint)
+            if stats is None:
+                stats = self._errors[fingerprint] = _ErrorStats(error, location, where, now)
+                if len(self._errors) > self.max_fingerprints:
+                    self._errors.popitem(last=False)
+                is_new = True
+            else:
+                stats.seen(error, now)
+                self._errors.move_to_end(fingerprint)
+                is_new = False
+
+        if is_new:
+            self._enqueue(self._format_new(stats))
+        return fingerprint
+
+    def stats(self):
+        """Количество ошибок по отпечаткам"""
+
+        with self._lock:
+            return {fingerprint: stats.count for fingerprint, stats in self._errors.items()}
+
+    @staticmethod
+    def _fingerprint(error):
+        frames = traceback.extract_tb(error.__traceback__)
+        # Место в коде бота информативнее строки внутри requests или telebot
+        own_frames = [frame for frame in frames if frame.filename.startswith(_SOURCE_DIR)]
+        frames = own_frames or frames
+        if frames:
+            frame = frames[-1]
+            location = f'{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}'
+        else:
+            location = 'unknown'
+        return f'{type(error).__name__}@{location}', location
+
+    def _enqueue(self, text):
+        try:
+            self._outbox.put_nowait(text)
+        except queue.Full:
+            logger.warning("Очередь отчётов об ошибках переполнена, сообщение отброшено")
+
+    def _format_new(self, stats):
+        where = f'Где: {stats.where}\n' if stats.where else ''
+        return (f"⛔️ Новая ошибка\n\n"
+                f"Дата и время: {stats.first_seen.strftime('%d.%m.%Y %H:%M:%S')}\n"
+                f"{where}"
+                f"Место: {stats.location}\n"
+                f"Ошибка: {stats.error_type}: {stats.message}\n\n"
+                f"Повторы будут приходить сводкой раз в {self.digest_interval} сек.")
+
+    def _digest(self):
+        """Текст сводки повторов с момента предыдущей сводки или None, если повторов не было"""
+
+        with self._lock:
+            repeated = [(stats.pending, stats) for stats in self._errors.values() if stats.pending]
+            for _, stats in repeated:
+                stats.pending = 0
+        if not repeated:
+            return None
+
+        repeated.sort(key=lambda item: item[0], reverse=True)
+        lines = [f'📋 Сводка ошибок за {self.digest_interval} сек.:']
+        for pending, stats in repeated:
+            lines.append(f"• {stats.error_type} ({stats.location}) — {pending} раз, всего {stats.count}, "
+                         f"последняя {stats.last_seen.strftime('%H:%M:%S')}: {stats.message}")
+        return '\n'.join(lines)
+
+    def _run(self):
+        next_digest = time.monotonic() + self.digest_interval
+        while True:
+            timeout = max(next_digest - time.monotonic(), 0)
+            try:
+                self._deliver(self._outbox.get(timeout=min(timeout, 1)))
+                continue
+            except queue.Empty:
+                pass
+
+            stopped = self._stopped.is_set()
+            if stopped or time.monotonic() >= next_digest:
+                digest = self._digest()
+                if digest is not None:
+                    self._deliver(digest)
+                next_digest = time.monotonic() + self.digest_interval
+            if stopped:
+                return
+
+    def _deliver(self, text):
+        try:
+            self._send(text[:4096])
+        except Exception as error:
+            logger.error("Не удалось отправить отчёт об ошибке разработчику: %s", error)
+
+
+class _ErrorStats:
+    """Счётчики одного отпечатка ошибки"""
+
+    __slots__ = ('error_type', 'message', 'location', 'where', 'count', 'pending', 'first_seen', 'last_seen')
+
+    def __init__(self, error, location, where, now):
+        self.error_type = type(error).__name__
+        self.message = str(error)[:300]
+        self.location = location
+        self.where = where
+        self.count = 1
+        self.pending = 0  # повторы, ещё не попавшие в сводку
+        self.first_seen = now
+        self.last_seen = now
+
+    def seen(self, error, now):
+        self.message = str(error)[:300]
+        self.count += 1
+        self.pending += 1
+        self.last_seen = now
+
+
+error_reporter = ErrorAggregator(digest_interval=int(os.getenv('ERROR_DIGEST_INTERVAL', 300)))
@@ -0,0 +1,103 @@
+import csv
+import datetime
+import io
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+
+from src.utils.storage import EXPORT_TABLES, default_storage
+
+try:
+    import openpyxl
+except ImportError:  # Выгрузка в XLSX нужна не всегда, CSV работает без сторонних библиотек
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_DOCUMENT_LIMIT = 50 * 2 ** 20  # Больше Bot API отправить не даст
+
+
+class DataExport:
+    """Выгрузка пользователей, их настроек и статистики для администраторов.
+
+    Строки читаются из хранилища порциями (Storage.export_rows) и сразу пишутся во временный файл: ZIP-архив с
+    CSV на каждую таблицу или книгу XLSX с листом на каждую таблицу. Ни таблица, ни отчёт целиком в памяти не
+    собираются, поэтому память не зависит от числа пользователей.
+
+    Использование:
+    with DataExport().export('csv') as (path, counts):
+        bot.send_document(chat_id, open(path, 'rb'), visible_file_name='users.zip')
+    """
+
+    formats = ('csv', 'xlsx')
+
+    def __init__(self, storage=None, tables=tuple(EXPORT_TABLES), batch_size=1000):
+        self.storage = storage or default_storage()
+        self.tables = tables
+        self.batch_size = batch_size
+
+    @contextmanager
+    def export(self, file_format='csv'):
+        """Создаёт временный файл выгрузки и возвращает (путь, {таблица: число строк}). Файл удаляется при выходе
+        из блока with."""
+
+        if file_format not in self.formats:
+            raise ValueError(f'Неизвестный формат выгрузки {file_format!r}')
+        if file_format == 'xlsx' and openpyxl is None:
+            raise RuntimeError('Для выгрузки в XLSX установите openpyxl (pip install openpyxl)')
+
+        descriptor, path = tempfile.mkstemp(prefix='export_', suffix='.zip' if file_format == 'csv' else '.xlsx')
+        os.close(descriptor)
+        try:
+            started = time.perf_counter()
+            counts = self.write_csv_zip(path) if file_format == 'csv' else self.write_xlsx(path)
+            logger.info("Выгрузка %s: %s строк, %.1f МБ, %.1f сек.", file_format, sum(counts.values()),
+                        os.path.getsize(path) / 2 ** 20, time.perf_counter() - started)
+            yield path, counts
+        finally:
+            os.remove(path)
+
+    def write_csv_zip(self, path):
+        """ZIP-архив с файлом <таблица>.csv на каждую таблицу. CSV с разделителем ';' и BOM, чтобы Excel сразу
+        открывал кириллицу и колонки. Возвращает {таблица: число строк}."""
+
+        counts = {}
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for table in self.tables:
+                with io.TextIOWrapper(archive.open(f'{table}.csv', 'w'), encoding='utf-8-sig', newline='') as file:
+                    writer = csv.writer(file, delimiter=';')
+                    counts[table] = self._write(table, writer.writerow)
+        return counts
+
+    def write_xlsx(self, path):
+        """Книга XLSX с листом на каждую таблицу. В режиме write_only openpyxl сбрасывает строки на диск по мере
+        добавления. Возвращает {таблица: число строк}."""
+
+        counts = {}
+        workbook = openpyxl.Workbook(write_only=True)
+        for table in self.tables:
+            sheet = workbook.create_sheet(table)
+            counts[table] = self._write(table, sheet.append)
+        workbook.save(path)
+        return counts
+
+    def _write(self, table, write_row):
+        """Передаёт в write_row заголовок и строки таблицы. Возвращает число строк без заголовка."""
+
+        rows = self.storage.export_rows(table, self.batch_size)
+        write_row(next(rows))
+        count = 0
+        for row in rows:
+            write_row(row)
+            count += 1
+        return count
+
+    @staticmethod
+    def file_name(file_format):
+        """Имя файла для пользователя: telegram_bot_<дата>_<время>.zip или .xlsx"""
+
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M')
+        return f"telegram_bot_{stamp}.{'zip' if file_format == 'csv' else 'xlsx'}"
@@ -2,45 +2,56 @@ import ast
 import logging
 import os
 import random
+import time
 from datetime import datetime
 
 import dotenv
 import requests
-import schedule
 import telebot
 from requests.auth import HTTPBasicAuth
 from telebot import types
 from telebot_calendar import Calendar, CallbackData
 
+from src.utils.callback_registry import callback_registry
 from src.utils.interactions_with_services import ExchangeWithErp
-from src.utils.logger_setup import setup_logger
+from src.utils.metrics import telegram_retries
+from src.utils.scheduler import AdaptivePollTrigger
 from src.utils.sql import WorkWithDb, StatisticsManager
+from src.utils.settings import Config
+from src.utils.storage import default_storage, is_postgres_url
+from src.utils.state_store import ConversationStore
 
 # Инициализация бота
 dotenv.load_dotenv()
 bot = telebot.TeleBot(os.getenv('BOT_TOKEN'))
 id_dev = os.getenv('DEV_ID')
 
-# Настройка логгера
-log_file = os.getenv("LOG_FILE", "bot.log")  # Default to "bot.log" if environment variable not set
-logger = setup_logger(log_file=log_file, level=logging.INFO)
-logger.info("Bot initialized and logger setup completed.")
+logger = logging.getLogger(__name__)
 url_app = os.getenv('URL_APP_REMIT_EMPLOYEE')
 login = os.getenv('LOGIN_AUTH_GET_APP_REMIT_EMPLOYEE')
 passwd = os.getenv('PASS_AUTH_GET_APP_REMIT_EMPLOYEE')
+# Сколько раз рассылка повторяет отправку одному получателю после ответа 429 Too Many Requests
+broadcast_max_retries = int(os.getenv('BROADCAST_MAX_RETRIES', 3))
+# Пользователей на одной странице списка для администраторов
+users_page_size = int(os.getenv('USERS_PAGE_SIZE', 20))
 
 # Инициализация календаря
 calendar = Calendar()
 calendar_callback = CallbackData("calendar", "action", "year", "month", "day")
 
-# Глобальные переменные для хранения состояния
-user_data = {}
+# Состояние многошаговых диалогов пользователей. С PostgreSQL оно хранится в общей базе всегда: следующее сообщение
+# пользователя может обработать другой экземпляр бота
+user_data = ConversationStore(
+    ttl=int(os.getenv('CONVERSATION_STATE_TTL', 60 * 60)),
+    storage=default_storage if (os.getenv('CONVERSATION_STATE_PERSIST') == 'True'
+                                or is_postgres_url(Config.DATABASE_URL)) else None
+)
 
 
 def register(call):
     """Регистрация данных о пользователе в БД"""
 
-    logger.info(f"Entering method: register with call: {call}")
+    logger.info("Entering method: register for user %s", call.from_user.id)
     user_id = call.from_user.id
     first_name = call.from_user.first_name
     last_name = call.from_user.last_name
@@ -66,7 +77,7 @@ def register(call):
                              f'• Username:  @{username}\n')
             bot.send_message(chat_id=id_dev, text=report_to_dev)
 
-            logger.info(f"Exiting method: register with response: {rand_phrase}")
+            logger.info("Exiting method: register with response: %s", rand_phrase)
             return rand_phrase
     else:
         list_rand_phrase = [
@@ -78,7 +89,7 @@ def register(call):
         rand_phrase = (f'{random.choice(list_rand_phrase)}\nПосмотреть функционал можно в меню, слева от поля ввода '
                        f'сообщения.')
 
-        logger.info(f"Exiting method: register with response: {rand_phrase}")
+        logger.info("Exiting method: register with response: %s", rand_phrase)
         return rand_phrase
 
 
@@ -220,10 +231,10 @@ def ask_for_name(chat_id):
 def finalize_event(chat_id, user_id):
     """Если выбраны обе даты и имя дежурного, записывает данные в БД и оповещает о совершенном действии."""
 
-    if user_id not in user_data:
+    data = user_data.get(user_id)
+    if not data or not {'first_date', 'last_date', 'name'} <= data.keys():
         bot.send_message(chat_id, "Данные для завершения события отсутствуют. Повторите попытку.")
         return
-    data = user_data[user_id]
     first_date = data['first_date']
     last_date = data['last_date']
     name_hero = data['name']
@@ -235,7 +246,7 @@ def finalize_event(chat_id, user_id):
                          f"В период с {first_date.strftime('%d.%m.%Y')} по {last_date.strftime('%d.%m.%Y')}"
                          f" будет дежурить {name_hero}.")  # Ensure the message is grammatically complete
 
-        del user_data[user_id]
+        user_data.pop(user_id)
     else:
         bot.send_message(chat_id, answer_db)
 
@@ -253,6 +264,87 @@ def change_status_news(call):
     return answer
 
 
+def users_page(after=None, before=None):
+    """Страница списка пользователей с кнопками листания. Возвращает {'text': ..., 'keyboard': ...}.
+    Курсор страницы (user_id её первой или последней строки) передаётся в callback_data кнопок: users:prev:<id>
+    и users:next:<id>, поэтому на сервере для листания ничего не хранится."""
+
+    db_instance = WorkWithDb()
+    rows, has_prev, has_next = db_instance.get_users_page(after, before, users_page_size)
+    if not rows and (after is not None or before is not None):
+        # Пользователи с этой страницы удалены - показываем начало списка
+        rows, has_prev, has_next = db_instance.get_users_page(limit=users_page_size)
+    counts = db_instance.get_user_counts()
+
+    lines = [f"Пользователей: {counts['total']}, активных: {counts['active']}, администраторов: {counts['admins']}",
+             '']
+    for user_id, first_name, last_name, username, rights in rows:
+        name = ' '.join(part for part in (first_name, last_name) if part) or 'Без имени'
+        lines.append(f"• {name}{f' @{username}' if username else ''} — {user_id}"
+                     f"{' (админ)' if rights == 'admin' else ''}")
+    if not rows:
+        lines.append('Пользователей нет')
+
+    buttons = []
+    if has_prev:
+        buttons.append(types.InlineKeyboardButton(text='◀️ Назад', callback_data=f'users:prev:{rows[0][0]}'))
+    if has_next:
+        buttons.append(types.InlineKeyboardButton(text='Далее ▶️', callback_data=f'users:next:{rows[-1][0]}'))
+    keyboard = None
+    if buttons:
+        keyboard = types.InlineKeyboardMarkup()
+        keyboard.row(*buttons)
+    return {'text': '\n'.join(lines), 'keyboard': keyboard}
+
+
+def list_all_users(call):
+    """Первая страница списка всех пользователей"""
+
+    return users_page()
+
+
+def find_users(text, rights=None):
+    """Результат поиска пользователей с кнопками изменения прав. Возвращает {'text': ..., 'keyboard': ...}.
+    rights='admin' или 'user' - показывает только тех, кому можно назначить эти права, None - всех найденных с
+    кнопкой, переключающей права. Данные кнопок хранятся в callback_registry."""
+
+    rows = WorkWithDb().search_users(text, limit=20)
+    if rights is not None:
+        rows = [row for row in rows if (row[4] or 'user') != rights]
+    rows = rows[:10]
+    if not rows:
+        return {'text': f'По запросу "{text}" никого не нашлось.', 'keyboard': None}
+
+    lines = [f'Найдено пользователей: {len(rows)}', '']
+    keyboard = types.InlineKeyboardMarkup()
+    for user_id, first_name, last_name, username, current_rights in rows:
+        name = ' '.join(part for part in (first_name, last_name) if part) or 'Без имени'
+        is_admin = current_rights == 'admin'
+        lines.append(f"• {name}{f' @{username}' if username else ''} — {user_id}{' (админ)' if is_admin else ''}")
+        callback_data = callback_registry.encode('rt', {
+            'user_id': user_id,
+            'rights': 'user' if is_admin else 'admin',
+            'name': name
+        }, ttl=60 * 60)
+        action = 'снять права админа' if is_admin else 'сделать админом'
+        keyboard.add(types.InlineKeyboardButton(text=f'{name}: {action}', callback_data=callback_data))
+    return {'text': '\n'.join(lines), 'keyboard': keyboard}
+
+
+def grant_admin_rights(call):
+    """Ожидает от администратора запрос для поиска пользователя, которому нужно дать права админа"""
+
+    user_data.update(call.from_user.id, rights_search='admin')
+    return 'Кому дать права администратора? Отправьте имя, фамилию, username или ID пользователя.'
+
+
+def revoke_admin_rights(call):
+    """Ожидает от администратора запрос для поиска пользователя, которого нужно лишить прав админа"""
+
+    user_data.update(call.from_user.id, rights_search='user')
+    return 'Кого лишить прав администратора? Отправьте имя, фамилию, username или ID пользователя.'
+
+
 def post_answer_of_event(dict_answer):
     """Возвращает JSON в ERP для регистрации события о простое."""
 
@@ -260,7 +352,7 @@ def post_answer_of_event(dict_answer):
     value_auth = os.getenv("EVENT_HANDLING_VALUE")
     dict_answer[key_auth] = value_auth
     answer_ERP = ExchangeWithErp(dict_answer).answer_from_ERP()
-    logger.debug(f"ERP answer: {answer_ERP}")
+    logger.debug("ERP answer: %s", answer_ERP)
     return answer_ERP
 
 
@@ -268,19 +360,29 @@ def notification_for(focus_group, text_message, silent=False):
     """Рассылает уведомление выбранной группе людей"""
 
     logger.info(
-        f"Entering method: notification_for with focus_group: {focus_group}, text_message: {text_message}, silent: {silent}")
+        "Entering method: notification_for with focus_group: %s, text_message: %s, silent: %s",
+        focus_group, text_message, silent)
     list_id_user = WorkWithDb().get_list_users_id(focus_group)
 
     for user_id in list_id_user:
-        try:
-            bot.send_message(chat_id=user_id, text=text_message, disable_notification=silent)
-        except telebot.apihelper.ApiTelegramException as e:
-            # Проверяем текст ошибки
-            if "bot was blocked by the user" in str(e):
-                logger.warning(f"User {user_id} has blocked the bot.")
-                WorkWithDb().change_user_status_use_bot(user_id)
-            else:
-                logger.error(f"An unexpected error occurred: {e}")
+        for attempt in range(broadcast_max_retries + 1):
+            try:
+                bot.send_message(chat_id=user_id, text=text_message, disable_notification=silent)
+            except telebot.apihelper.ApiTelegramException as e:
+                # 429: Telegram ограничил частоту отправки, повторяем через указанное им время
+                if e.error_code == 429 and attempt < broadcast_max_retries:
+                    retry_after = e.result_json.get('parameters', {}).get('retry_after', 1)
+                    telegram_retries.inc('sendMessage')
+                    logger.warning("Flood limit while sending to %s, retry in %s s.", user_id, retry_after)
+                    time.sleep(retry_after)
+                    continue
+                # Проверяем текст ошибки
+                if "bot was blocked by the user" in str(e):
+                    logger.warning("User %s has blocked the bot.", user_id)
+                    WorkWithDb().change_user_status_use_bot(user_id)
+                else:
+                    logger.error("An unexpected error occurred: %s", e)
+            break
     logger.info("Exiting method: notification_for")
 
 
@@ -304,54 +406,6 @@ def notification_for_bar(text_message):
     notification_for(focus_group='baraholka', text_message=text_message)
 
 
-def schedule_next_run():
-    """Обновляет расписание заданий"""
-
-    def create_random_time(summary=None, name_func='?'):
-        hour = '{:02d}'.format(random.randint(00, 23))
-
-        if summary == 'first summary':
-            """Формирует время <06:random(0:59)>"""
-            hour = '06'
-        elif summary == 'second summary':
-            """Формирует время <08:random(0:59)>"""
-            hour = '08'
-        elif summary == 'daily summary':
-            """Формирует время <random(14-17):random(0:59)>"""
-            hour = '{:02d}'.format(random.randint(14, 17))
-        else:
-            """Если тег не указан час будет рандомным"""
-            hour = hour
-
-        minutes = '{:02d}'.format(random.randint(0, 59))
-        date_str = datetime.now().strftime("%d.%m.%Y")
-        time_str = f'{hour}:{minutes}'
-        logger.debug(f'Function "{name_func}.tag({summary})" scheduled to execute on {date_str} at {time_str}.')
-        return time_str
-
-    logger.info(f'{datetime.now().strftime("%d.%m.%Y %H:%M:%S")} Updating task schedules:')
-
-    list_func = [
-        {'first summary': [notif_of_hero]},
-        # {'second summary': []},
-        {'daily summary': [notification_of_dej_tomorrow]}
-    ]
-
-    def create_schedule(list_funcs):
-        """Пересоздаёт расписание выполнения заданий по тегам на текущий день"""
-
-        for element in list_funcs:
-            for time_of_day, funcs in element.items():
-                schedule.clear(time_of_day)  # Clear old time
-                logger.info(f'Schedule tasks with tag "{time_of_day}" have been cleared.')
-                for func in funcs:
-                    (schedule.every().day.at(create_random_time(summary=time_of_day, name_func=func.__name__)).
-                     do(func).
-                     tag(time_of_day))
-
-    create_schedule(list_funcs=list_func)
-
-
 def notification_of_dej_tomorrow():
     """Если завтра есть дежурный, пришлёт уведомление всем подписчикам"""
 
@@ -375,7 +429,12 @@ def get_app_remit_employee(call):
         )
     except requests.RequestException as e:
         bot.send_message(chat_id=call.from_user.id, text=f"Ошибка загрузки файла: {str(e)}")
-        logger.error(f"Failed to download the file: {e}")
+        logger.error("Failed to download the file: %s", e)
+
+
+# Частота опроса 1С о проходах через двери: часто в рабочее время и после активности, редко ночью и при ошибках
+door_poll_trigger = AdaptivePollTrigger.from_env('DOOR_POLL', min_interval=10, max_interval=300,
+                                                 hours='07:00-20:00', days=range(5))
 
 
 def update_data_door():
@@ -384,35 +443,33 @@ def update_data_door():
     name = os.getenv('BIRD_AUTH_KEY')
     value = os.getenv('BIRD_AUTH_VALUE')
 
-    status_sql = WorkWithDb().check_door()[0]
+    checkpoint = WorkWithDb().check_door()
+    status_sql = checkpoint[0] if checkpoint else None
     answer_erp = ExchangeWithErp({name: value}).in_out()
-    # print(status_sql)
-    # print(answer_erp)
 
-    # Если ответ от ERP словарь
-    if isinstance(answer_erp, dict):
-        # Если ERP вернул ошибку
-        if answer_erp.get(name) is False:
-            logger.error(answer_erp.get(name))
-            return answer_erp.get('textError')
     # Если ответ от ERP список
-    elif isinstance(answer_erp, list):
+    if isinstance(answer_erp, list) and answer_erp:
         last_point = answer_erp[-1]
         string_last_point = str(f'{last_point.get("Время")} {last_point.get("Вход")}')
-        # print(status_sql)
-        # print(type(status_sql))
-        # print(last_point)
-        # print(type(last_point))
-        # print(string_last_point)
-        if status_sql != string_last_point:
+        activity = status_sql != string_last_point
+        if activity:
             WorkWithDb().update_checkpoint(string_last_point)
             notif_bird(string_last_point)
+        door_poll_trigger.report(activity=activity)
+        return None
+
+    # Если ERP вернул ошибку или неизвестный ответ
+    door_poll_trigger.report(error=True)
+    if isinstance(answer_erp, dict):
+        logger.error("Ошибка опроса дверей в ERP: %s", answer_erp)
+        return answer_erp.get('textError') or answer_erp.get('error_text')
+    return None
 
 
 def notif_bird(last_point):
     """Уведомляет о чекпоинте"""
 
-    logger.debug(f"Checkpoint notification details: {last_point}")
+    logger.debug("Checkpoint notification details: %s", last_point)
     list_last_point = last_point.split(' ')
     list_observ_doors = [
         'Администрация Офис 1 Этаж',
@@ -455,7 +512,7 @@ def decline_word(number, word_forms):
     :return: str, правильная форма слова
     """
 
-    logger.debug(f"Declining word for number: {number}, word forms: {word_forms}")
+    logger.debug("Declining word for number: %s, word forms: %s", number, word_forms)
     if not isinstance(word_forms, (tuple, list)) or len(word_forms) != 3:
         raise ValueError("word_forms должен быть кортежем или списком из 3 элементов")
 
@@ -470,45 +527,16 @@ def decline_word(number, word_forms):
         return word_forms[2]
 
 
-def find_value_by_name(data, target_name, target_key):
-    """Извлекает имя кнопки отталкиваясь от входящего callback"""
-
-    # Если data является словарем
-    if isinstance(data, dict):
-        # Проверяем, есть ли в словаре ключ 'name' и его значение равно target_name
-        if data.get('callback') == target_name:
-            # Если нашли, возвращаем значение target_key
-            return data.get(target_key)
-
-        # Рекурсивно проходим по всем значениям словаря
-        for key, value in data.items():
-            result = find_value_by_name(value, target_name, target_key)
-            if result is not None:
-                return result
-
-    # Если data является списком
-    elif isinstance(data, list):
-        # Рекурсивно проходим по всем элементам списка
-        for item in data:
-            result = find_value_by_name(item, target_name, target_key)
-            if result is not None:
-                return result
-
-    # Если ничего не нашли, возвращаем None
-    return None
-
-
 def formation_of_the_function_rating_text(list_from_db):
     """Принимает лист с результатами из БД и составляет из него текст с рейтингом"""
 
-    from src.utils.menu_formation import menu_storage
+    from src.utils.menu_formation import menu_graph
     if not list_from_db:
         logger.warning('Нет данных')
         return 'Нет данных'
 
-    menu = menu_storage
     dict_top = {
-        find_value_by_name(menu, element[0], "name"): element[1] for element in list_from_db
+        menu_graph.title_of(element[0]): element[1] for element in list_from_db
     }
 
     return '\n'.join(
@@ -5,17 +5,19 @@ import dotenv
 import requests
 from requests.auth import HTTPBasicAuth
 
+from src.utils.metrics import instrument_methods, erp_latency, erp_errors
+
 dotenv.load_dotenv()
 dev_id = os.getenv('DEV_ID')
 
 
+@instrument_methods(erp_latency, erp_errors, 'ExchangeWithErp')
 class ExchangeWithErp:
     """Получение данных из 1С"""
 
+    logger = logging.getLogger("ERP_Exchange_Logger")
+
     def __init__(self, params):
-        self.logger = logging.getLogger("ERP_Exchange_Logger")
-        self.logger.setLevel(logging.INFO)
-        self.logger.handlers.clear()  # Clear existing logging handlers to avoid duplicate logs
         self.request_get = os.getenv("WAY_ERP_GET")
         self.request_post = os.getenv("WAY_ERP_POST")
         self.login = os.getenv("LOGIN_ERP")
@@ -26,7 +28,7 @@ class ExchangeWithErp:
 
     def get_request(self):
         """Выполняет GET-запрос к системе 1С."""
-        self.logger.info(f"Отправка GET-запроса: {self.request_get}, параметры: {self.params}")
+        self.logger.info("Отправка GET-запроса: %s, параметры: %s", self.request_get, self.params)
         try:
             request = requests.get(
                 url=self.request_get,
@@ -35,18 +37,19 @@ class ExchangeWithErp:
                 params=self.params,
                 timeout=10
             )
-            self.logger.info(f"Получен ответ со статусом: {request.status_code}")
+            self.logger.info("Получен ответ со статусом: %s", request.status_code)
             # print(request)
             return request
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"Ошибка GET-запроса: {str(e)}")
+            erp_errors.inc('ExchangeWithErp.get_request')
+            self.logger.error("Ошибка GET-запроса: %s", e)
             return None
 
     def answer_from_ERP(self):
         """Обрабатывает ответ от 1С (ERP) и возвращает данные или ошибку."""
         try:
-            self.logger.info(f"Разбор ответа от ERP: {self.response.json()}")
             data = self.response.json()
+            self.logger.debug("Разбор ответа от ERP: %s", data)
             for key, value in data.items():
                 if os.getenv('EVENT_HANDLING_KEY') in key:
                     return True
@@ -54,7 +57,7 @@ class ExchangeWithErp:
                     return value
             return {'error_text': 'Неизвестный ответ от ERP'}
         except Exception as e:
-            self.logger.error(f"Ошибка обработки ответа: {str(e)}")
+            self.logger.error("Ошибка обработки ответа: %s", e)
             return {'error_text': 'Ошибка обработки ответа'}
 
     def get_count_days(self):
@@ -64,7 +67,7 @@ class ExchangeWithErp:
         self.logger.info("Processing get_count_days response from ERP")
         json_data = self.response.json()
         count_day = int(json_data.get(os.getenv("FUNC_NAME2"), 0))
-        self.logger.info(f"Count of days calculated: {count_day}")
+        self.logger.info("Count of days calculated: %s", count_day)
         return count_day
 
     def verification(self):
@@ -74,25 +77,25 @@ class ExchangeWithErp:
         self.logger.info("Processing verification response from ERP")
         json = self.response.json()
         answer_erp = json.get(os.getenv("FUNC_NAME3"), "Error: Missing data")
-        self.logger.info(f"Verification result: {answer_erp}")
+        self.logger.info("Verification result: %s", answer_erp)
         return answer_erp
 
     def in_out(self):
         """Обрабатывает вход и выход пользователя из системы ERP."""
         try:
             data = self.response.json()
-            self.logger.debug(f"Ответ JSON in_out: {data}")
+            self.logger.debug("Ответ JSON in_out: %s", data)
             if self.response.status_code == 200:
                 for key, value in data.items():
                     return value
             return {'error_text': 'Некорректный ответ'}
         except Exception as e:
-            self.logger.error(f"Ошибка обработки in_out: {str(e)}")
+            self.logger.error("Ошибка обработки in_out: %s", e)
             return {'error_text': 'Ошибка обработки in_out'}
 
     def post_request(self):
         """Выполняет POST-запрос в систему ERP."""
-        self.logger.info(f"Отправка POST-запроса: {self.request_post}, параметры: {self.params}")
+        self.logger.info("Отправка POST-запроса: %s, параметры: %s", self.request_post, self.params)
         try:
             request = requests.post(
                 url=self.request_post,
@@ -101,8 +104,9 @@ class ExchangeWithErp:
                 auth=HTTPBasicAuth(self.login, self.password),
                 timeout=10
             )
-            self.logger.info(f"POST-ответ статус: {request.status_code}")
+            self.logger.info("POST-ответ статус: %s", request.status_code)
             return request
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"Ошибка POST-запроса: {str(e)}")
+            erp_errors.inc('ExchangeWithErp.post_request')
+            self.logger.error("Ошибка POST-запроса: %s", e)
             return None
@@ -0,0 +1,94 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """Выбор ведущего процесса по аренде (lease) в общем хранилище (src.utils.storage): файле SQLite для
+    процессов одного сервера или PostgreSQL для нескольких серверов.
+
+    Каждый процесс бота раз в ttl/3 секунд пытается захватить или продлить аренду в таблице leases (она создаётся
+    вместе с остальными таблицами хранилища). Аренду получает тот, кто первым обнаружил её истёкшей, поэтому при
+    падении ведущего процесса другой процесс становится ведущим в течение ttl + ttl/3 секунд. Ведущий процесс сам
+    перестаёт считать себя ведущим, если не смог продлить аренду вовремя, ещё до того как её смогут захватить
+    другие.
+
+    Использование:
+    leader = LeaderElection(default_storage(), name='scheduler')
+    leader.start()
+    if leader.is_leader:
+        ...
+    """
+
+    def __init__(self, storage, name='scheduler', ttl=10.0, on_change=None):
+        self.storage = storage
+        self.name = name
+        self.ttl = ttl
+        self.on_change = on_change
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._valid_until = 0.0  # time.monotonic(), до которого аренда гарантированно принадлежит процессу
+        self._leader = False
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self._leader and time.monotonic() < self._valid_until
+
+    def start(self):
+        """Захватывает аренду, если она свободна, и запускает поток её продления"""
+
+        self.renew()
+        self._thread = threading.Thread(target=self._run, name='LeaderElection', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Освобождает аренду, чтобы другой процесс сразу стал ведущим"""
+
+        self._stopped.set()
+        if self._leader:
+            self._execute('DELETE FROM leases WHERE name = ? AND owner = ?', (self.name, self.owner))
+            self._set_leader(False)
+
+    def renew(self):
+        """Захватывает или продлевает аренду. Возвращает True, если процесс ведущий."""
+
+        started = time.monotonic()
+        now = time.time()
+        try:
+            self._execute('INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) '
+                          'ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+                          'WHERE leases.owner = excluded.owner OR leases.expires_at < ?',
+                          (self.name, self.owner, now + self.ttl, now))
+            row = self._execute('SELECT owner FROM leases WHERE name = ?', (self.name,))
+        except self.storage.errors as error:
+            logger.error("Не удалось продлить аренду '%s': %s", self.name, error)
+            self._set_leader(self.is_leader)
+            return self.is_leader
+
+        if row is not None and row[0] == self.owner:
+            self._valid_until = started + self.ttl
+            self._set_leader(True)
+        else:
+            self._set_leader(False)
+        return self._leader
+
+    def _run(self):
+        while not self._stopped.wait(self.ttl / 3):
+            self.renew()
+
+    def _set_leader(self, leader):
+        if leader == self._leader:
+            return
+        self._leader = leader
+        logger.warning("Процесс %s %s ведущим для '%s'", self.owner, 'стал' if leader else 'перестал быть', self.name)
+        if self.on_change is not None:
+            self.on_change(leader)
+
+    def _execute(self, query, params=()):
+        return self.storage.execute(query, params, timeout=self.ttl / 3)
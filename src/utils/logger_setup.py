@@ -1,38 +1,203 @@
+import atexit
+import contextvars
+import copy
+import datetime
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+_listener = None
+_queue_handler = None
 
-def setup_logger(log_file: str = "bot.log", level: int = logging.INFO):
+# Поля контекста текущего обновления или задания (update_id, user_id, job), добавляемые ко всем записям
+_context = contextvars.ContextVar('log_context', default={})
+
+# Стандартные атрибуты LogRecord: всё остальное в записи пришло через extra и попадает в JSON как поле
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'context'}
+
+
+@contextmanager
+def log_context(**fields):
+    """Добавляет поля ко всем записям лога внутри блока with (в том же потоке)"""
+
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Сохраняет в записи контекст потока, в котором она создана, до передачи записи в другой поток"""
+
+    def filter(self, record):
+        record.context = _context.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение, поля контекста и поля из extra
+    (например, duration_ms)"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'context', None) or {})
+        data.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """QueueHandler, который не склеивает трассировку исключения с сообщением, чтобы JSON-формат
+    мог вывести её отдельным полем"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TruncateFilter(logging.Filter):
+    """Обрезает текст записи до max_length символов, чтобы большие ответы 1С и объекты Telegram не раздували лог"""
+
+    def __init__(self, max_length=2000):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self, record):
+        message = record.getMessage()
+        if len(message) > self.max_length:
+            record.msg = f'{message[:self.max_length]}… (обрезано {len(message) - self.max_length} символов)'
+            record.args = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей уровня ниже WARNING от указанных логгеров (и их потомков).
+    Предупреждения и ошибки пропускаются всегда."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return random.random() < rate
+            name = name.rpartition('.')[0]
+        return True
+
+    @staticmethod
+    def parse(value):
+        """Разбирает строку вида "ERP_Exchange_Logger=0.1,Work_with_DB=0.5" в словарь долей"""
+
+        rates = {}
+        for item in filter(None, (part.strip() for part in value.split(','))):
+            name, _, rate = item.partition('=')
+            rates[name.strip()] = float(rate)
+        return rates
+
+
+def setup_logger(log_file: str = None, level: int = logging.INFO):
     """
-    Настраивает и возвращает логгер приложения.
-    
-    :param log_file: Имя файла, куда будут записываться логи.
+    Настраивает логирование приложения и возвращает логгер бота.
+
+    Все логгеры пишут через корневой логгер в очередь (QueueHandler), а запись в консоль и файл выполняет
+    отдельный поток (QueueListener), поэтому потоки обработчиков не ждут диска. Хендлеры, которые библиотеки
+    (TeleBot) повесили на свои логгеры, снимаются, чтобы их записи не дублировались. Записи длиннее LOG_MAX_LENGTH
+    обрезаются, а записи ниже WARNING от логгеров из LOG_SAMPLING сэмплируются; записи остальных логгеров, в том
+    числе библиотечных, и все предупреждения проходят без сэмплирования. При LOG_FORMAT=json каждая
+    запись выводится одной JSON-строкой вместе с полями log_context (например, update_id обрабатываемого
+    обновления). Повторные вызовы не добавляют хендлеры, а только возвращают логгер.
+
+    :param log_file: Имя файла, куда будут записываться логи (по умолчанию LOG_FILE или bot.log).
     :param level: Уровень логирования.
     :return: Настроенный объект логгера.
     """
-    logger = logging.getLogger("TelegramBotLogger")
-    logger.setLevel(level)
+    global _listener, _queue_handler
 
-    # Удаление существующих хендлеров, чтобы избежать дублирования
-    if logger.hasHandlers():
-        logger.handlers.clear()
+    logger = logging.getLogger("TelegramBotLogger")
+    if _listener is not None:
+        return logger
 
-    # Формат сообщения логов
-    formatter = logging.Formatter(
-        "%(asctime)s - [%(levelname)s] - %(name)s - %(message)s"
-    )
+    # Формат сообщения логов: текст или JSON (LOG_FORMAT=json)
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - [%(levelname)s] - %(name)s - %(message)s"
+        )
 
     # Консольный хендлер (вывод в консоль)
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
     # Файловый хендлер (ротация логов до 5MB, хранение до 3 бэкапов)
-    file_handler = RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3)
+    file_handler = RotatingFileHandler(log_file or os.getenv("LOG_FILE", "bot.log"),
+                                       maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8')
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    _queue_handler.addFilter(ContextFilter())
+    _queue_handler.addFilter(SamplingFilter(SamplingFilter.parse(os.getenv("LOG_SAMPLING", ""))))
+    _queue_handler.addFilter(TruncateFilter(int(os.getenv("LOG_MAX_LENGTH", 2000))))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    _remove_console_handlers(root)
+    root.addHandler(_queue_handler)
+
+    _listener = QueueListener(log_queue, console_handler, file_handler)
+    _listener.start()
+    atexit.register(shutdown_logger)
 
     # Логируем успешную настройку
     logger.info("Логгер успешно настроен")
 
     return logger
+
+
+def _remove_console_handlers(root):
+    """Убирает хендлеры, которые библиотеки (например, TeleBot) и logging.basicConfig уже повесили на корневой
+    логгер и на логгеры, передающие записи корневому: иначе такие записи выводятся дважды, в обход очереди."""
+
+    loggers = [root] + [logger for logger in logging.Logger.manager.loggerDict.values()
+                        if isinstance(logger, logging.Logger) and logger.propagate]
+    for logger in loggers:
+        for handler in list(logger.handlers):
+            if not isinstance(handler, logging.NullHandler):
+                logger.removeHandler(handler)
+
+
+def shutdown_logger():
+    """Дописывает записи из очереди и останавливает поток записи логов"""
+    global _listener, _queue_handler
+
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _queue_handler = None
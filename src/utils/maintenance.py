@@ -0,0 +1,143 @@
+import datetime
+import glob
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from src.utils.storage import connect, is_memory_database
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseMaintenance:
+    """Резервное копирование и обслуживание SQLite-баз бота.
+
+    backup() копирует базы через backup API SQLite порциями по pages_per_step страниц с паузой step_pause между
+    ними: между порциями база доступна боту и на чтение, и на запись. В directory хранится не больше keep последних
+    копий каждой базы. optimize(), checkpoint() и vacuum() поддерживают статистику планировщика запросов, размер
+    WAL-файла и компактность базы; их запускает планировщик в часы наименьшей нагрузки.
+
+    Использование:
+    maintenance = DatabaseMaintenance.from_env(sqlite_databases())
+    scheduler.add_job('db_backup', maintenance.backup, DailyTrigger('03:00'))
+    """
+
+    def __init__(self, databases, directory, keep=7, pages_per_step=1024, step_pause=0.05, vacuum_threshold=0.2):
+        self.databases = databases
+        self.directory = directory
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.vacuum_threshold = vacuum_threshold
+
+    @classmethod
+    def from_env(cls, databases):
+        """Создаёт обслуживание баз databases ({имя: путь}) из BACKUP_DIR, BACKUP_KEEP и DB_VACUUM_THRESHOLD"""
+
+        return cls(databases,
+                   directory=os.getenv('BACKUP_DIR', 'backups'),
+                   keep=int(os.getenv('BACKUP_KEEP', 7)),
+                   vacuum_threshold=float(os.getenv('DB_VACUUM_THRESHOLD', 0.2)))
+
+    def backup(self):
+        """Снимает копии всех баз. Возвращает пути к созданным файлам."""
+
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        created = []
+        for name, database in self.databases.items():
+            target = os.path.join(self.directory, f'{name}_{stamp}.db')
+            partial = f'{target}.part'  # Незавершённая копия не попадает в ротацию под именем готовой
+            started = time.perf_counter()
+            try:
+                with closing(connect(database)) as source, closing(sqlite3.connect(partial)) as destination:
+                    source.backup(destination, pages=self.pages_per_step, sleep=self.step_pause)
+                os.replace(partial, target)
+            except (sqlite3.Error, OSError) as error:
+                logger.error("Не удалось создать резервную копию базы %s: %s", name, error)
+                if os.path.exists(partial):
+                    os.remove(partial)
+                continue
+            logger.info("Резервная копия базы %s: %s (%.1f МБ, %.1f сек.)", name, target,
+                        os.path.getsize(target) / 2 ** 20, time.perf_counter() - started)
+            created.append(target)
+            self._rotate(name)
+        return created
+
+    def _rotate(self, name):
+        backups = sorted(glob.glob(os.path.join(glob.escape(self.directory), f'{name}_*.db')))
+        for path in backups[:-self.keep] if self.keep else []:
+            os.remove(path)
+            logger.debug("Удалена старая резервная копия %s", path)
+
+    def optimize(self):
+        """Обновляет статистику планировщика запросов. ANALYZE выполняется при каждом запуске, но по выборке из
+        analysis_limit строк каждого индекса, поэтому время не зависит от размера таблиц. PRAGMA optimize на новом
+        соединении до SQLite 3.46 ничего не делает, а в новых версиях пересчитывает статистику только после
+        многократного роста таблицы."""
+
+        for name, database in self.databases.items():
+            with closing(connect(database)) as conn:
+                conn.execute('PRAGMA analysis_limit = 1000')
+                conn.execute('ANALYZE')
+            logger.info("База %s: статистика планировщика обновлена", name)
+
+    def checkpoint(self):
+        """Переносит WAL в основной файл базы и усекает WAL-файл"""
+
+        for name, database in self.databases.items():
+            with closing(connect(database)) as conn:
+                if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+                    continue
+                busy, wal_pages, moved = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+            if busy:
+                logger.warning("База %s: checkpoint не завершён, WAL занят читателями (%s из %s страниц)",
+                               name, moved, wal_pages)
+            else:
+                logger.info("База %s: checkpoint выполнен, перенесено страниц: %s", name, moved)
+
+    def vacuum(self):
+        """Пересобирает базы, в которых свободные страницы занимают больше vacuum_threshold файла.
+        VACUUM блокирует запись на всё время выполнения, поэтому без необходимости не запускается."""
+
+        for name, database in self.databases.items():
+            stats = self.storage_stats(database)
+            if not stats['page_count'] or stats['freelist_count'] / stats['page_count'] < self.vacuum_threshold:
+                continue
+            started = time.perf_counter()
+            with closing(connect(database)) as conn:
+                conn.execute('VACUUM')
+            logger.info("База %s: VACUUM освободил %s страниц за %.1f сек.", name, stats['freelist_count'],
+                        time.perf_counter() - started)
+
+    @staticmethod
+    def storage_stats(database):
+        """Размер страницы, число страниц, свободные страницы, режим журнала и размеры файлов базы"""
+
+        with closing(connect(database)) as conn:
+            stats = {pragma: conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                     for pragma in ('page_size', 'page_count', 'freelist_count', 'journal_mode')}
+        stats['size_bytes'] = stats['page_size'] * stats['page_count']
+        wal = f'{database}-wal'
+        stats['wal_bytes'] = os.path.getsize(wal) if not is_memory_database(database) and os.path.exists(wal) else 0
+        return stats
+
+    def report(self):
+        """storage_stats() всех баз: {имя: статистика}"""
+
+        return {name: self.storage_stats(database) for name, database in self.databases.items()}
+
+    def summary(self):
+        """Текстовый отчёт о размере баз и последних резервных копиях"""
+
+        lines = []
+        for name, stats in self.report().items():
+            lines.append(f"База {name}: {stats['size_bytes'] / 2 ** 20:.1f} МБ, страниц {stats['page_count']} "
+                         f"по {stats['page_size']} Б, свободных {stats['freelist_count']}, "
+                         f"журнал {stats['journal_mode']}, WAL {stats['wal_bytes'] / 2 ** 20:.1f} МБ")
+            backups = sorted(glob.glob(os.path.join(glob.escape(self.directory), f'{name}_*.db')))
+            lines.append(f'  резервных копий: {len(backups)}' +
+                         (f', последняя {os.path.basename(backups[-1])}' if backups else ''))
+        return '\n'.join(lines)
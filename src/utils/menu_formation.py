@@ -1,8 +1,11 @@
-from telebot import types
+import json
 import logging
 
+from telebot import types
+
 from src.utils import functions
 from src.utils.functions import change_status_news
+from src.utils.menu_graph import MenuGraph
 
 
 logger = logging.getLogger(__name__)
@@ -11,244 +14,11 @@ def building_func(call):
     """Временная заглушка для функций, которые еще не реализованы."""
     name_user = call.from_user.first_name
     text = f'Наберитесь терпения, {name_user}. Эта функция станет доступна позже. Следите за обновлениями!'
-    logger.info(f"Вызвана заглушка функции для пользователя: {name_user}")
+    logger.info("Вызвана заглушка функции для пользователя: %s", name_user)
     return text
 
 
 menu_storage = {  # Хранилище меню, подменю и функций.
-    "main_menu": {
-        "text": "🏠 Главное меню:",
-        "buttons": {
-            "button1": {
-                "name": "⚙️ Основные функции",
-                "access_level": "all",
-                "callback": "button_main_functions"},
-            "button2": {
-                "name": "🔔 Управление подписками",
-                "access_level": "all",
-                "callback": "button_managing_subscriptions"},
-            # "button3": {
-            #     "name": "Настройка аккаунта",
-            #     "access_level": "admin",
-            #     "callback": "button_account_management"},
-            "button4": {
-                "name": "✨ Дополнительные функции",
-                "access_level": "all",
-                "callback": "button_additional_functions"},
-        }
-    },
-    "button_main_functions": {
-        "text": "⚙️ Основные функции:",
-        "buttons": {
-            "button": {
-                "name": "Дежурства в IT",
-                "access_level": "all",
-                "callback": "button_menu_dej"},
-            # "button1": {
-            #     "name": "Узнать кто дежурный",
-            #     "access_level": "all",
-            #     "callback": "button_dej"},
-            # "button2": {
-            #     "name": "📆 Внести дежурство в календарь",
-            #     "access_level": "admin",
-            #     "callback": "button_ins_dej"},
-            "button3": {
-                "name": "Инвентаризация",
-                "access_level": "admin",
-                "callback": "button_invent"},
-            "button4": {
-                "name": "Создать уведомление",
-                "access_level": "admin",
-                "callback": "button_create_notif"},
-            "button5": {
-                "name": "📅 Остаток дней отпуска",
-                "access_level": "all",
-                "callback": "button_vacation"},
-            "button6": {
-                "name": "Создать лот",
-                "access_level": "admin",
-                "callback": "button_create_lot"},
-            "button7": {
-                "name": "⚡ Мгновенное уведомление",
-                "access_level": "admin",
-                "callback": "button_urgent_message"},
-            "button8": {
-                "name": "🏠 Главное меню",
-                "access_level": "all",
-                "callback": "main_menu"}
-        }
-    },
-    "button_managing_subscriptions": {
-        "text": "🔔 Управление подписками:",
-        "buttons": {
-            "button1": {
-                "name": "Новости IT-отдела",
-                "access_level": "all",
-                "callback": "button_subscribe"},
-            "button3": {
-                "name": "Мониторинг дефростеров",
-                "access_level": "admin",
-                "callback": "button_defrosters"},
-            "button4": {
-                "name": "Мониторинг неисправных датчиков",
-                "access_level": "admin",
-                "callback": "button_all_sensor"},
-            "button5": {
-                "name": "Барахолка",
-                "access_level": "all",
-                "callback": "button_sub_bar"},
-            # "button6": {
-            #     "name": "Отписаться от барахолки",
-            #     "access_level": "all",
-            #     "callback": "button_unsub_bar"},
-            "button7": {
-                "name": "🏠 Главное меню",
-                "access_level": "all",
-                "callback": "main_menu"},
-        }
-    },
-    "button_additional_functions": {
-        "text": "✨ Дополнительные функции:",
-        "buttons": {
-            "button1": {
-                "name": "✉️ Написать разработчику",
-                "access_level": "all",
-                "url": "t.me/nikita_it_remit"},
-            "button2": {
-                "name": "📲 Приложение 'Ремит сотрудник'",
-                "access_level": "all",
-                "callback": "button_get_app_android"},
-            "button3": {
-                "name": "Получить список всех пользователей",
-                "access_level": "admin",
-                "callback": "button_all_users"},
-            "button4": {
-                "name": "Дать пользователю права админа",
-                "access_level": "admin",
-                "callback": "button_admin"},
-            "button5": {
-                "name": "Лишить пользователя прав админа",
-                "access_level": "admin",
-                "callback": "button_user"},
-            "button6": {
-                "name": "🏠 Главное меню",
-                "access_level": "all",
-                "callback": "main_menu"},
-        }
-    },
-
-    "back_to_main": {
-        "name": "redirect",
-        "access_level": "all",
-        "callback": "main_menu"},
-
-    "button_registration": {
-        "function": functions.register,
-        "name": "Зарегистрироваться",
-        "callback": "button_registration"
-    },
-
-    ### Дежурный ###
-    "button_menu_dej": {
-        "text": "Дежурства в IT:",
-        "buttons": {
-            "button1": {
-                "name": "Узнать кто дежурный",
-                "access_level": "all",
-                "callback": "button_dej"},
-            "button2": {
-                "name": "📆 Внести дежурство в календарь",
-                "access_level": "admin",
-                "callback": "button_ins_dej"},
-            "button3": {
-                "name": "Внести изменения",
-                "access_level": "admin",
-                "callback": "button_upd_dej"},
-            "button4": {
-                "name": "🔙 Основные функции",
-                "access_level": "all",
-                "callback": "button_main_functions"},
-            "button5": {
-                "name": "🏠 Главное меню",
-                "access_level": "all",
-                "callback": "main_menu"}
-        }
-    },
-    "button_dej": {
-        "text": "Узнать кто дежурный:",
-        "buttons": {
-            "button1": {
-                "name": "Имя следующего дежурного",
-                "access_level": "all",
-                "callback": "button_dej_1"},
-            "button2": {
-                "name": "Список дежурных",
-                "access_level": "all",
-                "callback": "button_dej_2"},
-            "button3": {
-                "name": "🔙 Дежурства в IT",
-                "access_level": "all",
-                "callback": "button_menu_dej"},
-            "button4": {
-                "name": "🏠 Главное меню",
-                "access_level": "all",
-                "callback": "main_menu"}
-        }
-    },
-
-    "button_create_notif": {
-        "text": "Создать уведомление",
-        "buttons": {
-            "button1": {
-                "name": "Для всех",
-                "access_level": "admin",
-                "callback": "button_notif_all"},
-            "button2": {
-                "name": "Для подписчиков IT-отдела",
-                "access_level": "admin",
-                "callback": "button_notif_it"},
-            "button3": {
-                "name": "Для барахолки",
-                "access_level": "admin",
-                "callback": "button_notif_bar"},
-            "button4": {
-                "name": "🔙 Основные функции",
-                "access_level": "all",
-                "callback": "button_main_functions"},
-            "button5": {
-                "name": "🏠 Главное меню",
-                "access_level": "all",
-                "callback": "main_menu"}
-        }
-    },
-
-    "button_dej_1": {"function": functions.dej_name},
-    "button_dej_2": {"function": functions.list_dej},
-    "button_ins_dej": {"function": functions.fill_schedule_dej},
-    ###
-    "button_invent": {"function": building_func},
-    "button_admin": {"function": building_func},
-    "button_user": {"function": building_func},
-    "button_subscribe": {"function": change_status_news},
-    "button_defrosters": {"function": building_func},
-    "button_all_sensor": {"function": building_func},
-    # "button_log_out": {"function": building_func},
-    # "button_sticker": {"function": building_func},
-    # "button_feed_back": {"function": building_func},
-    "button_get_app_android": {"function": functions.get_app_remit_employee},
-    # "button_random": {"function": building_func},
-    "button_all_users": {"function": building_func},
-    "button_vacation": {"function": building_func},
-    "button_create_lot": {"function": building_func},
-    "button_urgent_message": {"function": building_func},
-    "button_sub_bar": {"function": building_func},
-    "button_notif_all": {"function": building_func},
-    "button_notif_it": {"function": building_func},
-    "button_notif_bar": {"function": building_func},
-    "button_upd_dej": {"function": building_func}
-}
-
-new_menu_storage = {
 "main_menu": {
     "title": "🏠 Главное меню:",
     "access_level": "all",
@@ -292,7 +62,21 @@ new_menu_storage = {
                 "button_create_notif": {
                     "title": "Создать уведомление",
                     "access_level": "admin",
-                    "function": building_func},
+                    "buttons": {
+                        "button_notif_all": {
+                            "title": "Для всех",
+                            "access_level": "admin",
+                            "function": building_func},
+                        "button_notif_it": {
+                            "title": "Для подписчиков IT-отдела",
+                            "access_level": "admin",
+                            "function": building_func},
+                        "button_notif_bar": {
+                            "title": "Для барахолки",
+                            "access_level": "admin",
+                            "function": building_func}
+                    }
+                },
                 "button_vacation": {
                     "title": "📅 Остаток дней отпуска",
                     "access_level": "all",
@@ -344,7 +128,7 @@ new_menu_storage = {
                 "button_all_users": {
                     "name": "Получить список всех пользователей",
                     "access_level": "admin",
-                    "function": building_func},
+                    "function": functions.list_all_users},
                 "button_rights": {
                     "name": "Изменить права пользователя",
                     "access_level": "admin",
@@ -352,43 +136,102 @@ new_menu_storage = {
                         "button_admin": {
                             "name": "Дать пользователю права админа",
                             "access_level": "admin",
-                            "function": building_func},
+                            "function": functions.grant_admin_rights},
                         "button_user": {
                             "name": "Лишить пользователя прав админа",
                             "access_level": "admin",
-                            "function": building_func}
+                            "function": functions.revoke_admin_rights}
                     }
                 }
             }
         }
     }
-}
+},
+"button_registration": {
+    "title": "Зарегистрироваться",
+    "access_level": "all",
+    "hidden": True,
+    "function": functions.register}
 }
 
+menu_graph = MenuGraph(menu_storage, home='main_menu', required=('button_registration',))
 
-# Функция для создания клавиатуры на основе данных из хранилища
-def create_markup(menu_key, user_access_level):
-    menu = menu_storage.get(menu_key)
-    if not menu or "buttons" not in menu:
+
+class FrozenMarkup(types.InlineKeyboardMarkup):
+    """Неизменяемая inline-клавиатура с заранее сериализованным JSON.
+
+    Один экземпляр разделяется между всеми пользователями с одинаковым уровнем доступа, поэтому любые попытки
+    изменить клавиатуру запрещены."""
+
+    def __init__(self, markup):
+        super().__init__(row_width=markup.row_width)
+        self.keyboard = tuple(tuple(row) for row in markup.keyboard)
+        self._dict = markup.to_dict()
+        self._json = json.dumps(self._dict)
+
+    def add(self, *args, **kwargs):
+        raise TypeError("FrozenMarkup нельзя изменять")
+
+    def row(self, *args, **kwargs):
+        raise TypeError("FrozenMarkup нельзя изменять")
+
+    def to_dict(self):
+        return self._dict
+
+    def to_json(self):
+        return self._json
+
+
+ACCESS_LEVELS = ('admin', 'user', None)  # Уровни доступа, для которых клавиатуры собираются при запуске
+
+# (menu_key, access_level) -> FrozenMarkup или None. menu_graph компилируется один раз при импорте, а клавиатура
+# зависит только от уровня доступа, поэтому кэш не меняется до перезапуска процесса: смена прав пользователя лишь
+# выбирает другую клавиатуру из кэша
+_markup_cache = {}
+
+
+def build_markup(menu_key, user_access_level):
+    """Собирает клавиатуру меню menu_key для уровня доступа user_access_level"""
+
+    node = menu_graph.get(menu_key)
+    if node is None or not node.is_menu:
         return None
 
     markup = types.InlineKeyboardMarkup()
-    for buttons, values in menu["buttons"].items():
-        name_button = values['name']
-        access_level = values['access_level']
-
-        if 'callback' in values:
-            callback_data = values['callback']
-            if user_access_level == 'admin':
-                markup.add(types.InlineKeyboardButton(text=name_button, callback_data=callback_data))
-            elif user_access_level == 'user' and access_level == 'all':
-                markup.add(types.InlineKeyboardButton(text=name_button, callback_data=callback_data))
-
-        elif 'url' in values:
-            url = values['url']
-            if user_access_level == 'admin':
-                markup.add(types.InlineKeyboardButton(text=name_button, url=url))
-            elif user_access_level == 'all':
-                markup.add(types.InlineKeyboardButton(text=name_button, url=url))
-
-    return markup
+    for child in node.children:
+        if child.hidden or not child.allows(user_access_level):
+            continue
+        if child.url is not None:
+            markup.add(types.InlineKeyboardButton(text=child.title, url=child.url))
+        else:
+            markup.add(types.InlineKeyboardButton(text=child.title, callback_data=child.callback))
+
+    for name_button, callback_data in menu_graph.navigation(node):
+        markup.add(types.InlineKeyboardButton(text=name_button, callback_data=callback_data))
+
+    return FrozenMarkup(markup)
+
+
+def rebuild_markup_cache():
+    """Заново собирает клавиатуры для всех меню и всех уровней доступа"""
+
+    _markup_cache.clear()
+    for node in menu_graph.nodes:
+        if node.is_menu:
+            for access_level in ACCESS_LEVELS:
+                _markup_cache[(node.callback, access_level)] = build_markup(node.callback, access_level)
+    logger.info("Клавиатуры меню собраны: %s", len(_markup_cache))
+
+
+def create_markup(menu_key, user_access_level):
+    """Возвращает готовую клавиатуру меню для уровня доступа пользователя"""
+
+    key = (menu_key, user_access_level)
+    try:
+        return _markup_cache[key]
+    except KeyError:
+        markup = _markup_cache[key] = build_markup(menu_key, user_access_level)
+        return markup
+
+
+rebuild_markup_cache()
@@ -0,0 +1,160 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LEVELS = ('all', 'admin')  # Допустимые значения access_level в описании меню
+MAX_CALLBACK_BYTES = 64  # Ограничение Telegram на callback_data
+
+
+class MenuGraphError(ValueError):
+    """Ошибка в описании меню, обнаруженная при компиляции"""
+
+
+class MenuNode:
+    """Узел скомпилированного меню: подменю, функция или ссылка"""
+
+    __slots__ = ('index', 'callback', 'title', 'text', 'access_level', 'function', 'url', 'hidden',
+                 'parent', 'children', 'breadcrumbs')
+
+    def __init__(self, index, callback, spec, parent):
+        self.index = index
+        self.callback = callback
+        self.title = spec.get('title') or spec.get('name')
+        self.text = spec.get('text') or (self.title if self.title.endswith(':') else f'{self.title}:')
+        self.access_level = spec.get('access_level', 'all')
+        self.function = spec.get('function')
+        self.url = spec.get('url')
+        self.hidden = spec.get('hidden', False)
+        self.parent = parent
+        self.children = () if 'buttons' in spec else None
+        self.breadcrumbs = (parent.breadcrumbs if parent else ()) + (self.title,)
+
+    @property
+    def is_menu(self):
+        return self.children is not None
+
+    def allows(self, user_access_level):
+        """Проверяет, доступен ли узел пользователю с уровнем доступа user_access_level"""
+
+        if self.url is not None:
+            # Кнопки-ссылки, как и в исходном меню, показываются только администраторам
+            return user_access_level == 'admin'
+        return user_access_level == 'admin' or (user_access_level == 'user' and self.access_level == 'all')
+
+    def __repr__(self):
+        return f'MenuNode({self.callback!r})'
+
+
+class MenuGraph:
+    """Скомпилированное меню: плоская таблица узлов со ссылками на родителя и детей.
+
+    Поиск узла по callback, по названию кнопки и по функции выполняется за O(1), цепочка названий от корня
+    (breadcrumbs) вычисляется один раз при компиляции.
+
+    Использование:
+    graph = MenuGraph(menu_storage, home='main_menu', required=('button_registration',))
+    node = graph.get('button_dej_1')
+
+    required - узлы, которые бот отправляет пользователям сам (например, кнопку регистрации): они должны
+    существовать в меню и доступны по callback_data без проверки прав.
+    """
+
+    def __init__(self, storage, home='main_menu', required=()):
+        self.nodes = []
+        self.entry_points = frozenset(required)  # Узлы, которые бот отправляет сам, в обход клавиатур меню
+        self._by_callback = {}
+        self._by_title = {}
+        self._by_function = {}
+        for callback, spec in storage.items():
+            self._compile(callback, spec, None)
+        self.home = self.get(home)
+        self.validate(required=(home,) + tuple(required))
+        logger.info("Меню скомпилировано: %s узлов", len(self.nodes))
+
+    def _compile(self, callback, spec, parent):
+        if callback in self._by_callback:
+            raise MenuGraphError(f'Callback "{callback}" описан в меню несколько раз')
+        if not (spec.get('title') or spec.get('name')):
+            raise MenuGraphError(f'У узла "{callback}" нет названия')
+
+        node = MenuNode(len(self.nodes), callback, spec, parent)
+        self.nodes.append(node)
+        self._by_callback[callback] = node
+        self._by_title.setdefault(node.title, node)
+        if node.function is not None:
+            self._by_function[node.function] = self._by_function.get(node.function, ()) + (node,)
+
+        if node.is_menu:
+            node.children = tuple(self._compile(child_callback, child_spec, node)
+                                  for child_callback, child_spec in spec['buttons'].items())
+        return node
+
+    def validate(self, required=()):
+        """Проверяет целостность меню. При ошибке выбрасывает MenuGraphError со списком всех проблем."""
+
+        errors = []
+        for callback in required:
+            if callback not in self._by_callback:
+                errors.append(f'callback "{callback}" используется ботом, но отсутствует в меню')
+
+        for node in self.nodes:
+            actions = [action for action in (node.is_menu, node.function is not None, node.url is not None) if action]
+            if len(actions) != 1:
+                errors.append(f'узел "{node.callback}" должен содержать ровно одно из: buttons, function, url')
+            if node.function is not None and not callable(node.function):
+                errors.append(f'function узла "{node.callback}" не является функцией')
+            if node.access_level not in ACCESS_LEVELS:
+                errors.append(f'неизвестный access_level "{node.access_level}" у узла "{node.callback}"')
+            if len(node.callback.encode('utf-8')) > MAX_CALLBACK_BYTES:
+                errors.append(f'callback "{node.callback}" длиннее {MAX_CALLBACK_BYTES} байт')
+
+        if errors:
+            raise MenuGraphError('Ошибки в описании меню:\n' + '\n'.join(errors))
+
+    def get(self, callback):
+        """Возвращает узел по callback или None"""
+
+        return self._by_callback.get(callback)
+
+    def by_title(self, title):
+        """Возвращает узел по названию кнопки или None"""
+
+        return self._by_title.get(title)
+
+    def by_function(self, function):
+        """Возвращает кортеж узлов, вызывающих function"""
+
+        return self._by_function.get(function, ())
+
+    def title_of(self, callback):
+        """Возвращает название кнопки по её callback или None"""
+
+        node = self._by_callback.get(callback)
+        return node.title if node else None
+
+    def permits(self, node, user_access_level):
+        """Может ли пользователь вызвать узел по его callback_data. Точки входа доступны всем, остальные скрытые
+        узлы - никому, прочие - если allows пропускает сам узел и все меню на пути к нему."""
+
+        if node.callback in self.entry_points:
+            return True
+        if node.hidden:
+            return False
+        while node is not None:
+            if not node.allows(user_access_level):
+                return False
+            node = node.parent
+        return True
+
+    def navigation(self, node):
+        """Возвращает кнопки возврата для подменю node: (название, callback)"""
+
+        buttons = []
+        parent = node.parent
+        if parent is not None and parent is not self.home:
+            parent_title = re.sub(r'^\W+', '', parent.title)
+            buttons.append((f'🔙 {parent_title}', parent.callback))
+        if node is not self.home:
+            buttons.append((self.home.title.rstrip(':'), self.home.callback))
+        return buttons
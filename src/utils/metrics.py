@@ -0,0 +1,268 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+# Длительности отдельных операций (БД, 1С, Telegram API) на уровне DEBUG с полями operation и duration_ms
+timing_logger = logging.getLogger('src.utils.metrics.timing')
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Монотонно возрастающий счётчик"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Gauge:
+    """Текущее значение. Если передан callback, значения запрашиваются у него в момент выгрузки метрик:
+    callback возвращает число (для метрики без меток) или словарь {кортеж меток: число}."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def samples(self):
+        if self.callback is None:
+            values = dict(self._values)
+        else:
+            try:
+                values = self.callback()
+            except Exception:
+                logger.exception("Не удалось получить значение метрики %s", self.name)
+                return
+            if not isinstance(values, dict):
+                values = {(): values}
+        for labels, value in values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Распределение длительностей по корзинам"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [счётчики корзин..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def count(self, *labels):
+        """Количество наблюдений с метками labels"""
+
+        with self._lock:
+            data = self._values.get(labels)
+            return data[-1] if data else 0
+
+    @contextmanager
+    def time(self, *labels):
+        """Измеряет длительность блока with"""
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(data)) for labels, data in self._values.items()]
+        for labels, data in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                yield f'{self.name}_bucket', _format_labels(self.labelnames, labels, [('le', bound)]), cumulative
+            yield f'{self.name}_bucket', _format_labels(self.labelnames, labels, [('le', '+Inf')]), data[-1]
+            yield f'{self.name}_sum', _format_labels(self.labelnames, labels), data[-2]
+            yield f'{self.name}_count', _format_labels(self.labelnames, labels), data[-1]
+
+
+class MetricsRegistry:
+    """Реестр метрик и их выгрузка в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+callback_latency = registry.histogram('bot_callback_duration_seconds', 'Длительность обработки callback-запроса',
+                                      ['route'])
+menu_function_latency = registry.histogram('bot_menu_function_duration_seconds', 'Длительность функции меню',
+                                           ['function'])
+db_latency = registry.histogram('bot_db_duration_seconds', 'Длительность метода работы с БД', ['method'])
+db_errors = registry.counter('bot_db_errors_total', 'Исключения в методах работы с БД', ['method'])
+erp_latency = registry.histogram('bot_erp_request_duration_seconds', 'Длительность запроса к 1С', ['method'])
+erp_errors = registry.counter('bot_erp_errors_total', 'Ошибки запросов к 1С', ['method'])
+telegram_latency = registry.histogram('bot_telegram_request_duration_seconds', 'Длительность запроса к Telegram API',
+                                      ['method'])
+telegram_errors = registry.counter('bot_telegram_errors_total', 'Ошибки запросов к Telegram API', ['method'])
+telegram_retries = registry.counter('bot_telegram_retries_total', 'Повторы запросов к Telegram API после ответа 429',
+                                    ['method'])
+
+
+def instrument_methods(histogram, errors, prefix):
+    """Декоратор класса: измеряет длительность и считает исключения всех публичных методов класса"""
+
+    def decorator(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith('_') or not callable(method):
+                continue
+            setattr(cls, name, _instrument(method, histogram, errors, f'{prefix}.{name}'))
+        return cls
+
+    return decorator
+
+
+def _instrument(func, histogram, errors, label):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            errors.inc(label)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            histogram.observe(duration, label)
+            if timing_logger.isEnabledFor(logging.DEBUG):
+                timing_logger.debug("%s: %.1f мс", label, duration * 1000,
+                                    extra={'operation': label, 'duration_ms': round(duration * 1000, 3)})
+
+    return wrapper
+
+
+def instrument_telegram_api():
+    """Оборачивает все запросы telebot к Telegram API измерением длительности и подсчётом ошибок"""
+
+    from telebot import apihelper
+
+    make_request = apihelper._make_request
+    if getattr(make_request, 'instrumented', False):
+        return
+
+    @functools.wraps(make_request)
+    def wrapper(token, method_name, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return make_request(token, method_name, *args, **kwargs)
+        except Exception:
+            telegram_errors.inc(method_name)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            telegram_latency.observe(duration, method_name)
+            if timing_logger.isEnabledFor(logging.DEBUG):
+                timing_logger.debug("Telegram %s: %.1f мс", method_name, duration * 1000,
+                                    extra={'operation': f'telegram.{method_name}',
+                                           'duration_ms': round(duration * 1000, 3)})
+
+    wrapper.instrumented = True
+    apihelper._make_request = wrapper
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics endpoint: " + format, *args)
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Запускает HTTP-сервер с метриками на http://host:port/metrics в отдельном потоке"""
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True)
+    thread.start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,214 @@
+import collections
+import cProfile
+import datetime
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE_FILE_CHARS = re.compile(r'[^\w.-]')
+
+
+class UpdateProfiler:
+    """Выборочное профилирование обработки callback-запросов.
+
+    Доля sample_rate запросов выполняется под cProfile. Для остальных запросов, которые выполняются дольше
+    slow_threshold секунд, стек обрабатывающего потока периодически снимается до завершения обработки (одним общим
+    потоком _StackSampler на все обрабатываемые запросы). Отчёт
+    (callback, пользователь, длительность и самые частые/дорогие кадры) сохраняется в directory, где хранится не
+    больше keep последних отчётов.
+
+    Подключается как middleware маршрутизатора только когда профилирование включено:
+    router.use(profiler.middleware)
+    """
+
+    def __init__(self, directory, sample_rate=0.0, slow_threshold=None, keep=100, top=25, sample_interval=0.01):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.keep = keep
+        self.top = top
+        self.sample_interval = sample_interval
+        self.recent = collections.deque(maxlen=500)  # (длительность, маршрут, user_id, время, файл отчёта)
+        self._lock = threading.Lock()
+        self._sampler = _StackSampler(slow_threshold, sample_interval) if slow_threshold is not None else None
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Создаёт профилировщик из PROFILE_SAMPLE_RATE, PROFILE_SLOW_THRESHOLD и PROFILE_DIR.
+        Возвращает None, если профилирование не включено."""
+
+        sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+        slow_threshold = os.getenv('PROFILE_SLOW_THRESHOLD')
+        if not sample_rate and not slow_threshold:
+            return None
+        return cls(directory=os.getenv('PROFILE_DIR', 'profiles'),
+                   sample_rate=sample_rate,
+                   slow_threshold=float(slow_threshold) if slow_threshold else None)
+
+    def middleware(self, call, route, handler):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self._profile(call, route, handler)
+        return self._watch(call, route, handler)
+
+    def slowest(self, limit=10):
+        """Самые медленные из недавно обработанных запросов"""
+
+        with self._lock:
+            records = list(self.recent)
+        return sorted(records, key=lambda record: record[0], reverse=True)[:limit]
+
+    def _profile(self, call, route, handler):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # В потоке уже работает другой профилировщик
+            return self._watch(call, route, handler)
+        started = time.perf_counter()
+        try:
+            return handler(call)
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(self.top)
+            self._finish(call, route, elapsed, 'cProfile', report.getvalue())
+
+    def _watch(self, call, route, handler):
+        watch = None
+        if self.slow_threshold is not None:
+            watch = self._sampler.watch(threading.get_ident())
+        started = time.perf_counter()
+        try:
+            return handler(call)
+        finally:
+            elapsed = time.perf_counter() - started
+            report = None
+            if watch is not None:
+                self._sampler.unwatch(watch)
+                if watch.samples:
+                    report = watch.report(self.top, self.sample_interval)
+            if report is not None:
+                self._finish(call, route, elapsed, 'stack sampling', report)
+            else:
+                self._remember(elapsed, route, call.from_user.id, None)
+
+    def _finish(self, call, route, elapsed, mode, report):
+        now = datetime.datetime.now()
+        user_id = call.from_user.id
+        # Маршруты вида "users:*" содержат символы, недопустимые в именах файлов Windows
+        route_name = _UNSAFE_FILE_CHARS.sub('_', route.replace('*', ''))
+        file_name = f"{now.strftime('%Y%m%d_%H%M%S_%f')}_{user_id}_{route_name}.txt"
+        path = os.path.join(self.directory, file_name)
+        header = (f'Callback: {call.data}\n'
+                  f'Маршрут: {route}\n'
+                  f'Пользователь: {user_id}\n'
+                  f'Время: {now.isoformat()}\n'
+                  f'Длительность: {elapsed:.3f} сек.\n'
+                  f'Метод: {mode}\n\n')
+        try:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(header + report)
+            self._rotate()
+        except OSError as error:
+            logger.error("Не удалось сохранить профиль %s: %s", path, error)
+            path = None
+        self._remember(elapsed, route, user_id, path)
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            logger.warning("Медленная обработка %s (%.3f сек.), профиль: %s", route, elapsed, path)
+
+    def _remember(self, elapsed, route, user_id, path):
+        with self._lock:
+            self.recent.append((elapsed, route, user_id, datetime.datetime.now(), path))
+
+    def _rotate(self):
+        """Удаляет самые старые отчёты сверх keep"""
+
+        with self._lock:
+            files = sorted(name for name in os.listdir(self.directory) if name.endswith('.txt'))
+            for name in files[:-self.keep]:
+                os.remove(os.path.join(self.directory, name))
+
+
+class _Watch:
+    """Снимки стека одного обрабатываемого запроса"""
+
+    def __init__(self, thread_id, deadline):
+        self.thread_id = thread_id
+        self.deadline = deadline  # time.monotonic(), с которого стек начинает сниматься
+        self.samples = 0
+        self.frames = collections.Counter()
+
+    def add(self, frame):
+        self.samples += 1
+        seen = set()
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, frame.f_lineno, code.co_name)
+            if key not in seen:
+                seen.add(key)
+                self.frames[key] += 1
+            frame = frame.f_back
+
+    def report(self, top, interval):
+        lines = [f'Снимков стека: {self.samples}, интервал {interval} сек.', '',
+                 'доля  кадр']
+        for (file_name, line, function), count in self.frames.most_common(top):
+            lines.append(f'{count / self.samples:5.0%}  {file_name}:{line} {function}')
+        return '\n'.join(lines) + '\n'
+
+
+class _StackSampler:
+    """Общий поток, который снимает стеки наблюдаемых потоков каждые interval секунд, начиная через delay секунд
+    после watch(). Поток запускается при первом вызове watch() и спит, пока нет запросов дольше delay."""
+
+    def __init__(self, delay, interval):
+        self.delay = delay
+        self.interval = interval
+        self._watches = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, thread_id):
+        watch = _Watch(thread_id, time.monotonic() + self.delay)
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='StackSampler', daemon=True)
+                self._thread.start()
+            self._watches.add(watch)
+            self._condition.notify()
+        return watch
+
+    def unwatch(self, watch):
+        """После возврата снимки в watch больше не меняются"""
+
+        with self._condition:
+            self._watches.discard(watch)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._watches:
+                    self._condition.wait()
+                now = time.monotonic()
+                due = [watch for watch in self._watches if watch.deadline <= now]
+                if not due:
+                    self._condition.wait(min(watch.deadline for watch in self._watches) - now)
+                    continue
+                # Снимки делаются под блокировкой, чтобы unwatch() не вернулся посреди записи
+                frames = sys._current_frames()
+                for watch in due:
+                    frame = frames.get(watch.thread_id)
+                    if frame is not None:
+                        watch.add(frame)
+                del frames
+            time.sleep(self.interval)
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from src.utils.metrics import callback_latency
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackRouter:
+    """Декларативный маршрутизатор callback-запросов.
+
+    Обработчики регистрируются по точному ключу (словарь) или по префиксу (префиксное дерево), поэтому стоимость
+    поиска маршрута не зависит от количества зарегистрированных обработчиков. Middleware применяются только к
+    найденным маршрутам; цепочка для маршрута собирается при регистрации маршрута или middleware, поэтому потоки,
+    обрабатывающие обновления, только читают готовые цепочки. Длительность обработки каждого маршрута
+    записывается в метрику bot_callback_duration_seconds и в лог с полями route и duration_ms: на уровне DEBUG, а
+    обработка дольше slow_threshold секунд - на уровне WARNING.
+
+    Использование:
+    router = CallbackRouter()
+
+    @router.route("DELETE")
+    def delete_message(call):
+        ...
+
+    @router.prefix("name_")
+    def choose_name(call):
+        ...
+
+    router.dispatch(call)
+    """
+
+    _HANDLER = object()  # Ключ узла префиксного дерева, под которым хранится обработчик
+
+    def __init__(self, slow_threshold=1.0):
+        self.slow_threshold = slow_threshold
+        self._exact = {}
+        self._trie = {}
+        self._middleware = []
+        self._handlers = {}  # Имя маршрута -> обработчик
+        self._chains = {}  # Имя маршрута -> обработчик, обёрнутый в цепочку middleware
+        self._fallback = None
+
+    def route(self, key):
+        """Декоратор: регистрирует обработчик для точного значения call.data"""
+
+        def decorator(handler):
+            self.add_route(key, handler)
+            return handler
+
+        return decorator
+
+    def prefix(self, prefix):
+        """Декоратор: регистрирует обработчик для call.data, начинающихся с prefix"""
+
+        def decorator(handler):
+            self.add_prefix(prefix, handler)
+            return handler
+
+        return decorator
+
+    def add_route(self, key, handler):
+        """Регистрирует обработчик для точного ключа"""
+
+        self._exact[key] = (key, handler)
+        self._register(key, handler)
+
+    def add_prefix(self, prefix, handler):
+        """Регистрирует обработчик для префикса"""
+
+        if not prefix:
+            raise ValueError("Префикс маршрута не может быть пустым")
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[self._HANDLER] = (prefix + '*', handler)
+        self._register(prefix + '*', handler)
+
+    def fallback(self, handler):
+        """Регистрирует обработчик для callback-запросов, не подошедших ни к одному маршруту.
+        Middleware к нему не применяются."""
+
+        self._fallback = handler
+        return handler
+
+    def use(self, middleware):
+        """Добавляет middleware в конец цепочки.
+
+        middleware(call, route, handler) должен вызвать handler(call), чтобы продолжить обработку,
+        либо вернуть управление, не вызывая его, чтобы прервать цепочку.
+        """
+
+        self._middleware.append(middleware)
+        # Новый словарь подменяет старый целиком, чтобы параллельный dispatch не увидел его частично собранным
+        self._chains = {route: self._chain(route, handler) for route, handler in self._handlers.items()}
+        return middleware
+
+    def resolve(self, data):
+        """Возвращает (имя маршрута, обработчик) для call.data или (None, None), если маршрут не найден"""
+
+        if data is None:
+            return None, None
+
+        found = self._exact.get(data)
+        if found is not None:
+            return found
+
+        found = (None, None)
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(self._HANDLER, found)
+        return found
+
+    def _register(self, route, handler):
+        self._handlers[route] = handler
+        self._chains = {**self._chains, route: self._chain(route, handler)}
+
+    def _chain(self, route, handler):
+        """Собирает цепочку middleware вокруг обработчика маршрута"""
+
+        chain = handler
+        for middleware in reversed(self._middleware):
+            chain = self._wrap(middleware, route, chain)
+        return chain
+
+    @staticmethod
+    def _wrap(middleware, route, handler):
+        def wrapper(call):
+            return middleware(call, route, handler)
+
+        return wrapper
+
+    def dispatch(self, call):
+        """Находит маршрут для call.data и выполняет его обработчик через цепочку middleware"""
+
+        started = time.perf_counter()
+        route, handler = self.resolve(call.data)
+        try:
+            if handler is not None:
+                return self._chains[route](call)
+            route = 'unknown'
+            if self._fallback is not None:
+                return self._fallback(call)
+            logger.warning("Маршрут для callback %r не найден", call.data)
+            return None
+        finally:
+            duration = time.perf_counter() - started
+            callback_latency.observe(duration, route)
+            level = logging.WARNING if duration >= self.slow_threshold else logging.DEBUG
+            if logger.isEnabledFor(level):
+                logger.log(level, "Callback %s обработан за %.1f мс", route, duration * 1000,
+                           extra={'route': route, 'duration_ms': round(duration * 1000, 3)})
+
+
+def rate_limit(max_calls, period, on_reject=None):
+    """Создаёт middleware, ограничивающий количество callback-запросов от одного пользователя:
+    не более max_calls за period секунд. Для лишних запросов вызывается on_reject(call), например чтобы ответить
+    на callback и остановить индикатор загрузки на кнопке. Пользователи без запросов за последние period секунд
+    удаляются из истории раз в period секунд."""
+
+    if max_calls < 1:
+        raise ValueError("max_calls должен быть не меньше 1")
+    history = {}
+    lock = threading.Lock()
+    last_sweep = time.monotonic()
+
+    def middleware(call, route, handler):
+        nonlocal last_sweep
+        now = time.monotonic()
+        with lock:
+            if now - last_sweep > period:
+                for user_id in [user_id for user_id, calls in history.items() if not calls or now - calls[-1] > period]:
+                    del history[user_id]
+                last_sweep = now
+            calls = history.setdefault(call.from_user.id, deque())
+            while calls and now - calls[0] > period:
+                calls.popleft()
+            rejected = len(calls) >= max_calls
+            if not rejected:
+                calls.append(now)
+        if rejected:
+            logger.warning("Превышен лимит запросов пользователем %s (маршрут %s)", call.from_user.id, route)
+            if on_reject is not None:
+                on_reject(call)
+            return None
+        return handler(call)
+
+    return middleware
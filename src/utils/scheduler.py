@@ -0,0 +1,467 @@
+import datetime
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
+
+from src.utils.logger_setup import log_context
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+
+
+def bot_timezone():
+    """Часовой пояс расписания: BOT_TIMEZONE (имя из базы IANA, например Asia/Yekaterinburg) или Europe/Moscow.
+
+    Используется именованный пояс, а не смещение сервера на момент запуска, чтобы расписание учитывало переход на
+    летнее время. Неизвестное имя пояса вызывает ZoneInfoNotFoundError при запуске бота."""
+
+    return ZoneInfo(os.getenv('BOT_TIMEZONE', DEFAULT_TIMEZONE))
+
+
+def _parse_time(at):
+    hour, minute = at.split(':')
+    return int(hour), int(minute)
+
+
+class DailyTrigger:
+    """Каждый день в указанное время, например DailyTrigger('00:00')"""
+
+    def __init__(self, at, tz=None):
+        self.hour, self.minute = _parse_time(at)
+        self.tz = tz or bot_timezone()
+
+    def next_run(self, after):
+        after = after.astimezone(self.tz)
+        run_at = after.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if run_at <= after:
+            run_at = datetime.datetime.combine(run_at.date() + datetime.timedelta(days=1), run_at.timetz())
+        return run_at
+
+
+class RandomDailyTrigger:
+    """Каждый день в случайное время между first_hour:00 и last_hour:59 (время выбирается заново на каждый день)"""
+
+    def __init__(self, first_hour, last_hour=None, tz=None):
+        self.first_hour = first_hour
+        self.last_hour = first_hour if last_hour is None else last_hour
+        self.tz = tz or bot_timezone()
+
+    def next_run(self, after):
+        after = after.astimezone(self.tz)
+        day = after.date()
+        if after.hour > self.last_hour:
+            day += datetime.timedelta(days=1)
+        while True:
+            run_at = datetime.datetime.combine(
+                day,
+                datetime.time(random.randint(self.first_hour, self.last_hour), random.randint(0, 59)),
+                tzinfo=self.tz
+            )
+            if run_at > after:
+                return run_at
+            # Случайное время сегодня уже прошло - переносим на следующий день
+            day += datetime.timedelta(days=1)
+
+
+class MonthlyTrigger:
+    """Каждый месяц в указанный день и время, например MonthlyTrigger(day=1, at='00:00')"""
+
+    def __init__(self, day=1, at='00:00', tz=None):
+        if not 1 <= day <= 28:
+            raise ValueError("День месяца должен быть от 1 до 28, чтобы существовать в любом месяце")
+        self.day = day
+        self.hour, self.minute = _parse_time(at)
+        self.tz = tz or bot_timezone()
+
+    def next_run(self, after):
+        after = after.astimezone(self.tz)
+        year, month = after.year, after.month
+        while True:
+            run_at = datetime.datetime(year, month, self.day, self.hour, self.minute, tzinfo=self.tz)
+            if run_at > after:
+                return run_at
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class IntervalTrigger:
+    """Через каждые seconds секунд"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_run(self, after):
+        return after + datetime.timedelta(seconds=self.seconds)
+
+
+class AdaptivePollTrigger:
+    """Интервал опроса, который подстраивается под рабочее время и активность.
+
+    В рабочие часы и в течение activity_window секунд после замеченной активности опрос идёт с интервалом
+    min_interval. Вне рабочего времени, а также при ошибках источника интервал увеличивается в backoff раз, но не
+    больше max_interval. Следующий запуск рассчитывается после завершения предыдущего, а к началу рабочего времени
+    опрос возвращается к минимальному интервалу.
+
+    Использование:
+    trigger = AdaptivePollTrigger(min_interval=10, max_interval=300, hours='07:00-20:00', days=range(5))
+    ...
+    trigger.report(activity=True)  # в задании после каждого опроса
+    """
+
+    after_completion = True  # Планировщик рассчитывает следующий запуск после завершения задания
+
+    def __init__(self, min_interval, max_interval, hours='00:00-23:59', days=range(7), backoff=2.0,
+                 activity_window=600, tz=None):
+        start, end = hours.split('-')
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.start = datetime.time(*_parse_time(start))
+        self.end = datetime.time(*_parse_time(end))
+        self.days = frozenset(days)
+        self.backoff = backoff
+        self.activity_window = activity_window
+        self.tz = tz or bot_timezone()
+        self.interval = min_interval
+        self.errors = 0
+        self._last_activity = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix, **defaults):
+        """Создаёт триггер из переменных окружения <prefix>_MIN_INTERVAL, <prefix>_MAX_INTERVAL, <prefix>_HOURS
+        (например, 07:00-20:00) и <prefix>_DAYS (номера дней недели через запятую, 0 - понедельник)"""
+
+        params = dict(defaults)
+        for name, convert in (('min_interval', float), ('max_interval', float), ('hours', str),
+                              ('days', lambda value: [int(day) for day in value.split(',')])):
+            value = os.getenv(f'{prefix}_{name.upper()}')
+            if value:
+                params[name] = convert(value)
+        return cls(**params)
+
+    def is_business_time(self, moment):
+        moment = moment.astimezone(self.tz)
+        return moment.weekday() in self.days and self.start <= moment.time() <= self.end
+
+    def report(self, activity=False, error=False):
+        """Сообщает результат опроса: была ли активность и была ли ошибка источника"""
+
+        now = datetime.datetime.now(self.tz)
+        with self._lock:
+            if error:
+                self.errors += 1
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+                return
+            self.errors = 0
+            if activity:
+                self._last_activity = now
+            recently_active = (self._last_activity is not None
+                               and (now - self._last_activity).total_seconds() < self.activity_window)
+            if recently_active or self.is_business_time(now):
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def next_run(self, after):
+        with self._lock:
+            run_at = after + datetime.timedelta(seconds=self.interval)
+        if self.errors or self.interval == self.min_interval:
+            return run_at
+        # Не пропускаем начало рабочего времени из-за длинного интервала простоя
+        business_start = self._next_business_start(after)
+        return min(run_at, business_start) if business_start else run_at
+
+    def _next_business_start(self, after):
+        after = after.astimezone(self.tz)
+        for offset in range(8):
+            day = after.date() + datetime.timedelta(days=offset)
+            start = datetime.datetime.combine(day, self.start, tzinfo=self.tz)
+            if day.weekday() in self.days and start > after:
+                return start
+        return None
+
+
+class Job:
+    """Задание планировщика и статистика его выполнения"""
+
+    def __init__(self, name, func, trigger, catch_up=True, persist=True, timeout=None, allow_overlap=False,
+                 singleton=True):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.catch_up = catch_up
+        self.persist = persist
+        self.timeout = timeout
+        self.allow_overlap = allow_overlap
+        self.singleton = singleton
+        self.next_run = None
+        self.running = 0
+        self.deadline = None  # time.monotonic(), после которого выполнение считается зависшим
+        self.hung = False  # Выполнение превысило timeout и ещё не завершилось
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def stats(self):
+        """Статистика выполнения задания"""
+
+        return {
+            'running': self.running,
+            'hung': self.hung,
+            'runs': self.runs,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'skipped': self.skipped,
+            'last_duration': self.last_duration,
+            'avg_duration': self.total_duration / self.runs if self.runs else 0.0,
+            'max_duration': self.max_duration,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'next_run': self.next_run.isoformat() if self.next_run else None,
+        }
+
+    def __repr__(self):
+        return f'Job({self.name!r}, next_run={self.next_run})'
+
+
+class JobScheduler:
+    """Планировщик регулярных заданий на очереди с приоритетом.
+
+    Поток планировщика спит до ближайшего задания, а не опрашивает расписание каждую секунду. Если задано storage
+    (функция, возвращающая хранилище, например storage.default_storage), время следующего запуска сохраняется в
+    таблицу scheduled_jobs: после перезапуска бота пропущенные запуски выполняются один раз (если у задания
+    catch_up=True), а уже выбранное случайное время не меняется.
+
+    Задания выполняются в пуле из max_workers потоков, поэтому зависшее задание не задерживает остальные. Пока
+    задание выполняется, его очередные запуски пропускаются (если не указано allow_overlap=True). Задание, которое
+    выполняется дольше timeout секунд, отмечается как зависшее в логе и статистике, и до его завершения новые
+    запуски пропускаются даже при allow_overlap=True. Прервать выполнение timeout не может: поток пула нельзя
+    остановить снаружи, поэтому само задание должно ограничивать время своих сетевых запросов и запросов к БД.
+
+    Если передан leader (LeaderElection), задания с singleton=True выполняются только в ведущем процессе. Расписание
+    сохраняет только ведущий, а процесс, ставший ведущим, перечитывает его из общего хранилища и выполняет запуски,
+    пропущенные прежним ведущим. Время запуска заданий с singleton=False в общем хранилище (PostgreSQL) не
+    сохраняется: у каждого процесса оно своё.
+
+    Использование:
+    scheduler = JobScheduler(storage=default_storage)
+    scheduler.add_job('reset_func_stat_day', StatisticsManager().reset_func_stat_day, DailyTrigger('00:00'))
+    scheduler.start()
+    """
+
+    _MAX_SLEEP = 300  # Поток просыпается не реже раза в 5 минут, чтобы учесть перевод системных часов
+
+    def __init__(self, storage=None, max_workers=4, leader=None):
+        self.storage = storage
+        self.leader = leader
+        if leader is not None:
+            leader.on_change = self._on_leadership_change
+        self.jobs = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='Job')
+        self._running = set()
+        self._queue = []  # (next_run, порядковый номер, job)
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def add_job(self, name, func, trigger, catch_up=True, persist=True, timeout=None, allow_overlap=False,
+                singleton=True):
+        """Регистрирует задание. Задания, добавленные после start(), сразу попадают в очередь."""
+
+        if name in self.jobs:
+            raise ValueError(f'Задание "{name}" уже зарегистрировано')
+        job = Job(name, func, trigger, catch_up=catch_up, persist=persist, timeout=timeout,
+                  allow_overlap=allow_overlap, singleton=singleton)
+        self.jobs[name] = job
+        if self._thread is not None:
+            self._push(job, self._first_run(job, self._load_next_runs(), self._now()))
+        return job
+
+    def start(self):
+        """Восстанавливает расписание из БД и запускает поток планировщика"""
+
+        now = self._now()
+        stored = self._load_next_runs()
+        for job in self.jobs.values():
+            self._push(job, self._first_run(job, stored, now))
+
+        self._thread = threading.Thread(target=self._run, name='JobScheduler', daemon=True)
+        self._thread.start()
+        logger.info("Планировщик запущен, заданий: %s", len(self.jobs))
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._pool.shutdown(wait=False)
+
+    def stats(self):
+        """Статистика выполнения всех заданий"""
+
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    def queue_depth(self):
+        """Количество запусков в очереди (включая перепланированные)"""
+
+        return len(self._queue)
+
+    def _first_run(self, job, stored, now):
+        """Время первого запуска задания после старта с учётом сохранённого расписания"""
+
+        next_run = stored.get(job.name) if self._persisted(job) else None
+        if next_run is None:
+            return job.trigger.next_run(now)
+        if next_run <= now:
+            if job.catch_up:
+                logger.warning('Задание "%s" пропущено (%s) и будет выполнено сейчас', job.name, next_run)
+                return now
+            return job.trigger.next_run(now)
+        return next_run
+
+    def _push(self, job, next_run):
+        job.next_run = next_run
+        with self._condition:
+            heapq.heappush(self._queue, (next_run, next(self._counter), job))
+            self._condition.notify()
+        self._save_next_run(job)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    self._check_timeouts()
+                    delay = self._MAX_SLEEP
+                    if self._queue:
+                        delay = min(delay, (self._queue[0][0] - self._now()).total_seconds())
+                        if delay <= 0:
+                            break
+                    deadlines = [job.deadline for job in self._running if job.deadline is not None]
+                    if deadlines:
+                        delay = min(delay, max(min(deadlines) - time.monotonic(), 0) + 0.01)
+                    self._condition.wait(delay)
+                if self._stopped:
+                    return
+                scheduled_at, _, job = heapq.heappop(self._queue)
+                if scheduled_at != job.next_run:
+                    continue  # Запуск был перепланирован
+
+            # Следующий запуск сохраняется до выполнения: после сбоя посреди задания оно не будет запущено повторно
+            now = self._now()
+            standby = self._standby(job)
+            if standby or not getattr(job.trigger, 'after_completion', False):
+                self._push(job, job.trigger.next_run(now))
+            if standby:
+                logger.debug('Задание "%s" пропущено: процесс не является ведущим', job.name)
+                continue
+            self._dispatch(job, (now - scheduled_at).total_seconds())
+
+    def _dispatch(self, job, lag):
+        """Передаёт задание в пул потоков, если предыдущий запуск уже завершён"""
+
+        with self._condition:
+            if job.running and (job.hung or not job.allow_overlap):
+                job.skipped += 1
+                logger.warning('Задание "%s" ещё выполняется%s, запуск пропущен', job.name,
+                               ' и считается зависшим' if job.hung else '')
+                return
+            job.running += 1
+            job.last_lag = lag
+            job.max_lag = max(job.max_lag, lag)
+            if job.timeout is not None and job.deadline is None:
+                # При allow_overlap срок отсчитывается от самого раннего незавершённого запуска
+                job.deadline = time.monotonic() + job.timeout
+                self._running.add(job)
+        self._pool.submit(self._execute, job)
+
+    def _execute(self, job):
+        logger.debug('Запуск задания "%s"', job.name)
+        started = time.perf_counter()
+        try:
+            with log_context(job=job.name):
+                job.func()
+        except Exception:
+            job.failures += 1
+            logger.exception('Ошибка при выполнении задания "%s"', job.name)
+        finally:
+            duration = time.perf_counter() - started
+            logger.debug('Задание "%s" выполнено за %.1f мс', job.name, duration * 1000,
+                         extra={'job': job.name, 'duration_ms': round(duration * 1000, 3)})
+            with self._condition:
+                job.running -= 1
+                job.runs += 1
+                job.last_duration = duration
+                job.total_duration += duration
+                job.max_duration = max(job.max_duration, duration)
+                if not job.running:
+                    job.deadline = None
+                    self._running.discard(job)
+                    if job.hung:
+                        job.hung = False
+                        logger.warning('Зависшее задание "%s" завершилось через %.1f сек.', job.name, duration)
+            if getattr(job.trigger, 'after_completion', False) and not self._stopped:
+                self._push(job, job.trigger.next_run(self._now()))
+
+    def _check_timeouts(self):
+        """Отмечает задания, превысившие timeout, как зависшие: их новые запуски пропускаются, пока выполнение не
+        завершится. Само выполнение не прерывается. Вызывается под блокировкой."""
+
+        now = time.monotonic()
+        for job in list(self._running):
+            if job.deadline is not None and job.deadline <= now:
+                job.timeouts += 1
+                job.deadline = None
+                job.hung = True
+                self._running.discard(job)
+                logger.error('Задание "%s" выполняется дольше %s сек. и считается зависшим', job.name, job.timeout)
+
+    def _standby(self, job):
+        """Задание-синглтон не выполняется в процессе, который не является ведущим"""
+
+        return job.singleton and self.leader is not None and not self.leader.is_leader
+
+    def _on_leadership_change(self, leader):
+        """Став ведущим, процесс продолжает расписание с того места, где его оставил прежний ведущий"""
+
+        if not leader or self._thread is None:
+            return
+        now = self._now()
+        stored = self._load_next_runs()
+        for job in self.jobs.values():
+            if job.singleton and self._persisted(job) and job.name in stored:
+                next_run = self._first_run(job, stored, now)
+                if next_run != job.next_run:
+                    self._push(job, next_run)
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().astimezone()
+
+    def _persisted(self, job):
+        """Сохраняется ли время запуска задания"""
+
+        return (self.storage is not None and job.persist
+                and (job.singleton or not self.storage().shared))
+
+    def _load_next_runs(self):
+        if self.storage is None:
+            return {}
+        return {name: datetime.datetime.fromisoformat(next_run)
+                for name, next_run in self.storage().job_runs().items()}
+
+    def _save_next_run(self, job):
+        if self._persisted(job) and not self._standby(job):
+            self.storage().set_job_run(job.name, job.next_run.isoformat())
@@ -7,7 +7,10 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
+    # Путь к SQLite-базе бота, sqlite:///путь или :memory: (см. storage.database_location)
     DATABASE_URL = os.getenv('DATABASE_URL')
+    # База статистики в том же формате; по умолчанию <основная база>_stats.db рядом с основной
+    STATS_DATABASE_URL = os.getenv('STATS_DATABASE_URL')
 
 
 class DevelopmentConfig(Config):
@@ -18,13 +21,7 @@ class ProductionConfig(Config):
     DEBUG = False
 
 
-logger = logging.getLogger("ConfigLogger")
-if not logger.hasHandlers():
-    logger.setLevel(logging.INFO)
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - [%(levelname)s] - %(name)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+logger = logging.getLogger(__name__)
 
 config = {
     'development': DevelopmentConfig,
@@ -33,4 +30,4 @@ config = {
 }
 
 # Log the active configuration
-logger.info(f"Active configuration loaded: {config['default'].__name__}")
+logger.info("Active configuration loaded: %s", config['default'].__name__)
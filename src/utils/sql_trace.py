@@ -0,0 +1,176 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r'\s+')
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+
+def normalize(sql):
+    """Приводит запрос к шаблону: литералы заменяются на ?, пробелы схлопываются.
+    Запросы, в которые значения подставлены f-строкой, попадают в одну строку статистики."""
+
+    return _SPACES.sub(' ', _LITERALS.sub('?', sql)).strip()
+
+
+class _StatementStats:
+    __slots__ = ('count', 'total', 'rows', 'durations')
+
+    def __init__(self, samples):
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+        self.durations = deque(maxlen=samples)
+
+    def p95(self):
+        durations = sorted(self.durations)
+        return durations[int(len(durations) * 0.95)] if durations else 0.0
+
+
+class SqlTracer:
+    """Статистика SQL-запросов: количество, суммарное время, p95 и число строк по каждому шаблону запроса.
+    Запросы дольше slow_threshold секунд пишутся в лог вместе с EXPLAIN QUERY PLAN."""
+
+    def __init__(self, slow_threshold=0.1, samples=1000):
+        self.slow_threshold = slow_threshold
+        self.samples = samples
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, duration, rows):
+        key = normalize(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _StatementStats(self.samples)
+            stats.count += 1
+            stats.total += duration
+            stats.rows += max(rows, 0)
+            stats.durations.append(duration)
+
+    def slow_query(self, connection, sql, parameters, duration):
+        plan = ''
+        if sql.lstrip().upper().startswith(_EXPLAINABLE):
+            try:
+                cursor = sqlite3.Connection.cursor(connection, sqlite3.Cursor)
+                rows = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+                plan = ''.join(f'\n  {row[-1]}' for row in rows)
+            except sqlite3.Error as error:
+                plan = f'\n  не удалось получить план: {error}'
+        logger.warning("Медленный запрос (%.1f мс): %s%s", duration * 1000, normalize(sql), plan,
+                       extra={'duration_ms': round(duration * 1000, 3)})
+
+    def snapshot(self):
+        """[(шаблон, количество, суммарное время, p95, строк)] по убыванию суммарного времени"""
+
+        with self._lock:
+            rows = [(key, stats.count, stats.total, stats.p95(), stats.rows) for key, stats in self._stats.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def summary(self, limit=15):
+        """Текстовая сводка самых затратных запросов"""
+
+        rows = self.snapshot()
+        if not rows:
+            return 'SQL-запросов не зафиксировано.'
+        total = sum(row[2] for row in rows) or 1
+        lines = [f'SQL: {len(rows)} шаблонов, {sum(row[1] for row in rows)} запросов, {total * 1000:.0f} мс всего']
+        for key, count, duration, p95, returned in rows[:limit]:
+            lines.append(f'{duration / total:4.0%} {count}× всего {duration * 1000:.1f} мс, p95 {p95 * 1000:.2f} мс, '
+                         f'строк {returned}: {key[:200]}')
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Курсор, измеряющий каждый запрос. Результат SELECT выбирается целиком сразу при execute(), чтобы в
+    длительность и число строк попала вся работа запроса, поэтому трассировка предназначена для отладки."""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._buffer = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        if self.description is not None:
+            self._buffer = deque(super().fetchall())
+            rows = len(self._buffer)
+        else:
+            self._buffer = None
+            rows = self.rowcount
+        self._traced(sql, parameters, time.perf_counter() - started, rows)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._buffer = None
+        self._traced(sql, None, time.perf_counter() - started, self.rowcount)
+        return self
+
+    def _traced(self, sql, parameters, duration, rows):
+        sql_tracer.record(sql, duration, rows)
+        if duration >= sql_tracer.slow_threshold and parameters is not None:
+            sql_tracer.slow_query(self.connection, sql, parameters, duration)
+
+    def fetchone(self):
+        if self._buffer is None:
+            return super().fetchone()
+        return self._buffer.popleft() if self._buffer else None
+
+    def fetchmany(self, size=None):
+        if self._buffer is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        size = self.arraysize if size is None else size
+        return [self._buffer.popleft() for _ in range(min(size, len(self._buffer)))]
+
+    def fetchall(self):
+        if self._buffer is None:
+            return super().fetchall()
+        rows, self._buffer = list(self._buffer), deque()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    """Соединение, все запросы которого выполняются через TracedCursor"""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(database, **kwargs):
+    """sqlite3.connect, который при SQL_TRACE=True возвращает трассируемое соединение"""
+
+    if enabled:
+        kwargs.setdefault('factory', TracedConnection)
+    return sqlite3.connect(database, **kwargs)
+
+
+enabled = os.getenv('SQL_TRACE') == 'True'
+sql_tracer = SqlTracer(slow_threshold=float(os.getenv('SQL_SLOW_MS', 100)) / 1000)
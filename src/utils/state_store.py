@@ -0,0 +1,195 @@
+import datetime
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value):
+    """Преобразует даты в JSON-совместимый вид"""
+
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'__date__': value.isoformat()}
+    raise TypeError(f'Значение типа {type(value).__name__} нельзя сохранить в состоянии диалога')
+
+
+def _decode(obj):
+    """Восстанавливает даты, сохранённые _encode"""
+
+    if '__datetime__' in obj:
+        return datetime.datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return datetime.date.fromisoformat(obj['__date__'])
+    return obj
+
+
+class ConversationStore:
+    """Хранилище состояния многошаговых диалогов (календарь -> выбор имени -> запись дежурства).
+
+    Состояние пользователя - словарь с JSON-совместимыми значениями (даты допускаются). Записи удаляются через ttl
+    секунд после последнего изменения, а при превышении max_size вытесняются самые давно изменённые.
+
+    Если задано storage (функция, возвращающая хранилище, например storage.default_storage), состояние
+    дублируется в таблицу conversation_state и переживает перезапуск бота. С базой SQLite одного сервера
+    сохранённые состояния загружаются в память при запуске, и дальше чтение идёт только из памяти. С общим
+    хранилищем (PostgreSQL) состояние читается из хранилища при каждом get(): следующее сообщение пользователя
+    может обработать другой экземпляр бота. Отсутствие состояния, найденное active(), запоминается на
+    absent_ttl секунд, чтобы обычные текстовые сообщения не обращались к БД каждый раз.
+
+    Использование:
+    with user_data.lock(user_id):
+        state = user_data.get(user_id) or {}
+        user_data.update(user_id, first_date=date)
+    """
+
+    _LOCK_STRIPES = 64  # Количество блокировок, между которыми распределяются пользователи
+
+    def __init__(self, ttl=60 * 60, max_size=10_000, storage=None, absent_ttl=5.0):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.storage = storage
+        self.absent_ttl = absent_ttl
+        self._states = OrderedDict()  # user_id -> (expires_at, state), от самых старых к самым новым
+        self._absent = {}  # user_id -> time.monotonic(), до которого состояние считается отсутствующим
+        self._lock = threading.Lock()
+        self._user_locks = [threading.RLock() for _ in range(self._LOCK_STRIPES)]
+        self.evicted = 0
+        self.expired = 0
+        self._shared = storage is not None and storage().shared
+        if storage is not None:
+            storage().purge_conversations(time.time())
+            if not self._shared:
+                self._load_all()
+
+    @contextmanager
+    def lock(self, user_id):
+        """Блокировка состояния пользователя на время многошаговой операции"""
+
+        with self._user_locks[hash(user_id) % self._LOCK_STRIPES]:
+            yield
+
+    def get(self, user_id):
+        """Возвращает копию состояния пользователя или None"""
+
+        if self._shared:
+            entry = self._load(user_id)
+        else:
+            with self._lock:
+                entry = self._states.get(user_id)
+        if entry is None:
+            return None
+
+        expires_at, state = entry
+        if expires_at < time.time():
+            self.expired += 1
+            self.pop(user_id)
+            return None
+        return dict(state)
+
+    def update(self, user_id, **fields):
+        """Дополняет состояние пользователя полями fields и продлевает его жизнь на ttl"""
+
+        with self.lock(user_id):
+            state = self.get(user_id) or {}
+            state.update(fields)
+            self._set(user_id, state)
+        return dict(state)
+
+    def pop(self, user_id):
+        """Удаляет состояние пользователя и возвращает его (или None)"""
+
+        with self._lock:
+            entry = self._states.pop(user_id, None)
+        if self.storage is not None:
+            self.storage().delete_conversations([user_id])
+        return entry[1] if entry else None
+
+    def active(self, user_id):
+        """Есть ли у пользователя неистёкшее состояние. Подходит для обработчиков, вызываемых на каждое сообщение:
+        без общего хранилища проверяется только память, а с общим хранилищем отрицательный ответ кэшируется на
+        absent_ttl секунд. Состояние, созданное за это время другим экземпляром бота, может быть не замечено."""
+
+        if self._shared:
+            now = time.monotonic()
+            if self._absent.get(user_id, 0.0) > now:
+                return False
+            if self.get(user_id) is not None:
+                return True
+            with self._lock:
+                if len(self._absent) >= self.max_size:
+                    self._absent = {key: until for key, until in self._absent.items() if until > now}
+                    if len(self._absent) >= self.max_size:
+                        self._absent.clear()
+                self._absent[user_id] = now + self.absent_ttl
+            return False
+        with self._lock:
+            entry = self._states.get(user_id)
+        return entry is not None and entry[0] >= time.time()
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        return len(self._states)
+
+    def stats(self):
+        """Метрики хранилища: размер, количество вытесненных и истёкших записей"""
+
+        return {'size': len(self._states), 'evicted': self.evicted, 'expired': self.expired}
+
+    def _set(self, user_id, state):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._absent.pop(user_id, None)
+            self._states[user_id] = (expires_at, state)
+            self._states.move_to_end(user_id)
+            removed = self._evict()
+        if self.storage is not None:
+            storage = self.storage()
+            storage.put_conversation(user_id, json.dumps(state, default=_encode), expires_at)
+            # В общем хранилище память - лишь кэш, и вытеснение из неё не удаляет чужие состояния
+            if removed and not self._shared:
+                storage.delete_conversations(removed)
+
+    def _evict(self):
+        """Удаляет из памяти истёкшие записи и самые старые записи сверх max_size. Вызывается под блокировкой и
+        возвращает список удалённых user_id: строки в БД удаляет вызывающий код уже после снятия блокировки."""
+
+        now = time.time()
+        removed = []
+        while self._states:
+            user_id, (expires_at, _) = next(iter(self._states.items()))
+            if expires_at < now:
+                self.expired += 1
+            elif len(self._states) > self.max_size:
+                self.evicted += 1
+            else:
+                break
+            self._states.popitem(last=False)
+            removed.append(user_id)
+        return removed
+
+    def _load_all(self):
+        """Загружает в память сохранённые неистёкшие состояния, не больше max_size самых свежих"""
+
+        rows = self.storage().conversations(time.time(), self.max_size)
+        with self._lock:
+            for user_id, data, expires_at in reversed(rows):
+                self._states[user_id] = (expires_at, json.loads(data, object_hook=_decode))
+
+    def _load(self, user_id):
+        """Читает состояние пользователя из хранилища и обновляет им память"""
+
+        row = self.storage().get_conversation(user_id, time.time())
+        with self._lock:
+            if row is None:
+                self._states.pop(user_id, None)
+                return None
+            entry = self._states[user_id] = (row[1], json.loads(row[0], object_hook=_decode))
+        return entry
@@ -0,0 +1,765 @@
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+from src.utils import sql_trace
+from src.utils.settings import Config
+
+try:
+    import psycopg2
+    import psycopg2.pool
+except ImportError:  # PostgreSQL нужен только при DATABASE_URL=postgresql://...
+    psycopg2 = None
+
+logger = logging.getLogger(__name__)
+
+# База в памяти, общая для всех соединений процесса. VFS memdb (SQLite 3.36+) блокирует как обычный файл и
+# учитывает timeout; в старых версиях используется общий кэш, в котором конкурирующие записи сразу получают ошибку.
+if sqlite3.sqlite_version_info >= (3, 36, 0):
+    MEMORY_DATABASE = 'file:/{0}?vfs=memdb'
+else:
+    MEMORY_DATABASE = 'file:{0}?mode=memory&cache=shared'
+
+SETTINGS = ('news', 'baraholka', 'rights', 'use_bot')
+STAT_PERIODS = ('today', 'month', 'all_time')
+# Таблицы для выгрузки администраторам: {таблица: (колонки, таблица в хранилище статистики)}
+EXPORT_TABLES = {
+    'users': (('user_id', 'user_first_name', 'user_last_name', 'username', 'date_registration'), False),
+    'setting_users': (('user_id', 'user_first_name', 'user_last_name', 'news', 'baraholka', 'rights', 'use_bot'),
+                      False),
+    'user_statistics': (('user_id', 'today', 'month', 'all_time'), True),
+    'function_statistics': (('name', 'today', 'month', 'all_time'), True),
+}
+
+_memory_anchors = {}
+_memory_lock = threading.Lock()
+_postgres_storages = {}
+_postgres_lock = threading.Lock()
+
+
+def is_postgres_url(url):
+    return bool(url) and url.startswith(('postgres://', 'postgresql://'))
+
+
+def database_location(url, name='telegram_bot'):
+    """Переводит DATABASE_URL в аргумент sqlite3.connect.
+
+    Поддерживаются путь к файлу, sqlite:///относительный/путь, sqlite:////абсолютный/путь и :memory: (или
+    sqlite:///:memory:) для базы в памяти. Пустое значение - файл name.db рядом с пакетом utils."""
+
+    if not url:
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{name}.db')
+    if url.startswith('sqlite://'):
+        url = url[len('sqlite://'):]
+        url = url[1:] if url.startswith('/') else url
+    if url in (':memory:', ''):
+        return MEMORY_DATABASE.format(name)
+    if url.startswith('file:'):
+        return url
+    return os.path.expanduser(url)
+
+
+def is_memory_database(database):
+    return database.startswith('file:') and ('mode=memory' in database or 'vfs=memdb' in database)
+
+
+def default_db_path():
+    """Возвращает путь к SQLite-базе бота из Config.DATABASE_URL. Если данные хранятся в PostgreSQL, это
+    локальная база процесса: расписание заданий и состояние диалогов в этом случае хранятся в PostgreSQL."""
+
+    url = Config.DATABASE_URL
+    return database_location(None if is_postgres_url(url) else url)
+
+
+def default_stats_db_path():
+    """Возвращает путь к базе статистики из Config.STATS_DATABASE_URL, по умолчанию - рядом с основной базой"""
+
+    if Config.STATS_DATABASE_URL:
+        return database_location(Config.STATS_DATABASE_URL, 'telegram_bot_stats')
+    return stats_location(default_db_path())
+
+
+def stats_location(database):
+    """База статистики рядом с основной базой database: файл <имя>_stats.db (для URI file: - URI этого файла с
+    теми же параметрами) или отдельная база в памяти"""
+
+    if is_memory_database(database):
+        return MEMORY_DATABASE.format('telegram_bot_stats')
+    database, _, query = database.partition('?')
+    root, ext = os.path.splitext(database)
+    if query:
+        # Файла статистики может ещё не быть, поэтому режим открытия (mode=ro/rw) основной базы не переносится
+        query = '&'.join(param for param in query.split('&') if not param.startswith('mode='))
+    return f'{root}_stats{ext or ".db"}' + (f'?{query}' if query else '')
+
+
+def sqlite_databases():
+    """SQLite-базы процесса для резервного копирования и обслуживания: {имя: путь}"""
+
+    if is_postgres_url(Config.DATABASE_URL):
+        return {'local': default_db_path()}
+    return {'main': default_db_path(), 'stats': default_stats_db_path()}
+
+
+def connect(database, **kwargs):
+    """sqlite3.connect с поддержкой URI file:. Пока процесс работает, база в памяти удерживается отдельным
+    соединением: иначе она исчезает при закрытии последнего соединения, а бот открывает их на каждую операцию."""
+
+    if database.startswith('file:'):
+        kwargs['uri'] = True
+        if is_memory_database(database):
+            with _memory_lock:
+                if database not in _memory_anchors:
+                    _memory_anchors[database] = sqlite3.connect(database, uri=True, check_same_thread=False)
+    return sql_trace.connect(database, **kwargs)
+
+
+def default_storage():
+    """Хранилище по Config.DATABASE_URL: PostgreSQL для postgresql://..., иначе SQLite.
+    Хранилище PostgreSQL с пулом соединений одно на процесс, SQLite открывает соединение на каждую операцию."""
+
+    url = Config.DATABASE_URL
+    if not is_postgres_url(url):
+        return SqliteStorage()
+    with _postgres_lock:
+        storage = _postgres_storages.get(url)
+        if storage is None:
+            storage = _postgres_storages[url] = PostgresStorage(url,
+                                                                min_connections=int(os.getenv('DB_POOL_MIN', 1)),
+                                                                max_connections=int(os.getenv('DB_POOL_MAX', 10)))
+        return storage
+
+
+class DuplicateError(Exception):
+    """Запись нарушает уникальность (например, дата дежурства уже занята)"""
+
+
+class Storage:
+    """Хранилище данных бота: пользователи и их настройки, график дежурств, события, последний проход через
+    двери и статистика. Запросы написаны на общем для SQLite и PostgreSQL подмножестве SQL с параметрами '?';
+    наследники отвечают за соединения, схему и различия диалектов.
+
+    Использование:
+    with storage.transaction() as tx:
+        row = tx.execute('SELECT rights FROM setting_users WHERE user_id = ?', (user_id,)).fetchone()
+    """
+
+    errors = ()  # Исключения драйвера базы данных
+    integrity_errors = ()
+    settings_by_trigger = False  # Строку setting_users при регистрации создаёт триггер базы
+    location = None  # База хранилища: путь SQLite или URL PostgreSQL
+    shared = False  # Хранилище общее для экземпляров бота на разных серверах
+    counts_ttl = 60  # Сколько секунд user_counts() отдаёт сохранённый агрегат
+
+    _counts = {}  # location -> (момент расчёта, счётчики пользователей)
+    _counts_lock = threading.Lock()
+
+    # Строки списка и поиска пользователей: (user_id, имя, фамилия, username, права)
+    user_rows = ('SELECT u.user_id, u.user_first_name, u.user_last_name, u.username, s.rights FROM users u '
+                 'LEFT JOIN setting_users s ON s.user_id = u.user_id ')
+
+    @contextmanager
+    def transaction(self, stats=False, timeout=None):
+        """Транзакция, в которой выполняются запросы: tx.execute(query, params) возвращает курсор.
+        stats=True - транзакция в хранилище статистики."""
+
+        raise NotImplementedError
+
+    def execute(self, query, params=(), timeout=None):
+        """Выполняет запрос в отдельной транзакции и возвращает первую строку результата"""
+
+        with self.transaction(timeout=timeout) as tx:
+            cursor = tx.execute(query, params)
+            return cursor.fetchone() if cursor.description is not None else None
+
+    # Пользователи и настройки
+
+    def user_exists(self, user_id):
+        with self.transaction() as tx:
+            return tx.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,)).fetchone() is not None
+
+    def add_user(self, user_id, first_name, last_name, username, date_registration):
+        """Регистрирует пользователя. Возвращает False, если он уже зарегистрирован."""
+
+        with self.transaction() as tx:
+            inserted = tx.execute('INSERT INTO users (user_id, user_first_name, user_last_name, username, '
+                                  'date_registration) VALUES (?, ?, ?, ?, ?) ON CONFLICT (user_id) DO NOTHING',
+                                  (user_id, first_name, last_name, username, date_registration)).rowcount
+            if inserted and not self.settings_by_trigger:
+                tx.execute('INSERT INTO setting_users (user_id, user_first_name, user_last_name) VALUES (?, ?, ?)',
+                           (user_id, first_name, last_name))
+        if inserted:
+            self._invalidate_counts()
+        return bool(inserted)
+
+    def get_setting(self, user_id, column):
+        """Значение настройки column пользователя или None, если пользователь не найден"""
+
+        column = self._checked(column, SETTINGS)
+        with self.transaction() as tx:
+            row = tx.execute(f'SELECT {column} FROM setting_users WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, user_id, column, value):
+        column = self._checked(column, SETTINGS)
+        with self.transaction() as tx:
+            tx.execute(f'UPDATE setting_users SET {column} = ? WHERE user_id = ?', (value, user_id))
+        if column in ('rights', 'use_bot'):
+            self._invalidate_counts()
+
+    def user_ids(self, focus_group='all'):
+        """user_id активных пользователей группы: all, news или baraholka"""
+
+        condition = {'all': '', 'news': " AND news = 'True'", 'baraholka': " AND baraholka = 'True'"}[focus_group]
+        with self.transaction() as tx:
+            rows = tx.execute(f"SELECT user_id FROM setting_users WHERE use_bot = 'True'{condition}").fetchall()
+        return [row[0] for row in rows]
+
+    # Список пользователей. Страницы выбираются по ключу user_id, а не через OFFSET: любая страница - это поиск по
+    # индексу и limit строк, сколько бы пользователей ни было до неё
+
+    def users_page(self, after=None, before=None, limit=20):
+        """Страница пользователей по возрастанию user_id: ([(user_id, имя, фамилия, username, права)], есть ли ещё).
+        after - страница после этого user_id, before - страница перед ним; без них - начало списка. Выбирается
+        limit + 1 строка: лишняя показывает, что в этом направлении есть ещё страница."""
+
+        query = self.user_rows
+        if before is not None:
+            query, params = query + 'WHERE u.user_id < ? ORDER BY u.user_id DESC LIMIT ?', (before, limit + 1)
+        elif after is not None:
+            query, params = query + 'WHERE u.user_id > ? ORDER BY u.user_id LIMIT ?', (after, limit + 1)
+        else:
+            query, params = query + 'ORDER BY u.user_id LIMIT ?', (limit + 1,)
+        with self.transaction() as tx:
+            rows = [tuple(row) for row in tx.execute(query, params).fetchall()]
+        page = rows[:limit]
+        if before is not None:
+            page.reverse()
+        return page, len(rows) > limit
+
+    def search_users(self, text, limit=10):
+        """Пользователи, у которых имя, фамилия или username начинаются со слов text (все слова должны найтись),
+        или пользователь с user_id = text. Строки как в users_page()."""
+
+        text = text.strip().lstrip('@')
+        if text.isdigit():
+            with self.transaction() as tx:
+                return [tuple(row) for row in tx.execute(self.user_rows + 'WHERE u.user_id = ?',
+                                                         (int(text),)).fetchall()]
+        words = [word for word in text.replace('@', ' ').split() if any(char.isalnum() for char in word)]
+        if not words:
+            return []
+        return self._search_names(words, limit)
+
+    def _search_names(self, words, limit):
+        """Поиск по началу имени, фамилии и username: lower(колонка) LIKE 'слово%'. В PostgreSQL для этих
+        выражений есть индексы text_pattern_ops, поэтому поиск не просматривает всю таблицу."""
+
+        conditions, params = [], []
+        for word in words:
+            pattern = word.lower().replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+            conditions.append("(lower(u.user_first_name) LIKE ? ESCAPE '!' OR lower(u.user_last_name) LIKE ? "
+                              "ESCAPE '!' OR lower(u.username) LIKE ? ESCAPE '!')")
+            params += [pattern] * 3
+        with self.transaction() as tx:
+            return [tuple(row) for row in tx.execute(
+                f"{self.user_rows}WHERE {' AND '.join(conditions)} ORDER BY u.user_id LIMIT ?",
+                (*params, limit)).fetchall()]
+
+    def user_counts(self):
+        """Число пользователей: {'total': всего, 'active': не заблокировали бота, 'admins': администраторов}.
+        Агрегат пересчитывается не чаще раза в counts_ttl секунд и после регистрации или смены прав и статуса
+        через хранилище этого процесса, поэтому листание списка не считает COUNT(*) по всей таблице."""
+
+        cached = self._counts.get(self.location)
+        if cached is not None and time.monotonic() - cached[0] < self.counts_ttl:
+            return cached[1]
+        with self.transaction() as tx:
+            total, active, admins = tx.execute(
+                "SELECT COUNT(*), COALESCE(SUM(CASE WHEN use_bot = 'True' THEN 1 ELSE 0 END), 0), "
+                "COALESCE(SUM(CASE WHEN rights = 'admin' THEN 1 ELSE 0 END), 0) FROM setting_users").fetchone()
+        counts = {'total': int(total), 'active': int(active), 'admins': int(admins)}
+        with self._counts_lock:
+            self._counts[self.location] = (time.monotonic(), counts)
+        return counts
+
+    def _invalidate_counts(self):
+        with self._counts_lock:
+            self._counts.pop(self.location, None)
+
+    # График дежурств. Даты хранятся строками ГГГГ-ММ-ДД, поэтому сравниваются как строки
+
+    def add_duty(self, first_date, last_date, name):
+        try:
+            with self.transaction() as tx:
+                tx.execute('INSERT INTO duty_schedule (first_date, last_date, user_first_name) VALUES (?, ?, ?)',
+                           (first_date, last_date, name))
+        except self.integrity_errors as error:
+            raise DuplicateError(str(error)) from error
+
+    def next_duties(self, from_date, limit):
+        """[(первый день, последний день, дежурный)] с from_date по возрастанию"""
+
+        with self.transaction() as tx:
+            return [tuple(row) for row in tx.execute(
+                'SELECT first_date, last_date, user_first_name FROM duty_schedule WHERE first_date >= ? '
+                'ORDER BY first_date LIMIT ?', (from_date, limit)).fetchall()]
+
+    def duty_starting_on(self, date):
+        with self.transaction() as tx:
+            row = tx.execute('SELECT first_date, last_date, user_first_name FROM duty_schedule WHERE first_date = ?',
+                             (date,)).fetchone()
+        return tuple(row) if row else None
+
+    # События и проходы через двери
+
+    def events_on(self, date):
+        with self.transaction() as tx:
+            return [tuple(row) for row in tx.execute(
+                'SELECT date, text_event FROM events WHERE substr(date, 1, 10) = ?', (date,)).fetchall()]
+
+    def get_checkpoint(self):
+        with self.transaction() as tx:
+            row = tx.execute('SELECT last_checkpoint FROM in_out ORDER BY id LIMIT 1').fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, checkpoint):
+        with self.transaction() as tx:
+            updated = tx.execute('UPDATE in_out SET last_checkpoint = ? WHERE id = (SELECT MIN(id) FROM in_out)',
+                                 (checkpoint,)).rowcount
+            if not updated:
+                tx.execute('INSERT INTO in_out (last_checkpoint) VALUES (?)', (checkpoint,))
+
+    # Данные inline-кнопок (src.utils.callback_registry). Срок жизни - время Unix, общее для всех процессов
+
+    def put_callback(self, data, payload, expires_at):
+        with self.transaction() as tx:
+            tx.execute('INSERT INTO callback_data (data, payload, expires_at) VALUES (?, ?, ?)',
+                       (data, payload, expires_at))
+
+    def get_callback(self, data, now):
+        """(payload, expires_at) или None, если запись не найдена или устарела"""
+
+        with self.transaction() as tx:
+            row = tx.execute('SELECT payload, expires_at FROM callback_data WHERE data = ? AND expires_at >= ?',
+                             (data, now)).fetchone()
+        return tuple(row) if row else None
+
+    def delete_callback(self, data):
+        with self.transaction() as tx:
+            tx.execute('DELETE FROM callback_data WHERE data = ?', (data,))
+
+    def purge_callbacks(self, now):
+        """Удаляет устаревшие записи. Возвращает их количество."""
+
+        with self.transaction() as tx:
+            return tx.execute('DELETE FROM callback_data WHERE expires_at < ?', (now,)).rowcount
+
+    # Расписание регулярных заданий (src.utils.scheduler): время следующего запуска в формате ISO 8601
+
+    def job_runs(self):
+        """{имя задания: время следующего запуска}"""
+
+        with self.transaction() as tx:
+            return {name: next_run for name, next_run in tx.execute('SELECT name, next_run FROM scheduled_jobs')}
+
+    def set_job_run(self, name, next_run):
+        with self.transaction() as tx:
+            tx.execute('INSERT INTO scheduled_jobs (name, next_run) VALUES (?, ?) '
+                       'ON CONFLICT (name) DO UPDATE SET next_run = excluded.next_run', (name, next_run))
+
+    # Состояние многошаговых диалогов (src.utils.state_store): JSON и срок жизни - время Unix
+
+    def get_conversation(self, user_id, now):
+        """(data, expires_at) или None, если состояния нет или оно устарело"""
+
+        with self.transaction() as tx:
+            row = tx.execute('SELECT data, expires_at FROM conversation_state WHERE user_id = ? AND expires_at >= ?',
+                             (user_id, now)).fetchone()
+        return tuple(row) if row else None
+
+    def conversations(self, now, limit):
+        """Неистёкшие состояния (user_id, data, expires_at), не больше limit самых свежих"""
+
+        with self.transaction() as tx:
+            return [tuple(row) for row in tx.execute(
+                'SELECT user_id, data, expires_at FROM conversation_state WHERE expires_at >= ? '
+                'ORDER BY expires_at DESC LIMIT ?', (now, limit)).fetchall()]
+
+    def put_conversation(self, user_id, data, expires_at):
+        with self.transaction() as tx:
+            tx.execute('INSERT INTO conversation_state (user_id, data, expires_at) VALUES (?, ?, ?) '
+                       'ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at',
+                       (user_id, data, expires_at))
+
+    def delete_conversations(self, user_ids):
+        with self.transaction() as tx:
+            for user_id in user_ids:
+                tx.execute('DELETE FROM conversation_state WHERE user_id = ?', (user_id,))
+
+    def purge_conversations(self, now):
+        """Удаляет устаревшие состояния. Возвращает их количество."""
+
+        with self.transaction() as tx:
+            return tx.execute('DELETE FROM conversation_state WHERE expires_at < ?', (now,)).rowcount
+
+    # Статистика
+
+    def increment_user_stat(self, user_id):
+        with self.transaction(stats=True) as tx:
+            tx.execute('INSERT INTO user_statistics (user_id, today, month, all_time) VALUES (?, 1, 1, 1) '
+                       'ON CONFLICT (user_id) DO UPDATE SET today = user_statistics.today + 1, '
+                       'month = user_statistics.month + 1, all_time = user_statistics.all_time + 1',
+                       (user_id,))
+
+    def increment_func_stat(self, name):
+        with self.transaction(stats=True) as tx:
+            tx.execute('INSERT INTO function_statistics (name, today, month, all_time) VALUES (?, 1, 1, 1) '
+                       'ON CONFLICT (name) DO UPDATE SET today = function_statistics.today + 1, '
+                       'month = function_statistics.month + 1, all_time = function_statistics.all_time + 1',
+                       (name,))
+
+    def top_func_stat(self, period, limit=3):
+        period = self._checked(period, STAT_PERIODS)
+        with self.transaction(stats=True) as tx:
+            return [tuple(row) for row in tx.execute(
+                f'SELECT name, {period} FROM function_statistics WHERE {period} > 0 ORDER BY {period} DESC LIMIT ?',
+                (limit,)).fetchall()]
+
+    def reset_func_stat(self, period):
+        period = self._checked(period, STAT_PERIODS)
+        with self.transaction(stats=True) as tx:
+            tx.execute(f'UPDATE function_statistics SET {period} = 0')
+
+    # Выгрузка таблиц
+
+    def export_rows(self, table, batch_size=1000):
+        """Генератор строк таблицы table для выгрузки: сначала заголовок, затем строки. Строки читаются порциями по
+        batch_size, поэтому память не зависит от размера таблицы."""
+
+        raise NotImplementedError
+
+    def _export_columns(self, table):
+        """Колонки выгружаемой таблицы и признак того, что она в хранилище статистики"""
+
+        return EXPORT_TABLES[self._checked(table, EXPORT_TABLES)]
+
+    @staticmethod
+    def _checked(column, allowed):
+        """Имя колонки подставляется в запрос, поэтому допускаются только известные имена"""
+
+        if column not in allowed:
+            raise ValueError(f'Неизвестная колонка {column!r}')
+        return column
+
+
+class SqliteStorage(Storage):
+    """Хранилище в SQLite: основная база и отдельная база статистики (default_stats_db_path), чтобы счётчики,
+    которые увеличиваются на каждое нажатие кнопки, не ждали блокировку записи вместе с регистрацией и
+    изменением настроек. Соединение открывается на каждую транзакцию."""
+
+    errors = (sqlite3.Error,)
+    integrity_errors = (sqlite3.IntegrityError,)
+    settings_by_trigger = True
+
+    tables = {
+        'users': ['"user_id" INTEGER NOT NULL UNIQUE',
+                  '"user_first_name" TEXT',
+                  '"user_last_name" TEXT',
+                  '"username" TEXT',
+                  '"date_registration" TEXT'],
+        'setting_users': ['"user_id" INTEGER REFERENCES users(user_id) ON UPDATE CASCADE',
+                          '"user_first_name" TEXT REFERENCES users(user_first_name) ON UPDATE CASCADE',
+                          '"user_last_name" TEXT REFERENCES users(user_last_name) ON UPDATE CASCADE',
+                          '"news" TEXT DEFAULT "False"',
+                          '"baraholka" TEXT DEFAULT "False"',
+                          '"rights" TEXT DEFAULT "user"',
+                          '"use_bot" TEXT DEFAULT "True"'],
+        'duty_schedule': ['"first_date" TEXT NOT NULL UNIQUE',
+                          '"last_date" TEXT NOT NULL UNIQUE',
+                          '"user_first_name" TEXT NOT NULL'],
+        'events': ['"date" TEXT NOT NULL',
+                   '"text_event" TEXT NOT NULL'],
+        'in_out': ['"last_checkpoint" TEXT', ],
+        'callback_data': ['"data" TEXT NOT NULL UNIQUE',
+                          '"payload" TEXT NOT NULL',
+                          '"expires_at" REAL NOT NULL'],
+        'scheduled_jobs': ['"name" TEXT NOT NULL UNIQUE',
+                           '"next_run" TEXT NOT NULL'],
+        'conversation_state': ['"user_id" INTEGER NOT NULL UNIQUE',
+                               '"data" TEXT NOT NULL',
+                               '"expires_at" REAL NOT NULL'],
+        'leases': ['"name" TEXT NOT NULL UNIQUE',
+                   '"owner" TEXT NOT NULL',
+                   '"expires_at" REAL NOT NULL'],
+    }
+    stats_tables = {
+        'user_statistics': ['"user_id" INTEGER PRIMARY KEY',
+                            '"today" INTEGER DEFAULT 0',
+                            '"month" INTEGER DEFAULT 0',
+                            '"all_time" INTEGER DEFAULT 0'],
+        'function_statistics': ['"name" TEXT PRIMARY KEY',
+                                '"today" INTEGER DEFAULT 0',
+                                '"month" INTEGER DEFAULT 0',
+                                '"all_time" INTEGER DEFAULT 0'],
+    }
+    _prepared = set()  # Базы, в которых уже созданы таблицы (и перенесена статистика из основной базы)
+    _prepare_lock = threading.Lock()
+    _searchable = set()  # Базы с полнотекстовым индексом users_fts
+
+    def __init__(self, db_path=None, stats_path=None):
+        self.db_path = db_path or default_db_path()
+        self.stats_path = stats_path or (stats_location(db_path) if db_path else default_stats_db_path())
+        self.location = self.db_path
+        with self._prepare_lock:
+            if self.db_path not in self._prepared:
+                self._prepare()
+                self._prepared.add(self.db_path)
+            if self.stats_path not in self._prepared:
+                self._prepare_stats()
+                self._prepared.add(self.stats_path)
+
+    @contextmanager
+    def transaction(self, stats=False, timeout=None):
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        with closing(connect(self.stats_path if stats else self.db_path, **kwargs)) as conn, conn:
+            if stats:
+                # В режиме WAL это не грозит повреждением базы, а при сбое питания теряются лишь последние счётчики
+                conn.execute('PRAGMA synchronous = NORMAL')
+            yield conn
+
+    def export_rows(self, table, batch_size=1000):
+        """Порции выбираются по rowid в отдельных коротких транзакциях: основная база работает без WAL, и одна
+        долгая транзакция чтения на всю выгрузку не давала бы боту записывать."""
+
+        columns, stats = self._export_columns(table)
+        yield columns
+        last_rowid = None
+        while True:
+            condition, params = ('', (batch_size,)) if last_rowid is None else \
+                ('WHERE rowid > ? ', (last_rowid, batch_size))
+            with self.transaction(stats=stats) as conn:
+                rows = conn.execute(f'SELECT rowid, {", ".join(columns)} FROM {table} {condition}'
+                                    f'ORDER BY rowid LIMIT ?', params).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            for row in rows:
+                yield row[1:]
+
+    def _prepare(self):
+        """Создаёт таблицы основной базы и триггер, добавляющий настройки нового пользователя"""
+
+        if not self.db_path.startswith('file:') and not os.path.exists(self.db_path):
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            logger.info("База данных создана: %s", self.db_path)
+        with closing(connect(self.db_path)) as conn, conn:
+            for name, columns in self.tables.items():
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {name} '
+                             f'(id INTEGER PRIMARY KEY AUTOINCREMENT, {", ".join(columns)})')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS after_user_insert_to_setting_users AFTER INSERT ON users '
+                         'BEGIN INSERT INTO setting_users (user_id, user_first_name, user_last_name) '
+                         'VALUES (NEW.user_id, NEW.user_first_name, NEW.user_last_name); END;')
+            # Настройки ищутся по user_id при каждом обращении к боту и при выводе списка пользователей
+            conn.execute('CREATE INDEX IF NOT EXISTS setting_users_user_id ON setting_users (user_id)')
+            if self._prepare_search(conn):
+                self._searchable.add(self.db_path)
+
+    @staticmethod
+    def _prepare_search(conn):
+        """Создаёт полнотекстовый индекс FTS5 users_fts по имени, фамилии и username пользователей и триггеры,
+        которые поддерживают его вместе с таблицей users. Индекс хранит только слова, а строки берёт из users.
+        Возвращает False, если SQLite собран без FTS5: тогда поиск идёт через LIKE без индекса."""
+
+        created = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'users_fts'").fetchone()
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(user_first_name, user_last_name, "
+                         "username, content='users', content_rowid='id', tokenize='unicode61 remove_diacritics 2', "
+                         "prefix='2 3')")
+        except sqlite3.OperationalError as error:
+            logger.warning("Поиск пользователей без полнотекстового индекса: %s", error)
+            return False
+        conn.execute('CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN '
+                     'INSERT INTO users_fts (rowid, user_first_name, user_last_name, username) '
+                     'VALUES (NEW.id, NEW.user_first_name, NEW.user_last_name, NEW.username); END;')
+        conn.execute("CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+                     "INSERT INTO users_fts (users_fts, rowid, user_first_name, user_last_name, username) "
+                     "VALUES ('delete', OLD.id, OLD.user_first_name, OLD.user_last_name, OLD.username); END;")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE ON users BEGIN "
+                     "INSERT INTO users_fts (users_fts, rowid, user_first_name, user_last_name, username) "
+                     "VALUES ('delete', OLD.id, OLD.user_first_name, OLD.user_last_name, OLD.username); "
+                     "INSERT INTO users_fts (rowid, user_first_name, user_last_name, username) "
+                     "VALUES (NEW.id, NEW.user_first_name, NEW.user_last_name, NEW.username); END;")
+        if not created:
+            # Индекс появился в базе, где пользователи уже есть
+            conn.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+        return True
+
+    def _search_names(self, words, limit):
+        """Поиск по индексу users_fts: каждое слово - префиксный запрос "слово"*. Совпадения перебираются в порядке
+        rowid без сортировки по релевантности, поэтому запрос останавливается на limit найденных строках."""
+
+        if self.db_path not in self._searchable:
+            return super()._search_names(words, limit)
+        match = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+        with self.transaction() as tx:
+            return [tuple(row) for row in tx.execute(
+                'SELECT u.user_id, u.user_first_name, u.user_last_name, u.username, s.rights FROM users_fts f '
+                'JOIN users u ON u.id = f.rowid LEFT JOIN setting_users s ON s.user_id = u.user_id '
+                'WHERE users_fts MATCH ? LIMIT ?', (match, limit)).fetchall()]
+
+    def _prepare_stats(self):
+        """Создаёт таблицы статистики и переносит в них данные из основной базы"""
+
+        with closing(connect(self.stats_path, uri=True)) as conn:
+            # WAL: чтение топа функций не ждёт записи счётчиков. Для базы в памяти режим остаётся memory
+            conn.execute('PRAGMA journal_mode = WAL')
+            with conn:
+                for name, columns in self.stats_tables.items():
+                    conn.execute(f'CREATE TABLE IF NOT EXISTS {name} ({", ".join(columns)})')
+            if self.db_path != self.stats_path:
+                self._migrate_stats(conn)
+
+    def _migrate_stats(self, conn):
+        """Переносит user_statistics и function_statistics из основной базы и удаляет их там вместе с триггером.
+        Перенос повторяется, пока таблицы не удалены, а уже перенесённые строки пропускаются."""
+
+        conn.execute('ATTACH DATABASE ? AS old', (self.db_path,))
+        try:
+            with conn:
+                existing = {row[0] for row in conn.execute(
+                    "SELECT name FROM old.sqlite_master WHERE type = 'table' AND name IN (?, ?)",
+                    ('user_statistics', 'function_statistics'))}
+                if not existing:
+                    return
+                if 'user_statistics' in existing:
+                    conn.execute('INSERT OR IGNORE INTO main.user_statistics (user_id, today, month, all_time) '
+                                 'SELECT user_id, MAX(today), MAX(month), MAX(all_time) FROM old.user_statistics '
+                                 'WHERE user_id IS NOT NULL GROUP BY user_id')
+                if 'function_statistics' in existing:
+                    conn.execute('INSERT OR IGNORE INTO main.function_statistics (name, today, month, all_time) '
+                                 'SELECT name, today, month, all_time FROM old.function_statistics')
+                conn.execute('DROP TRIGGER IF EXISTS old.after_user_insert_to_user_statistics')
+                for name in existing:
+                    conn.execute(f'DROP TABLE old.{name}')
+            logger.warning("Статистика перенесена из %s в %s", self.db_path, self.stats_path)
+        finally:
+            conn.execute('DETACH DATABASE old')
+
+
+# Строки в кавычках, идентификаторы в двойных кавычках и комментарии, внутри которых '?' не параметр
+_SQL_TOKENS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|[?%]", re.DOTALL)
+
+
+@functools.lru_cache(maxsize=512)
+def _to_pyformat(query):
+    """Переводит запрос из стиля '?' (sqlite3) в стиль '%s' (psycopg2). Знаки '?' внутри строк, идентификаторов и
+    комментариев не трогаются, а каждый '%' удваивается: psycopg2 подставляет параметры через %-форматирование
+    всего текста запроса, включая строки."""
+
+    def replace(match):
+        token = match.group()
+        if token == '?':
+            return '%s'
+        return token.replace('%', '%%')
+
+    return _SQL_TOKENS.sub(replace, query)
+
+
+class _PostgresTransaction:
+    """Курсор psycopg2 с параметрами в стиле '?', как у sqlite3"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=()):
+        # Параметры передаются всегда (хотя бы пустые), иначе psycopg2 не раскрывает удвоенные '%'
+        self.cursor.execute(_to_pyformat(query), params or ())
+        return self.cursor
+
+
+class PostgresStorage(Storage):
+    """Хранилище в PostgreSQL с пулом соединений, общее для нескольких процессов бота. Требует psycopg2.
+
+    Пул psycopg2 при нехватке соединений выбрасывает исключение, поэтому число одновременных транзакций
+    ограничено семафором по max_connections: лишние потоки ждут свободное соединение."""
+
+    shared = True
+
+    schema = [
+        'CREATE TABLE IF NOT EXISTS users (id SERIAL PRIMARY KEY, user_id BIGINT NOT NULL UNIQUE, '
+        'user_first_name TEXT, user_last_name TEXT, username TEXT, date_registration TEXT)',
+        "CREATE TABLE IF NOT EXISTS setting_users (id SERIAL PRIMARY KEY, "
+        "user_id BIGINT UNIQUE REFERENCES users(user_id) ON DELETE CASCADE, user_first_name TEXT, "
+        "user_last_name TEXT, news TEXT DEFAULT 'False', baraholka TEXT DEFAULT 'False', rights TEXT DEFAULT 'user', "
+        "use_bot TEXT DEFAULT 'True')",
+        'CREATE TABLE IF NOT EXISTS duty_schedule (id SERIAL PRIMARY KEY, first_date TEXT NOT NULL UNIQUE, '
+        'last_date TEXT NOT NULL UNIQUE, user_first_name TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS events (id SERIAL PRIMARY KEY, date TEXT NOT NULL, text_event TEXT NOT NULL)',
+        # Поиск пользователей по началу имени, фамилии и username (Storage._search_names)
+        'CREATE INDEX IF NOT EXISTS users_first_name_search ON users (lower(user_first_name) text_pattern_ops)',
+        'CREATE INDEX IF NOT EXISTS users_last_name_search ON users (lower(user_last_name) text_pattern_ops)',
+        'CREATE INDEX IF NOT EXISTS users_username_search ON users (lower(username) text_pattern_ops)',
+        'CREATE TABLE IF NOT EXISTS in_out (id SERIAL PRIMARY KEY, last_checkpoint TEXT)',
+        'CREATE TABLE IF NOT EXISTS callback_data (data TEXT PRIMARY KEY, payload TEXT NOT NULL, '
+        'expires_at DOUBLE PRECISION NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS scheduled_jobs (name TEXT PRIMARY KEY, next_run TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS conversation_state (user_id BIGINT PRIMARY KEY, data TEXT NOT NULL, '
+        'expires_at DOUBLE PRECISION NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, '
+        'expires_at DOUBLE PRECISION NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS user_statistics (user_id BIGINT PRIMARY KEY, today INTEGER DEFAULT 0, '
+        'month INTEGER DEFAULT 0, all_time INTEGER DEFAULT 0)',
+        'CREATE TABLE IF NOT EXISTS function_statistics (name TEXT PRIMARY KEY, today INTEGER DEFAULT 0, '
+        'month INTEGER DEFAULT 0, all_time INTEGER DEFAULT 0)',
+    ]
+
+    def __init__(self, url, min_connections=1, max_connections=10):
+        if psycopg2 is None:
+            raise RuntimeError('Для DATABASE_URL=postgresql://... установите psycopg2 (pip install psycopg2-binary)')
+        self.errors = (psycopg2.Error, psycopg2.pool.PoolError)
+        self.location = url
+        self.integrity_errors = (psycopg2.IntegrityError,)
+        self._pool = psycopg2.pool.ThreadedConnectionPool(min_connections, max_connections, url)
+        self._slots = threading.BoundedSemaphore(max_connections)
+        with self.transaction() as tx:
+            # Несколько процессов могут запуститься одновременно: схему создаёт один из них
+            tx.execute("SELECT pg_advisory_xact_lock(hashtext('telegram_bot_schema'))")
+            for query in self.schema:
+                tx.execute(query)
+        logger.info("Подключено хранилище PostgreSQL, пул до %s соединений", max_connections)
+
+    @contextmanager
+    def transaction(self, stats=False, timeout=None):
+        with self._slots:
+            conn = self._pool.getconn()
+            try:
+                with conn, conn.cursor() as cursor:
+                    if timeout is not None:
+                        cursor.execute('SET LOCAL statement_timeout = %s', (int(timeout * 1000),))
+                    yield _PostgresTransaction(cursor)
+            finally:
+                self._pool.putconn(conn, close=bool(conn.closed))
+
+    def export_rows(self, table, batch_size=1000):
+        """Строки читаются именованным (серверным) курсором: PostgreSQL передаёт их порциями по batch_size."""
+
+        columns, _ = self._export_columns(table)
+        yield columns
+        with self._slots:
+            conn = self._pool.getconn()
+            try:
+                with conn, conn.cursor(name=f'export_{table}') as cursor:
+                    cursor.itersize = batch_size
+                    cursor.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY 1')
+                    yield from cursor
+            finally:
+                self._pool.putconn(conn, close=bool(conn.closed))
+
+    def close(self):
+        self._pool.closeall()
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+
+from src.utils.maintenance import DatabaseMaintenance
+
+
+class OptimizeTest(unittest.TestCase):
+    """optimize() обновляет sqlite_stat1 при каждом запуске, а не только после первого ANALYZE"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'bot.db')
+        with closing(sqlite3.connect(self.database)) as conn, conn:
+            conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, access_level TEXT)')
+            conn.execute('CREATE INDEX users_access_level ON users (access_level)')
+        self.maintenance = DatabaseMaintenance({'bot': self.database}, directory=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def insert_users(self, first, count):
+        with closing(sqlite3.connect(self.database)) as conn, conn:
+            conn.executemany('INSERT INTO users (id, access_level) VALUES (?, ?)',
+                             ((user_id, 'admin' if user_id % 50 == 0 else 'user')
+                              for user_id in range(first, first + count)))
+
+    def stat1(self):
+        with closing(sqlite3.connect(self.database)) as conn:
+            return dict(conn.execute("SELECT idx, stat FROM sqlite_stat1 WHERE tbl = 'users'").fetchall())
+
+    def test_statistics_follow_data(self):
+        self.insert_users(0, 10)
+        self.maintenance.optimize()
+        before = self.stat1()
+        self.assertIn('users_access_level', before)
+
+        # Рост меньше чем в 10 раз: PRAGMA optimize на новом соединении пересчёт бы пропустил
+        self.insert_users(10, 40)
+        self.maintenance.optimize()
+        after = self.stat1()
+
+        self.assertNotEqual(before['users_access_level'], after['users_access_level'])
+        self.assertEqual(after['users_access_level'].split()[0], '50')
+
+
+if __name__ == '__main__':
+    unittest.main()
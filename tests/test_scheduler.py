@@ -0,0 +1,137 @@
+import datetime
+import os
+import tempfile
+import threading
+import time
+import unittest
+from zoneinfo import ZoneInfo
+
+from src.utils.scheduler import DailyTrigger, IntervalTrigger, JobScheduler, MonthlyTrigger, RandomDailyTrigger
+from src.utils.storage import SqliteStorage
+
+BERLIN = ZoneInfo('Europe/Berlin')
+
+
+class TriggerTest(unittest.TestCase):
+
+    def test_daily_today_and_tomorrow(self):
+        trigger = DailyTrigger('09:30', tz=BERLIN)
+        self.assertEqual(trigger.next_run(datetime.datetime(2026, 3, 10, 8, 0, tzinfo=BERLIN)),
+                         datetime.datetime(2026, 3, 10, 9, 30, tzinfo=BERLIN))
+        self.assertEqual(trigger.next_run(datetime.datetime(2026, 3, 10, 9, 30, tzinfo=BERLIN)),
+                         datetime.datetime(2026, 3, 11, 9, 30, tzinfo=BERLIN))
+
+    def test_daily_keeps_local_time_across_dst(self):
+        # 29 марта 2026 года в Германии переход на летнее время: смещение меняется с +01:00 на +02:00
+        trigger = DailyTrigger('09:00', tz=BERLIN)
+        run_at = trigger.next_run(datetime.datetime(2026, 3, 28, 10, 0, tzinfo=BERLIN))
+        self.assertEqual((run_at.date(), run_at.hour, run_at.minute), (datetime.date(2026, 3, 29), 9, 0))
+        self.assertEqual(run_at.utcoffset(), datetime.timedelta(hours=2))
+
+    def test_daily_converts_other_zones(self):
+        trigger = DailyTrigger('09:00', tz=BERLIN)
+        after = datetime.datetime(2026, 6, 1, 6, 0, tzinfo=datetime.timezone.utc)  # 08:00 в Берлине
+        self.assertEqual(trigger.next_run(after), datetime.datetime(2026, 6, 1, 9, 0, tzinfo=BERLIN))
+
+    def test_random_daily_within_hours(self):
+        trigger = RandomDailyTrigger(14, 17, tz=BERLIN)
+        after = datetime.datetime(2026, 6, 1, 18, 0, tzinfo=BERLIN)
+        for _ in range(50):
+            run_at = trigger.next_run(after)
+            self.assertEqual(run_at.date(), datetime.date(2026, 6, 2))
+            self.assertTrue(14 <= run_at.hour <= 17)
+
+    def test_random_daily_later_today(self):
+        trigger = RandomDailyTrigger(6, tz=BERLIN)
+        after = datetime.datetime(2026, 6, 1, 6, 30, tzinfo=BERLIN)
+        for _ in range(50):
+            run_at = trigger.next_run(after)
+            self.assertGreater(run_at, after)
+            self.assertEqual(run_at.hour, 6)
+
+    def test_monthly_year_rollover(self):
+        trigger = MonthlyTrigger(day=1, at='00:01', tz=BERLIN)
+        self.assertEqual(trigger.next_run(datetime.datetime(2026, 12, 15, tzinfo=BERLIN)),
+                         datetime.datetime(2027, 1, 1, 0, 1, tzinfo=BERLIN))
+
+    def test_monthly_rejects_missing_days(self):
+        with self.assertRaises(ValueError):
+            MonthlyTrigger(day=31)
+
+    def test_interval(self):
+        after = datetime.datetime(2026, 6, 1, tzinfo=BERLIN)
+        self.assertEqual(IntervalTrigger(90).next_run(after), after + datetime.timedelta(seconds=90))
+
+
+class CatchUpTest(unittest.TestCase):
+    """Первый запуск задания после старта по сохранённому расписанию"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        storage = SqliteStorage(os.path.join(self.directory.name, 'bot.db'))
+        self.scheduler = JobScheduler(storage=lambda: storage)
+        self.now = datetime.datetime(2026, 6, 1, 15, 0, tzinfo=BERLIN)
+        self.trigger = DailyTrigger('06:00', tz=BERLIN)
+        self.tomorrow = datetime.datetime(2026, 6, 2, 6, 0, tzinfo=BERLIN)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def first_run(self, stored, **options):
+        job = self.scheduler.add_job('notify', lambda: None, self.trigger, **options)
+        return self.scheduler._first_run(job, {'notify': stored}, self.now)
+
+    def test_missed_run_is_caught_up(self):
+        self.assertEqual(self.first_run(datetime.datetime(2026, 6, 1, 6, 0, tzinfo=BERLIN)), self.now)
+
+    def test_missed_run_is_skipped_without_catch_up(self):
+        self.assertEqual(self.first_run(datetime.datetime(2026, 6, 1, 6, 0, tzinfo=BERLIN), catch_up=False),
+                         self.tomorrow)
+
+    def test_future_run_is_kept(self):
+        stored = datetime.datetime(2026, 6, 1, 16, 0, tzinfo=BERLIN)
+        self.assertEqual(self.first_run(stored), stored)
+
+    def test_not_persisted_job_ignores_stored_run(self):
+        self.assertEqual(self.first_run(datetime.datetime(2026, 6, 1, 6, 0, tzinfo=BERLIN), persist=False),
+                         self.tomorrow)
+
+    def test_next_run_survives_restart(self):
+        job = self.scheduler.add_job('notify', lambda: None, self.trigger)
+        self.scheduler._push(job, self.tomorrow)
+        restarted = JobScheduler(storage=self.scheduler.storage)
+        self.assertEqual(restarted._load_next_runs(), {'notify': self.tomorrow})
+
+
+class TimeoutTest(unittest.TestCase):
+    """Зависшее задание не прерывается, но его новые запуски пропускаются до завершения"""
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('Условие не выполнилось за отведённое время')
+            time.sleep(0.01)
+
+    def test_hung_job_skips_runs_until_finished(self):
+        release = threading.Event()
+        scheduler = JobScheduler()
+        job = scheduler.add_job('slow', release.wait, IntervalTrigger(0.05), timeout=0.2, allow_overlap=True)
+        scheduler.start()
+        try:
+            self.wait_for(lambda: job.hung)
+            running = job.running
+            self.wait_for(lambda: job.skipped >= 3)
+            self.assertEqual(job.running, running)
+            self.assertEqual(job.timeouts, 1)
+
+            release.set()
+            self.wait_for(lambda: not job.hung)
+            self.wait_for(lambda: job.runs > running)
+        finally:
+            release.set()
+            scheduler.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
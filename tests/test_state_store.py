@@ -0,0 +1,60 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src.utils.state_store import ConversationStore
+from src.utils.storage import SqliteStorage
+
+
+class SharedStorage(SqliteStorage):
+    """SQLite в роли общего хранилища нескольких экземпляров бота; считает чтения состояния"""
+
+    shared = True
+    reads = 0
+
+    def get_conversation(self, user_id, now):
+        SharedStorage.reads += 1
+        return super().get_conversation(user_id, now)
+
+
+class ConversationStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'bot.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_state_survives_restart(self):
+        storage = SqliteStorage(self.path)
+        ConversationStore(storage=lambda: storage).update(1, first_date=datetime.date(2026, 6, 1))
+        restarted = ConversationStore(storage=lambda: storage)
+        self.assertTrue(restarted.active(1))
+        self.assertEqual(restarted.get(1), {'first_date': datetime.date(2026, 6, 1)})
+
+    def test_shared_state_is_visible_to_other_instances(self):
+        storage = SharedStorage(self.path)
+        first = ConversationStore(storage=lambda: storage)
+        second = ConversationStore(storage=lambda: storage)
+        first.update(1, rights_search='admin')
+        self.assertEqual(second.get(1), {'rights_search': 'admin'})
+        second.pop(1)
+        self.assertIsNone(first.get(1))
+
+    def test_shared_absence_is_cached(self):
+        storage = SharedStorage(self.path)
+        store = ConversationStore(storage=lambda: storage, absent_ttl=60)
+        SharedStorage.reads = 0
+        for _ in range(10):
+            self.assertFalse(store.active(1))
+        self.assertEqual(SharedStorage.reads, 1)
+
+        # Состояние, созданное этим экземпляром, сбрасывает кэш отсутствия
+        store.update(1, rights_search='user')
+        self.assertTrue(store.active(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
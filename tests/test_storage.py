@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.utils.storage import SqliteStorage, _to_pyformat, stats_location
+
+
+class ToPyformatTest(unittest.TestCase):
+    """Перевод параметров '?' в '%s' для psycopg2"""
+
+    def test_parameters(self):
+        self.assertEqual(_to_pyformat('SELECT * FROM users WHERE user_id = ? AND rights = ?'),
+                         'SELECT * FROM users WHERE user_id = %s AND rights = %s')
+
+    def test_adjacent_parameters(self):
+        self.assertEqual(_to_pyformat('VALUES (??)'), 'VALUES (%s%s)')
+
+    def test_question_mark_in_literals_and_comments(self):
+        self.assertEqual(_to_pyformat("SELECT 'что?', \"col?\" FROM t WHERE a = ? -- почему?\n/* ? */"),
+                         "SELECT 'что?', \"col?\" FROM t WHERE a = %s -- почему?\n/* ? */")
+
+    def test_escaped_quotes(self):
+        self.assertEqual(_to_pyformat("SELECT 'it''s ?', ? FROM t"), "SELECT 'it''s ?', %s FROM t")
+        self.assertEqual(_to_pyformat('SELECT "a""?" FROM t WHERE b = ?'), 'SELECT "a""?" FROM t WHERE b = %s')
+
+    def test_percent_is_doubled(self):
+        self.assertEqual(_to_pyformat("SELECT id % 2 FROM t WHERE name LIKE 'ab%' AND c = ?"),
+                         "SELECT id %% 2 FROM t WHERE name LIKE 'ab%%' AND c = %s")
+
+    def test_existing_pyformat_is_not_a_parameter(self):
+        self.assertEqual(_to_pyformat("SELECT '%s', ?"), "SELECT '%%s', %s")
+
+
+class StatsLocationTest(unittest.TestCase):
+    """База статистики создаётся рядом с основной базой"""
+
+    def test_path(self):
+        self.assertEqual(stats_location('/srv/bot/bot.db'), '/srv/bot/bot_stats.db')
+        self.assertEqual(stats_location('bot'), 'bot_stats.db')
+
+    def test_file_uri(self):
+        self.assertEqual(stats_location('file:/srv/bot/bot.db'), 'file:/srv/bot/bot_stats.db')
+        self.assertEqual(stats_location('file:///srv/bot/bot.db?mode=rw&cache=private'),
+                         'file:///srv/bot/bot_stats.db?cache=private')
+
+    def test_memory(self):
+        self.assertNotEqual(stats_location('file:/telegram_bot?vfs=memdb'), 'file:/telegram_bot?vfs=memdb')
+        self.assertIn('telegram_bot_stats', stats_location('file:/telegram_bot?vfs=memdb'))
+
+
+class StorageRoundTripTest(unittest.TestCase):
+    """Расписание заданий и состояние диалогов в SqliteStorage"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = SqliteStorage(os.path.join(self.directory.name, 'bot.db'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_job_runs(self):
+        self.assertEqual(self.storage.job_runs(), {})
+        self.storage.set_job_run('reset', '2026-01-01T00:01:00+03:00')
+        self.storage.set_job_run('backup', '2026-01-01T03:00:00+03:00')
+        self.storage.set_job_run('reset', '2026-01-02T00:01:00+03:00')
+        self.assertEqual(self.storage.job_runs(), {'reset': '2026-01-02T00:01:00+03:00',
+                                                   'backup': '2026-01-01T03:00:00+03:00'})
+
+    def test_conversations(self):
+        state = json.dumps({'calendar_mode': 'range'})
+        self.storage.put_conversation(1, state, 200.0)
+        self.storage.put_conversation(2, '{}', 50.0)
+        self.storage.put_conversation(1, state, 300.0)
+
+        self.assertEqual(self.storage.get_conversation(1, 100.0), (state, 300.0))
+        self.assertIsNone(self.storage.get_conversation(2, 100.0))
+        self.assertEqual(self.storage.conversations(100.0, 10), [(1, state, 300.0)])
+        self.assertEqual(self.storage.conversations(0.0, 1), [(1, state, 300.0)])
+
+        self.assertEqual(self.storage.purge_conversations(100.0), 1)
+        self.storage.delete_conversations([1])
+        self.assertIsNone(self.storage.get_conversation(1, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()